@@ -0,0 +1,91 @@
+import os
+import heapq
+from bisect import bisect_right
+from time import time
+from utils import FLAG_DELETED
+
+ANALYTICS_TOP_N = 100  # колко от най-големите файлове/папки се пазят готови
+DAY = 86400
+# Горни граници на възрастта (по mtime) и етикетите им; последната кофа е всичко по-старо
+AGE_BUCKETS = ((DAY, "до 1 ден"), (7 * DAY, "до 1 седмица"), (30 * DAY, "до 1 месец"), (365 * DAY, "до 1 година"), (None, "над 1 година"))
+_AGE_LIMITS = [limit for limit, _ in AGE_BUCKETS[:-1]]
+
+class DiskUsage:
+    """Анализ на заетото място над дървото на FileStore.
+
+    refresh() минава веднъж по колоните на FileTable (хистограми по разширение и по възраст,
+    най-големите файлове през heapq). Размерите на папките не се смятат наново - те са
+    агрегатите на TreeNode (file_count, total_size), същите, които показва дървото; тук се
+    пази само класацията на най-големите. Резултатът се пази, докато таблицата не се промени,
+    така че заявките след сканиране са от готови данни.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.stamp = None
+        self.by_ext = {}     # разширение -> [брой, байтове]
+        self.by_age = [[0, 0] for _ in AGE_BUCKETS]
+        self.top_file_ids = []
+        self.top_dir_nodes = []
+
+    def refresh(self, now=None):
+        # Връща True, ако е преизчислено; без промяна в таблицата е no-op
+        table = self.store.table
+        stamp = (table, table.version)
+        if stamp == self.stamp and self.store.root is not None: return False
+        now = time() if now is None else now
+        flags, sizes, mtimes, names = table.flags, table.sizes, table.mtimes, table.names
+        splitext = os.path.splitext
+
+        by_ext = {}
+        by_age = [[0, 0] for _ in AGE_BUCKETS]
+        live = []
+        for i in range(len(flags)):
+            if flags[i] & FLAG_DELETED: continue
+            size = sizes[i]
+            live.append(i)
+            ext = splitext(names[i])[1].lower()
+            stats = by_ext.get(ext)
+            if stats is None: stats = by_ext[ext] = [0, 0]
+            stats[0] += 1
+            stats[1] += size
+            stats = by_age[bisect_right(_AGE_LIMITS, now - mtimes[i])]
+            stats[0] += 1
+            stats[1] += size
+
+        self.by_ext, self.by_age = by_ext, by_age
+        self.top_file_ids = heapq.nlargest(ANALYTICS_TOP_N, live, key=sizes.__getitem__)
+        # Коренът винаги е най-голям - класацията е за папките под него
+        self.top_dir_nodes = heapq.nlargest(ANALYTICS_TOP_N, self._sub_dirs(self.store.root), key=lambda n: n.total_size)
+        self.stamp = stamp
+        return True
+
+    @staticmethod
+    def _sub_dirs(root):
+        # Всички папки под root (без него), итеративно
+        stack = list(root.children.values()) if root is not None else []
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(node.children.values())
+
+    def top_files(self, n=10):
+        # [(id, размер)] - най-големите файлове, по намаляващ размер
+        sizes = self.store.table.sizes
+        return [(i, sizes[i]) for i in self.top_file_ids[:n]]
+
+    def top_dirs(self, n=10):
+        # [(TreeNode, брой файлове, байтове)] - папките с най-голям рекурсивен размер
+        return [(node, node.file_count, node.total_size) for node in self.top_dir_nodes[:n]]
+
+    def dir_size(self, node):
+        return node.total_size
+
+    def extensions(self, n=None):
+        # [(разширение, брой, байтове)] по намаляващи байтове; "" е за файлове без разширение
+        rows = sorted(((ext, count, size) for ext, (count, size) in self.by_ext.items()), key=lambda r: r[2], reverse=True)
+        return rows if n is None else rows[:n]
+
+    def ages(self):
+        # [(етикет, брой, байтове)] в реда на AGE_BUCKETS
+        return [(label, count, size) for (_, label), (count, size) in zip(AGE_BUCKETS, self.by_age)]
@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from utils import FileStore, format_size
+
+# ==========================================
+# СРАВНЕНИЕ НА ПАМЕТТА: кортежи vs FileTable
+# ==========================================
+# Употреба: python benchmark_memory.py [брой файлове]
+NUM_FILES = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+FILES_PER_FOLDER = 50
+BASE_DIR = os.path.abspath("Benchmark_Root")
+
+def synthetic_files(n):
+    """Генерира (части на папката, име, размер, mtime, системен) без да пипа диска"""
+    now = time.time()
+    for i in range(n):
+        folder = i // FILES_PER_FOLDER
+        parts = (f"project_{folder // 100}", f"folder_{folder}")
+        yield parts, f"mock_file_{i}.txt", i * 37 % 5_000_000, now - i, i % 97 == 0
+
+def build_tuples(n):
+    """Старото представяне: 5-кортеж в TreeNode.files + 4-кортеж в matched_files"""
+    root = {"files": [], "children": {}}
+    matched_files = []
+    for parts, name, size, mtime, is_sys in synthetic_files(n):
+        node = root
+        for part in parts:
+            node = node["children"].setdefault(part, {"files": [], "children": {}})
+        full_path = os.path.join(BASE_DIR, *parts, name)
+        f_date = datetime.fromtimestamp(mtime)
+        node["files"].append((name, full_path, size, f_date, is_sys))
+        matched_files.append((full_path, size, f_date, is_sys))
+    return root, matched_files
+
+def build_table(n):
+    """Новото представяне: FileStore с колонна FileTable"""
+    store = FileStore()
+    store.reset(BASE_DIR)
+    for parts, name, size, mtime, is_sys in synthetic_files(n):
+        store.add(store.root.get_or_create(parts), (name, size, mtime, is_sys))
+    return store
+
+def measure(builder):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = builder(NUM_FILES)
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current, elapsed
+
+if __name__ == "__main__":
+    print(f"📏 Памет за {NUM_FILES} файла ({FILES_PER_FOLDER} на папка)")
+    tuples_mem, tuples_time = measure(build_tuples)
+    table_mem, table_time = measure(build_table)
+    print(f"  Кортежи (TreeNode.files + matched_files): {format_size(tuples_mem):>12} | {tuples_time:.2f} s | {tuples_mem / NUM_FILES:.0f} B/файл")
+    print(f"  FileTable (колони + id):                 {format_size(table_mem):>12} | {table_time:.2f} s | {table_mem / NUM_FILES:.0f} B/файл")
+    print(f"✅ Намаление: {tuples_mem / table_mem:.1f}x")
@@ -0,0 +1,186 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+from utils import SCAN_MAX_WORKERS, FileStore, natural_sort_key, flatten_tree, format_size
+from sort_cache import SortCache
+from generate_test_data import generate
+from operations import scan_directory, batch_copy, batch_cut, batch_delete, generate_export_report
+
+# ==========================================
+# БЕНЧМАРКОВЕ: сканиране, сортиране, изграждане на дървото, масови операции, експорт
+# ==========================================
+# Употреба:
+#   python benchmark_suite.py                                      # 1k и 10k файла
+#   python benchmark_suite.py --sizes 1000,10000,100000 --output bench.json
+#   python benchmark_suite.py --baseline bench_baseline.json       # сравнение, exit 1 при регресия
+#   python benchmark_suite.py --save-baseline bench_baseline.json  # записва текущите резултати като база
+# Всеки бенчмарк се пуска --repeat пъти за времената и още веднъж под tracemalloc за пиковата памет.
+
+DEFAULT_SIZES = (1_000, 10_000)
+DEFAULT_REPEAT = 5
+DEFAULT_OP_FILES = 2_000   # файлове за масовите операции - те пипат диска и са бавни
+DEFAULT_THRESHOLD = 0.25   # регресия = медианата е с над 25% по-бавна от базата
+SEED = 2024
+
+def percentile(samples, q):
+    """Линейна интерполация между подредените стойности, q в [0, 100]"""
+    ordered = sorted(samples)
+    if len(ordered) == 1: return ordered[0]
+    pos = (len(ordered) - 1) * q / 100
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+def measure(name, size, items, fn, setup=None, repeat=DEFAULT_REPEAT, memory=True):
+    """Пуска fn(state) repeat пъти (setup() не се мери) и връща резултата като dict за JSON"""
+    samples = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        fn(state)
+        samples.append(time.perf_counter() - start)
+    peak = None
+    if memory:
+        state = setup() if setup else None
+        tracemalloc.start()
+        fn(state)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    median = percentile(samples, 50)
+    return {
+        "name": name, "size": size, "items": items, "repeat": repeat,
+        "median_s": median, "p90_s": percentile(samples, 90), "p99_s": percentile(samples, 99),
+        "min_s": min(samples), "max_s": max(samples),
+        "throughput": items / median if median else None,
+        "peak_bytes": peak,
+    }
+
+def bench_tree(workdir, size, repeat, op_files, memory):
+    """Всички бенчмаркове за едно генерирано дърво с около size файла"""
+    root = os.path.join(workdir, f"tree_{size}")
+    # ~20 файла на папка, размери по log-нормално разпределение до 64 KB (sparse на диска).
+    # Главна папка с 4 нива дава средно ~1700 файла, така че с една на 1000 файла max_files се достига винаги.
+    generated = generate(root, seed=SEED, roots=size // 1000 + 1, depth=4, fanout=(2, 6), files=(10, 30), max_files=size,
+                         sizes="lognormal", max_size=64 * 1024)
+    if generated.files < size: print(f"⚠️ Генерирани са само {generated.files} от {size} файла", flush=True)
+    start_date, end_date = datetime.now() - timedelta(days=10 * 365), datetime.now() + timedelta(days=1)
+    results = []
+
+    scan = lambda workers: scan_directory(root, start_date, end_date, [], max_workers=workers)
+    # Дървото за останалите бенчмаркове - в FileStore, както в приложението; и броят на реално сканираните файлове
+    tree_root, table, _, _ = scan(SCAN_MAX_WORKERS)
+    results.append(measure("scan", size, len(table), lambda _: scan(1), repeat=repeat, memory=memory))
+    results.append(measure("scan_parallel", size, len(table), lambda _: scan(SCAN_MAX_WORKERS), repeat=repeat, memory=memory))
+
+    store = FileStore()
+    store.root, store.table = tree_root, table
+    names = [table.names[i] for i in table.ids()]
+    results.append(measure("natural_sort", size, len(names), lambda _: sorted(names, key=natural_sort_key), repeat=repeat, memory=memory))
+
+    expanded = set()
+    stack = [tree_root]
+    while stack:
+        node = stack.pop()
+        expanded.add(node.path)
+        stack.extend(node.children.values())
+
+    def build_tree(_):
+        # Всички папки разгънати, студен кеш - естествените ключове и подредбите се смятат наново
+        cache = SortCache(store)
+        return flatten_tree(tree_root, expanded, lambda n: cache.dir_order(n), lambda n, ids: cache.file_order(n, "name", False, ids))
+    rows = len(build_tree(None))
+    results.append(measure("tree_build", size, rows, build_tree, repeat=repeat, memory=memory))
+
+    report_path = os.path.join(workdir, f"report_{size}.csv")
+    results.append(measure("export_csv", size, len(table), lambda _: generate_export_report(report_path, store, None, root),
+                           repeat=repeat, memory=memory))
+
+    # Масовите операции - върху подмножество, всяко повторение с нови копия
+    op_paths = [table.path(i) for i in list(table.ids())[:op_files]]
+    counter = [0]
+    def fresh_dir(prefix):
+        counter[0] += 1
+        return os.path.join(workdir, f"{prefix}_{size}_{counter[0]}")
+    def copied():
+        dest = fresh_dir("src")
+        batch_copy(op_paths, dest, root)
+        return dest, [os.path.join(dest, os.path.relpath(p, root)) for p in op_paths]
+
+    results.append(measure("batch_copy", size, len(op_paths), lambda dest: batch_copy(op_paths, dest, root),
+                           setup=lambda: fresh_dir("copy"), repeat=repeat, memory=memory))
+    results.append(measure("batch_cut", size, len(op_paths), lambda s: batch_cut(s[1], fresh_dir("cut"), s[0]),
+                           setup=copied, repeat=repeat, memory=memory))
+    results.append(measure("batch_delete", size, len(op_paths), lambda s: batch_delete(s[1]),
+                           setup=copied, repeat=repeat, memory=memory))
+    return results
+
+def compare(results, baseline, threshold):
+    """Връща [(ключ, база, сега, отношение)] за бенчмарковете с регресия над threshold"""
+    base = {(r["name"], r["size"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for r in results:
+        old = base.get((r["name"], r["size"]))
+        if not old or not old["median_s"]: continue
+        ratio = r["median_s"] / old["median_s"]
+        if ratio > 1 + threshold:
+            regressions.append((f"{r['name']}@{r['size']}", old["median_s"], r["median_s"], ratio))
+    return regressions
+
+def print_results(results):
+    print(f"{'бенчмарк':<16}{'файлове':>9}{'медиана':>11}{'p90':>11}{'p99':>11}{'бр./s':>12}{'пик памет':>13}")
+    for r in results:
+        peak = format_size(r["peak_bytes"]) if r["peak_bytes"] is not None else "-"
+        print(f"{r['name']:<16}{r['size']:>9}{r['median_s'] * 1000:>9.1f}ms{r['p90_s'] * 1000:>9.1f}ms"
+              f"{r['p99_s'] * 1000:>9.1f}ms{r['throughput'] or 0:>12.0f}{peak:>13}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмаркове за сканиране, сортиране, дървото, масовите операции и експорта")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="брой файлове в дърветата, напр. 1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--op-files", type=int, default=DEFAULT_OP_FILES, help="файлове за копиране/преместване/триене")
+    parser.add_argument("--no-memory", action="store_true", help="без пусканията под tracemalloc")
+    parser.add_argument("--workdir", default=None, help="папка за дърветата (по подразбиране временна, трие се накрая)")
+    parser.add_argument("--output", default=None, help="JSON с резултатите")
+    parser.add_argument("--baseline", default=None, help="JSON от предишно пускане - регресиите дават exit код 1")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--save-baseline", default=None, help="записва резултатите и като база")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="smart_manager_bench_")
+    results = []
+    try:
+        for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+            print(f"📏 Дърво с {size} файла...", flush=True)
+            results.extend(bench_tree(workdir, size, args.repeat, args.op_files, not args.no_memory))
+    finally:
+        if args.workdir is None: shutil.rmtree(workdir, ignore_errors=True)
+
+    print_results(results)
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+        "results": results,
+    }
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 Записано в {path}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for key, old, new, ratio in regressions:
+            print(f"❌ Регресия {key}: {old * 1000:.1f}ms -> {new * 1000:.1f}ms ({ratio:.2f}x)")
+        if regressions: return 1
+        print("✅ Няма регресии спрямо базата.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
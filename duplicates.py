@@ -0,0 +1,174 @@
+import os
+import mmap
+import sqlite3
+import hashlib
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from time import perf_counter
+from utils import CACHE_DIR, PROGRESS_INTERVAL
+
+HASH_CACHE_PATH = os.path.join(CACHE_DIR, "hash_cache.db")
+DUP_BLOCK_SIZE = 64 * 1024  # първият и последният блок за частичния хеш
+DUP_HASH_CHUNK = 8 * 1024 * 1024  # порция от mmap при пълния хеш - между порциите се проверява за отказ
+DUP_MAX_WORKERS = min(8, os.cpu_count() or 1)
+
+# Група еднакви файлове: общ размер, пълен хеш и ключовете, подадени от извикващия (напр. id-та от FileTable)
+DuplicateGroup = namedtuple("DuplicateGroup", "size digest keys")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    partial BLOB,
+    full BLOB
+);
+"""
+
+class HashCache:
+    """Кеш на хешовете по (път, размер, mtime) - файл с друг размер или mtime се хешира наново.
+
+    С db_path кешът е персистентен (SQLite до индекса на сканирането), без него - само в паметта.
+    Четенето е на порции само за нужните пътища (prefetch), а записът е накуп в save().
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path
+        self.entries = {}  # път -> [размер, mtime, частичен, пълен]
+        self.dirty = set()
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def prefetch(self, paths):
+        if self.db_path is None: return
+        paths = [p for p in paths if p not in self.entries]
+        if not paths: return
+        conn = self._connect()
+        try:
+            for i in range(0, len(paths), 500):
+                chunk = paths[i:i + 500]
+                rows = conn.execute(f"SELECT path, size, mtime, partial, full FROM hashes WHERE path IN ({','.join('?' * len(chunk))})", chunk)
+                for path, size, mtime, partial, full in rows:
+                    self.entries[path] = [size, mtime, partial, full]
+        finally:
+            conn.close()
+
+    def get(self, path, size, mtime, kind):
+        entry = self.entries.get(path)
+        if entry is None or entry[0] != size or entry[1] != mtime: return None
+        return entry[2] if kind == "partial" else entry[3]
+
+    def put(self, path, size, mtime, kind, digest):
+        entry = self.entries.get(path)
+        if entry is None or entry[0] != size or entry[1] != mtime:
+            entry = self.entries[path] = [size, mtime, None, None]
+        entry[2 if kind == "partial" else 3] = digest
+        self.dirty.add(path)
+
+    def save(self):
+        if self.db_path is None or not self.dirty: return
+        conn = self._connect()
+        try:
+            conn.executemany("INSERT OR REPLACE INTO hashes (path, size, mtime, partial, full) VALUES (?, ?, ?, ?, ?)",
+                             [(path, *self.entries[path]) for path in self.dirty])
+            conn.commit()
+            self.dirty.clear()
+        finally:
+            conn.close()
+
+def partial_hash(path, size, cancel=None):
+    # Първият и последният блок - различните файлове с еднакъв размер почти винаги се различават тук.
+    # Връща None при отказ (задачите в опашката на пула приключват веднага).
+    if cancel is not None and cancel.is_set(): return None
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        h.update(f.read(DUP_BLOCK_SIZE))
+        if size > DUP_BLOCK_SIZE:
+            f.seek(max(DUP_BLOCK_SIZE, size - DUP_BLOCK_SIZE))
+            h.update(f.read(DUP_BLOCK_SIZE))
+    return h.digest()
+
+def full_hash(path, size, cancel=None):
+    # Четене през mmap - без копиране в буфер на Python; hashlib пуска GIL за големите порции,
+    # така че няколко нишки хешират наистина паралелно. Връща None при отказ.
+    h = hashlib.blake2b()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size != size:
+            raise OSError(f"Файлът {path} е променен по време на проверката")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                for start in range(0, size, DUP_HASH_CHUNK):
+                    if cancel is not None and cancel.is_set(): return None
+                    h.update(view[start:start + DUP_HASH_CHUNK])
+            finally:
+                view.release()
+    return h.digest()
+
+def _regroup(groups, kind, cache, pool, on_progress, cancel):
+    # Хешира всички членове на групите в пула и ги разделя по хеш; остават само групи с 2+ файла
+    jobs = {}
+    result = {}
+    done, total, last_report = 0, sum(len(g) for g in groups), perf_counter()
+    for gi, group in enumerate(groups):
+        for key, path, size, mtime in group:
+            digest = cache.get(path, size, mtime, kind)
+            if digest is not None:
+                result.setdefault((gi, digest), []).append((key, path, size, mtime))
+                done += 1
+                continue
+            fn = partial_hash if kind == "partial" else full_hash
+            jobs[pool.submit(fn, path, size, cancel)] = (gi, key, path, size, mtime)
+
+    for future in as_completed(jobs):
+        # И при двата етапа отказът спира събирането веднага - find_duplicates връща None
+        if cancel is not None and cancel.is_set(): break
+        gi, key, path, size, mtime = jobs[future]
+        done += 1
+        try:
+            digest = future.result()
+        except OSError as e:
+            logging.error(f"Пропуснат файл при търсене на дубликати {path}: {e}")
+            continue
+        if digest is None: continue  # отказано
+        cache.put(path, size, mtime, kind, digest)
+        result.setdefault((gi, digest), []).append((key, path, size, mtime))
+        if on_progress and perf_counter() - last_report >= PROGRESS_INTERVAL:
+            on_progress(f"{'частичен' if kind == 'partial' else 'пълен'} хеш {done}/{total}")
+            last_report = perf_counter()
+
+    return [(digest, members) for (gi, digest), members in result.items() if len(members) > 1]
+
+def find_duplicates(candidates, cache=None, max_workers=DUP_MAX_WORKERS, on_progress=None, cancel=None, min_size=1):
+    # candidates са (ключ, път, размер, mtime). Три етапа, всеки само върху оцелелите от предишния:
+    # еднакъв размер -> еднакъв частичен хеш (първи + последен блок) -> еднакъв пълен хеш.
+    # Връща DuplicateGroup-и, подредени по освободимото място, или None при отказ.
+    cache = cache if cache is not None else HashCache()
+    by_size = {}
+    for key, path, size, mtime in candidates:
+        if size >= min_size: by_size.setdefault(size, []).append((key, path, size, mtime))
+    groups = [g for g in by_size.values() if len(g) > 1]
+    cache.prefetch([c[1] for g in groups for c in g])
+
+    pool = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        partial = _regroup(groups, "partial", cache, pool, on_progress, cancel)
+        if cancel is not None and cancel.is_set(): return None
+        # Файл до два блока е изцяло покрит от частичния хеш - пълен хеш не е нужен
+        small = [(digest, members) for digest, members in partial if members[0][2] <= 2 * DUP_BLOCK_SIZE]
+        large = [members for digest, members in partial if members[0][2] > 2 * DUP_BLOCK_SIZE]
+        full = _regroup(large, "full", cache, pool, on_progress, cancel)
+        if cancel is not None and cancel.is_set(): return None
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        cache.save()
+
+    result = [DuplicateGroup(members[0][2], digest, [m[0] for m in members]) for digest, members in small + full]
+    result.sort(key=lambda g: g.size * (len(g.keys) - 1), reverse=True)
+    return result
@@ -0,0 +1,150 @@
+import io
+import os
+import csv
+import gzip
+import json
+import lzma
+from contextlib import nullcontext
+from datetime import datetime
+from functools import lru_cache
+from time import perf_counter
+from utils import FileStore, FLAG_SYS, FLAG_DELETED, FLAG_SELECTED, format_size
+
+EXPORT_FORMATS = ("txt", "csv", "jsonl")
+EXPORT_COMPRESSIONS = {".gz": "gzip", ".xz": "xz"}
+EXPORT_BATCH_ROWS = 10_000  # редове на една порция - форматират се и се записват с един write
+EXPORT_BUFFER_SIZE = 1024 * 1024
+
+@lru_cache(maxsize=65536)
+def _minute_str(minute):
+    # Текстовият отчет е с точност до минута - много файлове делят една и съща минута
+    return datetime.fromtimestamp(minute * 60).strftime("%d/%m/%Y %H:%M")
+
+@lru_cache(maxsize=65536)
+def _iso_str(second):
+    return datetime.fromtimestamp(second).isoformat()
+
+def detect_format(file_path):
+    # (формат, компресия) по разширението: report.csv.gz -> ("csv", "gzip"), report.txt -> ("txt", None)
+    root, ext = os.path.splitext(file_path.lower())
+    compression = EXPORT_COMPRESSIONS.get(ext)
+    if compression: root, ext = os.path.splitext(root)
+    fmt = ext.lstrip(".")
+    return (fmt if fmt in EXPORT_FORMATS else "txt"), compression
+
+def _store_batches(store, selected_only, lock):
+    # Чете колоните на FileTable директно, без datetime и кортеж за всеки запис.
+    # Заключва се само за порция, за да може дървото да се обновява между порциите.
+    table = store.table
+    sep = os.sep
+    start = 0
+    while True:
+        with lock if lock is not None else nullcontext():
+            end = min(start + EXPORT_BATCH_ROWS, len(table.flags))
+            flags, sizes, mtimes, names, nodes = table.flags, table.sizes, table.mtimes, table.names, table.nodes
+            # Пътят се сглобява с конкатенация вместо os.path.join - node.path е нормализиран
+            # (само коренът може да завършва на разделител, напр. "/" или "C:\\")
+            batch = [
+                (nodes[i].path.rstrip(sep) + sep + names[i], sizes[i], mtimes[i], bool(flags[i] & FLAG_SYS))
+                for i in range(start, end)
+                if not flags[i] & FLAG_DELETED and (not selected_only or flags[i] & FLAG_SELECTED)
+            ]
+        if start >= end: return
+        if batch: yield batch
+        start = end
+
+def _list_batches(matched_files, selected):
+    # Стария формат (път, размер, дата, системен); филтърът по маркирани е set lookup
+    batch = []
+    for f_path, f_size, f_date, is_sys in matched_files:
+        if selected and f_path not in selected: continue
+        batch.append((f_path, f_size, f_date.timestamp(), is_sys))
+        if len(batch) >= EXPORT_BATCH_ROWS:
+            yield batch
+            batch = []
+    if batch: yield batch
+
+def _open_output(file_path, compression, newline):
+    if compression == "gzip":
+        raw = gzip.open(file_path, "wb", compresslevel=6)
+    elif compression == "xz":
+        raw = lzma.open(file_path, "wb", preset=1)
+    else:
+        raw = open(file_path, "wb", buffering=EXPORT_BUFFER_SIZE)
+    return io.TextIOWrapper(io.BufferedWriter(raw, EXPORT_BUFFER_SIZE) if compression else raw, encoding="utf-8", newline=newline)
+
+def _format_txt(batch):
+    return "".join(
+        f"{'[СИСТЕМЕН] ' if is_sys else ''}{f_path} | Размер: {format_size(f_size)} | Дата: {_minute_str(int(mtime // 60))}\n"
+        for f_path, f_size, mtime, is_sys in batch
+    )
+
+def _format_jsonl(batch):
+    dumps = json.dumps
+    return "".join(
+        f'{{"path": {dumps(f_path, ensure_ascii=False)}, "size": {f_size}, "mtime": "{_iso_str(int(mtime))}", "system": {"true" if is_sys else "false"}}}\n'
+        for f_path, f_size, mtime, is_sys in batch
+    )
+
+def write_report(file_path, matched_files, selected_files, target_folder, fmt=None, compression=None,
+                 lock=None, on_progress=None, cancel=None, stats=None):
+    # Поточен експорт: редовете минават на порции от EXPORT_BATCH_ROWS, всяка се форматира и записва
+    # с един write, така че паметта не зависи от броя файлове. matched_files е FileStore (чете се
+    # направо от колоните) или списък (път, размер, дата, системен). selected_files=None при FileStore
+    # значи "маркираните в store-а". Връща броя записани редове или None при отказ (файлът се трие).
+    # stats (profiling.Timings) получава времето за форматиране и запис и броя редове.
+    detected_fmt, detected_compression = detect_format(file_path)
+    fmt = fmt or detected_fmt
+    compression = compression if compression is not None else detected_compression
+
+    if isinstance(matched_files, FileStore) and selected_files is None:
+        is_subset = matched_files.selected_count > 0
+        total = matched_files.selected_count if is_subset else len(matched_files)
+        batches = _store_batches(matched_files, is_subset, lock)
+    else:
+        selected = selected_files if isinstance(selected_files, (set, frozenset)) else set(selected_files or ())
+        is_subset = len(selected) > 0
+        if isinstance(matched_files, FileStore):
+            # Пътищата идват от самия store - филтърът е по път, но редовете пак се четат от колоните
+            batches = ([row for row in batch if not is_subset or row[0] in selected] for batch in _store_batches(matched_files, False, lock))
+            total = len(selected) if is_subset else len(matched_files)
+        else:
+            batches = _list_batches(matched_files, selected)
+            total = sum(1 for f in matched_files if f[0] in selected) if is_subset else len(matched_files)
+
+    written = 0
+    # Текстовият отчет е с редовете на платформата (както досега), машинните формати - винаги с \n
+    with _open_output(file_path, compression, None if fmt == "txt" else "") as out:
+        if fmt == "txt":
+            target_str = "ИЗБРАНИ" if is_subset else "ВСИЧКИ"
+            out.write("=" * 60 + "\n")
+            out.write(f"ОТЧЕТ ОТ СКАНИРАНЕ ({target_str}): {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+            out.write(f"Сканирана директория: {target_folder}\n")
+            out.write(f"Общо включени файлове: {total}\n\n")
+        elif fmt == "csv":
+            writer = csv.writer(out, lineterminator="\n")
+            writer.writerow(("path", "size", "mtime", "system"))
+
+        for batch in batches:
+            if cancel is not None and cancel.is_set(): break
+            started = perf_counter()
+            if fmt == "csv":
+                # csv.writer форматира и пише наведнъж - цялото време отива към "запис"
+                writer.writerows((f_path, f_size, _iso_str(int(mtime)), int(is_sys)) for f_path, f_size, mtime, is_sys in batch)
+            else:
+                text = _format_jsonl(batch) if fmt == "jsonl" else _format_txt(batch)
+                if stats is not None:
+                    stats.add_time("format", perf_counter() - started)
+                    started = perf_counter()
+                out.write(text)
+            if stats is not None:
+                stats.add_time("write", perf_counter() - started)
+                stats.count("rows", len(batch))
+            written += len(batch)
+            if on_progress: on_progress(written)
+
+    if cancel is not None and cancel.is_set():
+        try: os.remove(file_path)
+        except OSError: pass
+        return None
+    return written
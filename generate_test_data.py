@@ -1,81 +1,214 @@
 import os
-import random
+import sys
 import time
-from datetime import datetime, timedelta
+import random
+import argparse
+from datetime import datetime
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 # ==========================================
-# НАСТРОЙКИ НА ГЕНЕРАТОРА
+# ГЕНЕРАТОР НА ТЕСТОВИ ДАННИ (и за мащабни тестове)
 # ==========================================
-TARGET_DIR = "Test_Playground"     # Името на главната папка
-NUM_MAIN_FOLDERS = 5               # Брой главни папки
-MAX_DEPTH = 3                      # Колко нива навътре да влизат подпапките
-FILES_PER_FOLDER = range(0, 15)    # Между 0 и 15 файла във всяка папка (ще генерира и празни папки!)
-FILE_SIZES_KB = range(0, 5120)     # Размер на файловете: от 0 KB (празни) до 5 MB
+# Примери:
+#   python generate_test_data.py                                   # малко дърво като досега
+#   python generate_test_data.py --seed 42 --depth 6 --fanout 2-6 --files 0-40 --max-files 1000000
+#   python generate_test_data.py --shape flat --files 500000 --target Flat_500k
+#   python generate_test_data.py --shape deep --depth 500 --files 1   # дълбочината е ограничена от PATH_MAX
+#   python generate_test_data.py --seed 7 --end-date 2025-06-30 --days 90     # датите в последните 90 дни преди 30.06.2025
+# По подразбиране файловете са sparse (truncate) - имат размер, но не заемат място на диска.
+# Датите са в последните --days дни до --end-date: без seed - до сега, със seed - до SEEDED_END_DATE,
+# така че дървото е възпроизводимо и пак попада във филтъра по подразбиране на приложението (от 01/01/2024).
 
+TARGET_DIR = "Test_Playground"
 # Разширения (включили сме и системни, за да тестваме System Shield-а!)
 EXTENSIONS = ['.txt', '.pdf', '.docx', '.jpg', '.csv', '.log', '.dll', '.sys']
+SHAPES = ("tree", "flat", "deep", "wide")
+SIZE_DISTRIBUTIONS = ("uniform", "lognormal", "zero")
+CONTENT_MODES = ("sparse", "random")
+CHUNK_FILES = 2000  # файлове в една задача за пула - голяма папка се пълни на порции паралелно
+SEEDED_END_DATE = datetime(2026, 1, 1)  # край на датите при --seed без --end-date
+
+GenerationStats = namedtuple("GenerationStats", "files dirs bytes elapsed")
+
+def parse_range(text):
+    """ "3" -> (3, 3), "0-15" -> (0, 15) """
+    low, _, high = str(text).partition("-")
+    return int(low), int(high or low)
+
+def parse_size(text):
+    """ "512", "64K", "5M", "2G" -> байтове """
+    text = str(text).strip().upper()
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    return int(float(text[:-1]) * units[text[-1]]) if text and text[-1] in units else int(text)
+
+def path_limit(path):
+    # Най-дългият път, който ОС приема (PATH_MAX без нулевия байт; на Windows - MAX_PATH)
+    try: return os.pathconf(path, "PC_PATH_MAX") - 1
+    except (AttributeError, ValueError, OSError): return 259
+
+def deep_path_length(base_path, depth, extensions=EXTENSIONS):
+    # Дължината на най-дългия файлов път във веригата на shape="deep" (папките са d0/d1/...)
+    dirs = sum(len(os.sep) + len(f"d{d}") for d in range(depth))
+    return len(base_path) + dirs + len(os.sep) + len("mock_file_000000") + max(map(len, extensions), default=0)
+
+class Planner:
+    """Описва дървото детерминистично от seed - само в главната нишка, без достъп до диска.
+
+    Генерира (папка, [(име, размер, mtime)]) на порции до CHUNK_FILES, а mtime на папките
+    събира отделно, защото се слагат накрая (създаването на файлове ги променя).
+    """
+
+    def __init__(self, base_path, seed=None, shape="tree", roots=5, depth=3, fanout=(0, 3), files=(0, 14),
+                 max_files=None, sizes="uniform", max_size=5 * 1024 ** 2, days=3 * 365, extensions=EXTENSIONS, end_ts=None):
+        self.base_path = base_path
+        self.rng = random.Random(seed)
+        self.shape, self.roots, self.depth = shape, roots, depth
+        self.fanout, self.files, self.max_files = fanout, files, max_files
+        self.sizes, self.max_size, self.extensions = sizes, max_size, extensions
+        if end_ts is None: end_ts = time.time() if seed is None else SEEDED_END_DATE.timestamp()  # със seed и датите са възпроизводими
+        self.end_ts = end_ts
+        self.start_ts = self.end_ts - days * 86400
+        self.dir_mtimes = []
+        self.planned = 0
+
+    def random_date(self):
+        return self.start_ts + self.rng.random() * (self.end_ts - self.start_ts)
 
-# Дати: От преди 3 години до днес
-END_DATE = datetime.now()
-START_DATE = END_DATE - timedelta(days=3 * 365)
-start_ts = START_DATE.timestamp()
-end_ts = END_DATE.timestamp()
-
-def generate_random_date():
-    """Генерира произволен Timestamp в зададения период"""
-    return start_ts + random.random() * (end_ts - start_ts)
-
-def create_random_file(folder_path):
-    """Създава 1 файл с произволно име, разширение, размер и дата"""
-    ext = random.choice(EXTENSIONS)
-    file_name = f"mock_file_{random.randint(1000, 9999)}{ext}"
-    full_path = os.path.join(folder_path, file_name)
-    
-    # 1. Генерираме произволен размер (пишем случайни байтове)
-    size_kb = random.choice(FILE_SIZES_KB)
+    def random_size(self):
+        if self.sizes == "zero": return 0
+        if self.sizes == "lognormal":
+            # Реалистично: много малки файлове (медиана ~8 KB) и дълга опашка от големи
+            return min(int(self.rng.lognormvariate(9, 2.5)), self.max_size)
+        return self.rng.randint(0, self.max_size)
+
+    def folder(self, path, count):
+        # Файловете на една папка, на порции; спира при --max-files
+        if self.max_files is not None: count = max(0, min(count, self.max_files - self.planned))
+        self.dir_mtimes.append((path, self.random_date()))
+        chunk = []
+        for i in range(count):
+            ext = self.rng.choice(self.extensions)
+            chunk.append((f"mock_file_{i:06d}{ext}", self.random_size(), self.random_date()))
+            if len(chunk) >= CHUNK_FILES:
+                yield path, chunk
+                chunk = []
+        self.planned += count
+        yield path, chunk
+
+    def plan(self):
+        base, rng = self.base_path, self.rng
+        if self.shape == "flat":
+            # Една папка с всички файлове (напр. 500k) - проверява listing-а и сортирането на огромна папка
+            yield from self.folder(os.path.join(base, "Flat_Folder"), self.files[1])
+        elif self.shape == "deep":
+            # Верига от вложени папки - проверява дълбочината (пътища, рекурсия, отстъпи в дървото)
+            path = base
+            for d in range(self.depth):
+                path = os.path.join(path, f"d{d}")
+                yield from self.folder(path, rng.randint(*self.files))
+        elif self.shape == "wide":
+            # Много съседни папки на едно ниво
+            for i in range(self.roots):
+                yield from self.folder(os.path.join(base, f"Wide_{i:06d}"), rng.randint(*self.files))
+        else:
+            stack = [(os.path.join(base, f"Project_Folder_{i}"), 1) for i in reversed(range(self.roots))]
+            while stack:
+                if self.max_files is not None and self.planned >= self.max_files: return
+                path, depth = stack.pop()
+                yield from self.folder(path, rng.randint(*self.files))
+                if depth < self.depth:
+                    subs = rng.randint(*self.fanout)
+                    stack.extend((os.path.join(path, f"Subfolder_{depth}_{i}"), depth + 1) for i in reversed(range(subs)))
+
+def create_files(dir_path, files, content):
+    """Създава порция файлове в една папка; връща (брой, байтове)"""
+    os.makedirs(dir_path, exist_ok=True)
+    total = 0
+    for name, size, mtime in files:
+        full_path = os.path.join(dir_path, name)
+        with open(full_path, "wb") as f:
+            if size and content == "random":
+                f.write(os.urandom(size))
+            elif size:
+                f.truncate(size)  # sparse - размерът е логически, на диска няма блокове
+        os.utime(full_path, (mtime, mtime))
+        total += size
+    return len(files), total
+
+def generate(target, seed=None, shape="tree", roots=5, depth=3, fanout=(0, 3), files=(0, 14), max_files=None,
+             sizes="uniform", max_size=5 * 1024 ** 2, days=3 * 365, extensions=EXTENSIONS, content="sparse",
+             workers=None, on_progress=None, end_ts=None):
+    """Генерира дървото в target и връща GenerationStats. Със seed резултатът е еднакъв при всяко пускане."""
+    base_path = os.path.abspath(target)
+    os.makedirs(base_path, exist_ok=True)
+    if shape == "deep" and deep_path_length(base_path, depth, extensions) > path_limit(base_path):
+        # Файловете се създават по пълен път (както ги обхожда и приложението), така че веригата трябва да се побира
+        deepest = max(d for d in range(depth + 1) if deep_path_length(base_path, d, extensions) <= path_limit(base_path))
+        raise ValueError(f"--depth {depth} надхвърля ограничението за дължина на път ({path_limit(base_path)}) - "
+                         f"в {base_path} най-много {deepest}")
+    planner = Planner(base_path, seed, shape, roots, depth, fanout, files, max_files, sizes, max_size, days, extensions, end_ts)
+    workers = workers or min(32, (os.cpu_count() or 1) * 4)
+    started = time.perf_counter()
+    done_files, done_bytes, last_report = 0, 0, started
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for dir_path, chunk in planner.plan():
+            pending.add(pool.submit(create_files, dir_path, chunk, content))
+            # Ограничен брой задачи в движение - планът не се държи целият в паметта
+            if len(pending) >= workers * 4:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    count, size = future.result()
+                    done_files += count
+                    done_bytes += size
+                if on_progress and time.perf_counter() - last_report >= 1:
+                    on_progress(done_files)
+                    last_report = time.perf_counter()
+        for future in pending:
+            count, size = future.result()
+            done_files += count
+            done_bytes += size
+
+    # Датите на папките - накрая и от най-дълбоките нагоре, защото всяко създаване ги променя
+    for dir_path, mtime in sorted(planner.dir_mtimes, key=lambda d: d[0].count(os.sep), reverse=True):
+        os.makedirs(dir_path, exist_ok=True)
+        os.utime(dir_path, (mtime, mtime))
+    return GenerationStats(done_files, len(planner.dir_mtimes), done_bytes, time.perf_counter() - started)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Генератор на тестови дървета с файлове")
+    parser.add_argument("--target", default=TARGET_DIR, help="главната папка")
+    parser.add_argument("--seed", type=int, default=None, help="seed за възпроизводимо дърво (и дати)")
+    parser.add_argument("--shape", choices=SHAPES, default="tree", help="tree, flat (една огромна папка), deep (верига), wide (много съседни папки)")
+    parser.add_argument("--roots", type=int, default=5, help="главни папки (tree) или папки (wide)")
+    parser.add_argument("--depth", type=int, default=3, help="нива (tree) или дължина на веригата (deep)")
+    parser.add_argument("--fanout", type=parse_range, default=(0, 3), help="подпапки на папка, напр. 0-3")
+    parser.add_argument("--files", type=parse_range, default=(0, 14), help="файлове на папка, напр. 0-14 (при flat - общо)")
+    parser.add_argument("--max-files", type=int, default=None, help="горна граница на всички файлове")
+    parser.add_argument("--sizes", choices=SIZE_DISTRIBUTIONS, default="uniform", help="разпределение на размерите")
+    parser.add_argument("--max-size", type=parse_size, default=5 * 1024 ** 2, help="най-голям файл, напр. 5M")
+    parser.add_argument("--days", type=int, default=3 * 365, help="датите са в последните N дни преди --end-date")
+    parser.add_argument("--end-date", type=lambda text: datetime.strptime(text, "%Y-%m-%d"), default=None,
+                        help=f"най-новата дата, ГГГГ-ММ-ДД (по подразбиране сега, а със --seed {SEEDED_END_DATE:%Y-%m-%d})")
+    parser.add_argument("--content", choices=CONTENT_MODES, default="sparse", help="sparse (truncate, без място на диска) или random (os.urandom)")
+    parser.add_argument("--workers", type=int, default=None, help="нишки за създаването")
+    args = parser.parse_args(argv)
+
+    print(f"🚀 Започва генериране на тестови данни в папка: {args.target} ({args.shape}, seed={args.seed})...")
     try:
-        with open(full_path, 'wb') as f:
-            if size_kb > 0:
-                f.write(os.urandom(size_kb * 1024))
-    except Exception as e:
-        print(f"Грешка при създаване на файл: {e}")
-        return
-
-    # 2. Манипулираме датата на създаване и модифициране (МАГИЯТА!)
-    random_time = generate_random_date()
-    os.utime(full_path, (random_time, random_time))
-
-def build_tree(current_path, current_depth):
-    """Рекурсивно строи папки и ги пълни с файлове"""
-    os.makedirs(current_path, exist_ok=True)
-    
-    # Пълним текущата папка с файлове
-    num_files = random.choice(FILES_PER_FOLDER)
-    for _ in range(num_files):
-        create_random_file(current_path)
-        
-    # Сменяме датата и на самата папка!
-    folder_time = generate_random_date()
-    os.utime(current_path, (folder_time, folder_time))
-    
-    # Решаваме дали да създадем подпапка (ако не сме стигнали дъното)
-    if current_depth < MAX_DEPTH:
-        num_subfolders = random.randint(0, 3)
-        for i in range(num_subfolders):
-            sub_path = os.path.join(current_path, f"Subfolder_{current_depth}_{i}")
-            build_tree(sub_path, current_depth + 1)
+        stats = generate(args.target, args.seed, args.shape, args.roots, args.depth, args.fanout, args.files, args.max_files,
+                         args.sizes, args.max_size, args.days, EXTENSIONS, args.content, args.workers,
+                         on_progress=lambda n: print(f"  ... {n} файла", flush=True),
+                         end_ts=args.end_date.timestamp() if args.end_date else None)
+    except ValueError as e:
+        parser.error(str(e))
+    rate = stats.files / stats.elapsed if stats.elapsed else 0
+    print(f"✅ Готово: {stats.files} файла в {stats.dirs} папки, {stats.bytes / 1024 ** 2:.1f} MB логически, "
+          f"{stats.elapsed:.1f} s ({rate:.0f} файла/s)")
+    print("Сега отвори Smart Manager-а и сканирай тази папка!")
+    return 0
 
 if __name__ == "__main__":
-    print(f"🚀 Започва генериране на тестови данни в папка: {TARGET_DIR}...")
-    
-    # Създаваме главната папка, ако я няма
-    base_path = os.path.abspath(TARGET_DIR)
-    os.makedirs(base_path, exist_ok=True)
-    
-    # Генерираме дървото
-    for i in range(NUM_MAIN_FOLDERS):
-        main_folder_path = os.path.join(base_path, f"Project_Folder_{i}")
-        build_tree(main_folder_path, 1)
-        
-    print("✅ Генерирането завърши успешно!")
-    print("Сега отвори Smart Manager-а и сканирай тази папка!")
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,132 @@
+import logging
+import threading
+from collections import deque
+from itertools import count
+
+QUEUED, RUNNING, PAUSED, DONE, FAILED, CANCELLED = "queued", "running", "paused", "done", "failed", "cancelled"
+ACTIVE_STATUSES = (QUEUED, RUNNING, PAUSED)
+
+class JobToken:
+    """Подава се на движковете вместо threading.Event за отказ (те викат само is_set()).
+
+    Докато задачата е на пауза, is_set() блокира - така всеки движок, който проверява за
+    отказ между файловете/порциите, спира на пауза без да знае за нея.
+    """
+
+    def __init__(self, job):
+        self.job = job
+
+    def is_set(self):
+        self.job.resume_event.wait()
+        return self.job.cancel_event.is_set()
+
+class Job:
+    """Една фонова операция: статус, последен прогрес, резултат/грешка, пауза и отказ."""
+
+    def __init__(self, scheduler, job_id, title, fn, args):
+        self.scheduler = scheduler
+        self.id = job_id
+        self.title = title
+        self.fn = fn
+        self.args = args
+        self.status = QUEUED
+        self.progress = None  # TransferProgress или текст - каквото движкът докладва
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.resume_event = threading.Event()
+        self.resume_event.set()
+        self.done_event = threading.Event()
+        self.token = JobToken(self)
+
+    @property
+    def cancelled(self): return self.cancel_event.is_set()
+
+    def report(self, progress):
+        self.progress = progress
+        self.scheduler.notify(self)
+
+    def pause(self):
+        if self.status != RUNNING: return
+        self.resume_event.clear()
+        self.status = PAUSED
+        self.scheduler.notify(self)
+
+    def resume(self):
+        if self.status != PAUSED: return
+        self.status = RUNNING
+        self.resume_event.set()
+        self.scheduler.notify(self)
+
+    def cancel(self):
+        self.cancel_event.set()
+        self.resume_event.set()  # задача на пауза трябва да се събуди, за да види отказа
+        if self.status == PAUSED: self.status = RUNNING
+        self.scheduler.notify(self)
+
+    def wait(self, timeout=None):
+        return self.done_event.wait(timeout)
+
+class JobScheduler:
+    """Опашка от фонови операции (сканиране, копиране, преместване, триене, експорт).
+
+    fn(job, *args) се изпълнява в работна нишка; прогресът минава през job.report(), а отказът
+    и паузата - през job.token. on_update(job) се вика при всяка промяна на статус или прогрес,
+    от нишката, която я е направила - слушателят отговаря за безопасното обновяване на UI.
+    По подразбиране задачите вървят една по една, защото всички пипат едно и също дърво.
+    """
+
+    def __init__(self, on_update=None, max_workers=1):
+        self.on_update = on_update
+        self.max_workers = max_workers
+        self.lock = threading.Lock()
+        self.queue = deque()
+        self.jobs = []  # активните задачи (на опашка, изпълнявани или на пауза)
+        self.workers = 0
+        self.ids = count(1)
+
+    def submit(self, title, fn, *args):
+        job = Job(self, next(self.ids), title, fn, args)
+        with self.lock:
+            self.queue.append(job)
+            self.jobs.append(job)
+            start_worker = self.workers < self.max_workers
+            if start_worker: self.workers += 1
+        self.notify(job)
+        if start_worker: threading.Thread(target=self._worker, daemon=True).start()
+        return job
+
+    def active(self):
+        with self.lock:
+            return list(self.jobs)
+
+    def cancel_all(self):
+        for job in self.active(): job.cancel()
+
+    def notify(self, job):
+        if self.on_update is None: return
+        try: self.on_update(job)
+        except Exception as e: logging.error(f"Грешка при обновяване на прогреса на '{job.title}': {e}")
+
+    def _worker(self):
+        while True:
+            with self.lock:
+                if not self.queue:
+                    self.workers -= 1
+                    return
+                job = self.queue.popleft()
+
+            if not job.cancelled:
+                job.status = RUNNING
+                self.notify(job)
+                try:
+                    job.result = job.fn(job, *job.args)
+                except Exception as e:
+                    logging.error(f"Грешка във фонова задача '{job.title}': {e}")
+                    job.error = e
+
+            with self.lock:
+                self.jobs.remove(job)
+            job.status = FAILED if job.error is not None else (CANCELLED if job.cancelled else DONE)
+            job.done_event.set()
+            self.notify(job)
@@ -2,13 +2,28 @@ import flet as ft
 import os
 import platform
 import subprocess
+import threading
+from time import perf_counter
 from datetime import datetime, time, timedelta
 
-from utils import MAX_UI_FILES, natural_sort_key, format_size
-from ui_components import CollapsibleDirectory
+from utils import (
+    TREE_ROW_HEIGHT, SCAN_MAX_WORKERS, SCAN_REFRESH_INTERVAL, SCAN_TIME_BUDGET, SCAN_FILE_BUDGET, SEARCH_DEBOUNCE_DELAY, PROFILE_LOG_THRESHOLD, ROW_FILE, ROW_EMPTY,
+    FLAG_DELETED, FileStore, flatten_tree, format_size
+)
+from ui_components import CollapsibleDirectory, VirtualList, indent_guides
+from search_index import NameIndex, group_matches
+from sort_cache import SortCache
+from jobs import JobScheduler, QUEUED, RUNNING, PAUSED
+from transfer import TransferProgress
+from duplicates import HashCache, HASH_CACHE_PATH, find_duplicates
+from analytics import DiskUsage
+from profiling import Timings, run_profiled, profile_path
+from scan_index import ScanIndex
+from watcher import TreeWatcher, WATCHDOG_AVAILABLE, apply_changes
+from scan_rules import DEFAULT_EXCLUDES
 from operations import (
-    scan_directory, copy_single_file, cut_single_file, delete_single_file,
-    batch_copy, batch_cut, batch_delete, generate_export_report
+    ScanBudget, SCAN_CANCELLED, SCAN_TIME_LIMIT, iter_scan_directory, copy_single_file, cut_single_file, delete_single_file,
+    batch_copy, batch_cut, batch_delete, prune_empty_dirs, generate_export_report
 )
 
 # --- ПРЕМИУМ ПАЛИТРА (Ultra Minimalist Dark) ---
@@ -37,19 +52,25 @@ def main(page: ft.Page):
     page.update()
 
     # --- СЪСТОЯНИЯ ---
-    matched_files = [] 
-    selected_files = set() 
+    file_store = FileStore() # Намерените файлове: дървото от папки + колонна таблица (FileTable)
     target_folder = ["."] 
-    has_system_files = [False] 
-    global_root_node = [None]
     
     sort_asc = [True] 
     auto_expand_all = [False]
-    ui_count = [0]
-    limit_reached = [False]
     active_icon_rows = [] 
-    single_action = {"type": None, "path": None, "row": None}
+    single_action = {"type": None, "path": None}
     expanded_dirs = set()
+    state_lock = threading.RLock()
+    scan_index = ScanIndex()
+    last_scan = {"folder": None, "filters": None}
+    active_watcher = [None]
+    hash_cache = HashCache(HASH_CACHE_PATH) # Хешове по (път, размер, mtime) за търсенето на дубликати
+    search_index = NameIndex(file_store) # Триграмен индекс над имената за бързото търсене
+    sort_cache = SortCache(file_store) # Естествени ключове и подредби по колона за всяка папка
+    disk_usage = DiskUsage(file_store) # Размери на папките, най-големите файлове и хистограми - смятат се след сканиране
+    search_timer = [None]
+    last_timings = {} # "scan"/"op"/"redraw" -> Timings от последното изпълнение - за лентата отдолу
+    applied_query = [""]
 
     # ==============================================================
     # 1. ГРАФИЧНИ ЕЛЕМЕНТИ
@@ -63,12 +84,25 @@ def main(page: ft.Page):
     tf_start = ft.TextField(label="От дата", value="01/01/2024", width=125, border_color=BORDER_COLOR, focused_border_color=ACCENT_BLUE, text_size=13, content_padding=10)
     tf_end = ft.TextField(label="До дата", value=datetime.now().strftime("%d/%m/%Y"), width=125, border_color=BORDER_COLOR, focused_border_color=ACCENT_BLUE, text_size=13, content_padding=10)
     tf_ext = ft.TextField(label="Разширения (txt, pdf)", hint_text="Всички", border_color=BORDER_COLOR, focused_border_color=ACCENT_BLUE, text_size=13, content_padding=10)
+    # Шаблони като в .gitignore; изключените папки изобщо не се обхождат
+    tf_exclude = ft.TextField(label="Изключи (node_modules/, *.tmp)", value=", ".join(DEFAULT_EXCLUDES), multiline=True, max_lines=3,
+                              border_color=BORDER_COLOR, focused_border_color=ACCENT_BLUE, text_size=13, content_padding=10)
     
     btn_scan = ft.ElevatedButton(
         "🔍 Сканирай", width=260, height=50, bgcolor=ACCENT_BLUE, color=ft.colors.WHITE,
         style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=10)) 
     )
+    # Докато тече сканиране, на мястото на бутона за сканиране стои този за спиране
+    btn_cancel_scan = ft.ElevatedButton(
+        "⛔ Спри сканирането", width=260, height=50, bgcolor=BTN_DELETE, color=ft.colors.WHITE, visible=False,
+        style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=10))
+    )
+    scan_job = [None]
     progress_ring = ft.ProgressRing(width=24, height=24, stroke_width=3, visible=False, color=ACCENT_BLUE)
+    cb_profile = ft.Checkbox(label="Профилирай следващата операция", value=False, label_style=ft.TextStyle(color=TEXT_SECONDARY, size=13),
+                             tooltip="Пуска следващата фонова задача под cProfile и записва .prof в кеша")
+    sw_watch = ft.Switch(label="Следи за промени", value=False, active_color=ACCENT_BLUE, label_style=ft.TextStyle(color=TEXT_SECONDARY, size=13),
+                         disabled=not WATCHDOG_AVAILABLE, tooltip=None if WATCHDOG_AVAILABLE else "Изисква пакета watchdog")
 
     # НОВО: Лента за бързо търсене (Live Search)
     tf_search = ft.TextField(
@@ -77,9 +111,12 @@ def main(page: ft.Page):
         width=200, height=40, text_size=13, 
         border_color=BORDER_COLOR, focused_border_color=ACCENT_BLUE, 
         content_padding=10,
-        on_change=lambda _: redraw_tree() # Преначертава дървото при всяка буква
+        on_change=lambda _: schedule_search() # Търсенето тръгва след кратка пауза в писането
     )
 
+    DUP_DIALOG_GROUPS = 200
+    USAGE_DIALOG_ROWS = 15
+    SORT_COLUMN_BY_LABEL = {"Име": "name", "Размер": "size", "Дата": "date", "Тип": "type"}
     dd_sort = ft.Dropdown(
         value="Име",
         options=[ft.dropdown.Option("Име"), ft.dropdown.Option("Размер"), ft.dropdown.Option("Дата"), ft.dropdown.Option("Тип")],
@@ -97,17 +134,31 @@ def main(page: ft.Page):
         expand=True
     )
 
-    results_list = ft.ListView(expand=True, spacing=5, auto_scroll=False)
+    results_list = ft.ListView(expand=True, spacing=0, auto_scroll=False)
     results_list.controls = [empty_state] 
+    # Иконките на редовете са само за текущия прозорец - при скрол старите редове се изхвърлят
+    virtual_tree = VirtualList(results_list, TREE_ROW_HEIGHT, lambda row: build_tree_row(row), on_render=lambda: active_icon_rows.clear(),
+                               lock=state_lock)
     
     results_container = ft.Container(content=results_list, expand=True, border=ft.border.all(1, BORDER_COLOR), bgcolor=BG_CONTAINER, padding=15, border_radius=12)
     lbl_summary = ft.Text("Готовност за сканиране...", color=TEXT_SECONDARY, size=13)
 
+    # Панел за прогрес на фоновите задачи (сканиране, копиране и т.н.) - видим само докато има активна
+    op_label = ft.Text("", color=TEXT_SECONDARY, size=12)
+    op_bar = ft.ProgressBar(value=0, color=ACCENT_BLUE, bgcolor=BORDER_COLOR, expand=True)
+    btn_op_pause = ft.TextButton("Пауза", icon=ft.icons.PAUSE, style=ft.ButtonStyle(color=TEXT_SECONDARY))
+    btn_op_cancel = ft.TextButton("Откажи", icon=ft.icons.CANCEL, style=ft.ButtonStyle(color=BTN_DELETE))
+    op_panel = ft.Column([op_label, ft.Row([op_bar, btn_op_pause, btn_op_cancel])], spacing=2, visible=False)
+    shown_job = [None]
+    ui_lock = threading.Lock()
+
     btn_style = ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=8))
     btn_copy = ft.ElevatedButton("📁 Копирай", disabled=True, color=ft.colors.WHITE, bgcolor=BTN_COPY, style=btn_style)
     btn_cut_bulk = ft.ElevatedButton("✂️ Изрежи", disabled=True, color=ft.colors.WHITE, bgcolor=BTN_CUT, style=btn_style)
     btn_export = ft.ElevatedButton("📄 Експорт", disabled=True, color=ft.colors.WHITE, bgcolor=BTN_EXPORT, style=btn_style)
     btn_delete = ft.ElevatedButton("🗑️ Изтрий", disabled=True, color=ft.colors.WHITE, bgcolor=BTN_DELETE, style=btn_style)
+    btn_dupes = ft.ElevatedButton("👯 Дубликати", disabled=True, color=ft.colors.WHITE, bgcolor=ACCENT_BLUE, style=btn_style)
+    btn_usage = ft.ElevatedButton("📊 Анализ", disabled=True, color=ft.colors.WHITE, bgcolor=BTN_EXPORT, style=btn_style)
 
     scan_picker = ft.FilePicker()
     copy_picker = ft.FilePicker()
@@ -136,7 +187,7 @@ def main(page: ft.Page):
         show_snack(f"Копирано: {os.path.basename(filepath)}", BTN_COPY)
 
     def update_dynamic_buttons():
-        sel_count = len(selected_files)
+        sel_count = file_store.selected_count
         is_multi_select = sel_count > 0
         
         if is_multi_select:
@@ -152,50 +203,123 @@ def main(page: ft.Page):
             
         for icon_row in active_icon_rows: icon_row.visible = False
             
-        is_empty = len(matched_files) == 0
+        is_empty = len(file_store) == 0
         btn_copy.disabled = is_empty
         btn_cut_bulk.disabled = is_empty
         btn_export.disabled = is_empty
         btn_delete.disabled = is_empty
+        btn_dupes.disabled = is_empty
+        btn_usage.disabled = is_empty
         page.update()
 
     def update_summary_text():
-        total_size = sum(f_size for _, f_size, _, _ in matched_files)
-        lbl_summary.value = f"✅ Намерени: {len(matched_files)} файла | Размер: {format_size(total_size)}"
-        if has_system_files[0]:
+        lbl_summary.value = f"✅ Намерени: {len(file_store)} файла | Размер: {format_size(file_store.total_size)}"
+        if file_store.has_system_files:
             lbl_summary.value += " | ⚠️ Системни файлове!"
             lbl_summary.color = BTN_CUT 
         else:
             lbl_summary.color = BTN_COPY 
+        # Времената и броячите на последното сканиране/операция/прерисуване
+        timings = [last_timings[k].format() for k in ("scan", "op", "redraw") if k in last_timings]
+        if timings: lbl_summary.value += "\n⏱ " + " | ".join(timings)
             
-        if limit_reached[0]: lbl_summary.value += f" | ⚡ Лимит {MAX_UI_FILES}."
         update_dynamic_buttons()
 
-    def remove_file_from_state(path, row_control=None):
-        for i, item in enumerate(matched_files):
-            if item[0] == path:
-                matched_files.pop(i)
-                break
-        selected_files.discard(path) 
-                
-        def remove_from_tree(node, target_path):
-            for i, f in enumerate(node.files):
-                if f[1] == target_path: 
-                    node.files.pop(i)
-                    return True
-            for child in node.children.values():
-                if remove_from_tree(child, target_path): return True
-            return False
-            
-        if global_root_node[0]: remove_from_tree(global_root_node[0], path)
-        if row_control: row_control.visible = False
+    def remove_file_from_state(path):
+        # Редовете на виртуалния списък се строят наново - иначе при скрол стигат до изтрития id
+        with state_lock:
+            file_store.remove(path)
+        redraw_tree()
+        page.update()
+
+    def remove_files_from_state(paths):
+        # Масово премахване след batch операции - без обхождане на цялото дърво за всеки файл
+        with state_lock:
+            file_store.remove_many(paths)
         update_summary_text()
 
+    # --- СЛЕДЕНЕ НА ПРОМЕНИ (WATCH MODE) ---
+    def on_fs_changes(upserts, removed):
+        with state_lock:
+            if file_store.root is None: return
+            apply_changes(file_store, target_folder[0], upserts, removed)
+        redraw_tree()
+        page.update()
+
+    def stop_watcher():
+        if active_watcher[0]:
+            active_watcher[0].stop()
+            active_watcher[0] = None
+
+    def start_watcher():
+        stop_watcher()
+        if not sw_watch.value or not last_scan["folder"]: return
+        start_date, end_date, valid_exts, exclude = last_scan["filters"]
+        watcher = TreeWatcher(last_scan["folder"], start_date, end_date, list(valid_exts), on_fs_changes, exclude=exclude)
+        if watcher.start(): active_watcher[0] = watcher
+
+    def on_watch_toggle(e):
+        # По време на сканиране следенето се пуска от run_scan, след като дървото е готово
+        if sw_watch.value and not btn_scan.disabled: start_watcher()
+        else: stop_watcher()
+
     def show_snack(text, color):
         page.snack_bar = ft.SnackBar(ft.Text(text, color=ft.colors.WHITE), bgcolor=color, behavior=ft.SnackBarBehavior.FLOATING)
         page.snack_bar.open = True
         page.update()
 
+    def on_job_update(job):
+        # Вика се от нишката, която е сменила статуса/прогреса. Контролите на панела се пипат под ui_lock,
+        # а page.update() на Flet е безопасен от всяка нишка.
+        with ui_lock:
+            jobs = scheduler.active()
+            current = next((j for j in jobs if j.status in (RUNNING, PAUSED)), None)
+            shown_job[0] = current
+            op_panel.visible = current is not None
+            if current is not None: render_job(current, len(jobs) - 1)
+        page.update()
+
+    def render_job(job, queued):
+        p = job.progress
+        if isinstance(p, TransferProgress):
+            op_bar.value = p.bytes_done / p.bytes_total if p.bytes_total else (p.files_done / p.files_total if p.files_total else 1)
+            text = f"{job.title}: {p.files_done}/{p.files_total} файла"
+            if p.bytes_total: text += f" | {format_size(p.bytes_done)} / {format_size(p.bytes_total)} | {format_size(p.throughput)}/s"
+            if p.eta is not None: text += f" | остават ~{int(p.eta)} s"
+        else:
+            op_bar.value = None # без известен обем - безкраен индикатор
+            text = f"{job.title}: {p}" if p else f"{job.title}..."
+        if job.status == PAUSED: text += " (пауза)"
+        if job.cancelled: text += " (отказване...)"
+        if queued: text += f" | още {queued} в опашката"
+        op_label.value = text
+        btn_op_pause.text = "Продължи" if job.status == PAUSED else "Пауза"
+        btn_op_pause.icon = ft.icons.PLAY_ARROW if job.status == PAUSED else ft.icons.PAUSE
+        btn_op_pause.disabled = job.cancelled
+        btn_op_cancel.disabled = job.cancelled
+
+    def on_op_pause(e):
+        job = shown_job[0]
+        if job is None: return
+        if job.status == PAUSED: job.resume()
+        else: job.pause()
+
+    def on_op_cancel(e):
+        if shown_job[0]: shown_job[0].cancel()
+
+    btn_op_pause.on_click = on_op_pause
+    btn_op_cancel.on_click = on_op_cancel
+    scheduler = JobScheduler(on_update=on_job_update)
+
+    def submit_job(title, fn, *args):
+        # С отметнато "Профилирай" само тази задача минава през cProfile
+        if cb_profile.value:
+            cb_profile.value = False
+            path = profile_path(title)
+            show_snack(f"Профилът ще бъде записан в {path}", ACCENT_BLUE)
+            return scheduler.submit(title, lambda job, *a: run_profiled(path, fn, job, *a), *args)
+        return scheduler.submit(title, fn, *args)
+
     def set_quick_date(days_back, month_start=False, year_start=False):
         now = datetime.now()
         tf_end.value = now.strftime("%d/%m/%Y")
@@ -216,33 +340,57 @@ def main(page: ft.Page):
 
     def on_copy_folder_selected(e: ft.FilePickerResultEvent):
         if e.path:
-            files_to_process = [f[0] for f in matched_files if f[0] in selected_files] if selected_files else [f[0] for f in matched_files]
-            count, err_count = batch_copy(files_to_process, e.path, target_folder[0])
-            msg = f"Успешно копирани {count} файла."
-            if err_count > 0: msg += f" (Грешки: {err_count})"
-            show_snack(msg, BTN_COPY if err_count == 0 else BTN_CUT)
+            files_to_process = file_store.paths(file_store.target_ids())
+            # Копирането е фонова задача, а панелът показва прогреса на живо
+            submit_job("Копиране", run_copy, files_to_process, e.path, target_folder[0])
     copy_picker.on_result = on_copy_folder_selected
 
+    def run_copy(job, files_to_process, dest_folder, folder):
+        stats = Timings("copy")
+        count, err_count = batch_copy(files_to_process, dest_folder, folder, on_progress=job.report, cancel=job.token, stats=stats)
+        last_timings["op"] = stats.finish()
+        update_summary_text()
+        msg = f"Успешно копирани {count} файла."
+        if job.cancelled: msg = f"Копирането е прекъснато. Копирани {count} файла."
+        if err_count > 0: msg += f" (Грешки: {err_count})"
+        show_snack(msg, BTN_COPY if err_count == 0 else BTN_CUT)
+
     def on_cut_folder_selected(e: ft.FilePickerResultEvent):
         if e.path:
-            files_to_process = [f[0] for f in matched_files if f[0] in selected_files] if selected_files else [f[0] for f in matched_files]
-            count, err_count, success_files = batch_cut(files_to_process, e.path, target_folder[0])
-            for f_path in success_files: remove_file_from_state(f_path, None) 
-            msg = f"Успешно изрязани {count} файла."
-            if err_count > 0: msg += f" Възникнаха {err_count} грешки!"
-            show_snack(msg, BTN_COPY if err_count == 0 else BTN_CUT)
-            redraw_tree() 
-            page.update()
+            files_to_process = file_store.paths(file_store.target_ids())
+            submit_job("Преместване", run_cut, files_to_process, e.path, target_folder[0])
     cut_bulk_picker.on_result = on_cut_folder_selected
 
+    def run_cut(job, files_to_process, dest_folder, folder):
+        stats = Timings("cut")
+        count, err_count, success_files = batch_cut(files_to_process, dest_folder, folder, on_progress=job.report, cancel=job.token, stats=stats)
+        last_timings["op"] = stats.finish()
+        remove_files_from_state(success_files)
+        msg = f"Успешно изрязани {count} файла."
+        if job.cancelled: msg = f"Преместването е прекъснато. Изрязани {count} файла."
+        if err_count > 0: msg += f" Възникнаха {err_count} грешки!"
+        show_snack(msg, BTN_COPY if err_count == 0 else BTN_CUT)
+        redraw_tree() 
+        page.update()
+
     def on_export_report_selected(e: ft.FilePickerResultEvent):
         if e.path:
-            try:
-                generate_export_report(e.path, matched_files, selected_files, target_folder[0])
-                show_snack("Списъкът е запазен успешно.", BTN_COPY)
-            except Exception as ex: show_snack(f"Грешка: {ex}", BTN_DELETE)
+            submit_job("Експорт", run_export, e.path, target_folder[0])
     export_picker.on_result = on_export_report_selected
 
+    def run_export(job, report_path, folder):
+        # Форматът идва от разширението (.txt/.csv/.jsonl, по желание + .gz/.xz); маркираните се четат
+        # направо от флаговете в store-а, а state_lock се държи само по време на всяка порция
+        stats = Timings("export")
+        try:
+            rows = generate_export_report(report_path, file_store, None, folder, lock=state_lock,
+                                          on_progress=lambda n: job.report(f"{n} реда"), cancel=job.token, stats=stats)
+            last_timings["op"] = stats.finish()
+            update_summary_text()
+            if rows is None: show_snack("Експортът е прекъснат.", BTN_CUT)
+            else: show_snack(f"Списъкът е запазен успешно ({rows} реда).", BTN_COPY)
+        except Exception as ex: show_snack(f"Грешка: {ex}", BTN_DELETE)
+
     def on_single_action_selected(e: ft.FilePickerResultEvent):
         if e.path and single_action["path"]:
             try:
@@ -253,19 +401,19 @@ def main(page: ft.Page):
                 elif single_action["type"] == "cut":
                     if cut_single_file(single_action["path"], e.path):
                         show_snack(f"Изрязан и преместен в: {e.path}", BTN_COPY)
-                        remove_file_from_state(single_action["path"], single_action["row"])
+                        remove_file_from_state(single_action["path"])
                     else: show_snack("Източникът и дестинацията съвпадат!", BTN_CUT)
             except Exception as ex: show_snack(f"Грешка: {ex}", BTN_DELETE)
     single_action_picker.on_result = on_single_action_selected
 
-    def prompt_single_cut(path, row_control, is_sys):
+    def prompt_single_cut(path, is_sys):
         if is_sys:
             def close_dlg(e):
                 dlg_sys_cut.open = False
                 page.update()
             def exec_cut(e):
                 dlg_sys_cut.open = False
-                single_action.update({"type": "cut", "path": path, "row": row_control})
+                single_action.update({"type": "cut", "path": path})
                 single_action_picker.get_directory_path()
                 page.update()
             
@@ -278,10 +426,10 @@ def main(page: ft.Page):
             dlg_sys_cut.open = True
             page.update()
         else:
-            single_action.update({"type": "cut", "path": path, "row": row_control})
+            single_action.update({"type": "cut", "path": path})
             single_action_picker.get_directory_path()
 
-    def prompt_single_delete(path, row_control, is_sys):
+    def prompt_single_delete(path, is_sys):
         def close_single_dlg(e):
             dlg_single_delete.open = False
             page.update()
@@ -290,7 +438,7 @@ def main(page: ft.Page):
             try:
                 if delete_single_file(path):
                     show_snack("Файлът беше изтрит.", BTN_DELETE)
-                    remove_file_from_state(path, row_control)
+                    remove_file_from_state(path)
             except Exception as ex: show_snack(f"Грешка: {ex}", BTN_DELETE)
 
         dlg_single_delete.title = ft.Text("🚨 Системен файл!" if is_sys else "Потвърждение", color="#F87171" if is_sys else TEXT_PRIMARY, weight=ft.FontWeight.BOLD)
@@ -310,24 +458,22 @@ def main(page: ft.Page):
             page.update()
         def do_delete(e):
             dlg.open = False
-            files_to_delete = [f[0] for f in matched_files if f[0] in selected_files] if selected_files else [f[0] for f in matched_files]
-            count, err_count, success_files = batch_delete(files_to_delete)
-            for f_path in success_files: remove_file_from_state(f_path, None)
-            
-            msg = f"Успешно изтрити {count} файла."
-            if err_count > 0: msg += f" (Грешки: {err_count})"
-            show_snack(msg, BTN_DELETE if err_count == 0 else BTN_CUT)
-            redraw_tree() 
-            page.update()
+            files_to_delete = file_store.paths(file_store.target_ids())
+            submit_job("Изтриване", run_delete, files_to_delete, cb_prune.value)
         
-        target_count = len(selected_files) if selected_files else len(matched_files)
-        sys_in_target = any(is_sys for f_path, _, _, is_sys in matched_files if (not selected_files or f_path in selected_files))
+        cb_prune = ft.Checkbox(label="Премахни и папките, останали празни", value=False)
+        target_ids = file_store.target_ids()
+        target_count = len(target_ids)
+        sys_in_target = any(file_store.table.is_sys(i) for i in target_ids)
         
         dlg = ft.AlertDialog(
             modal=True, 
             bgcolor=BG_CONTAINER,
             title=ft.Text("🚨 КРИТИЧНО!" if sys_in_target else "Внимание!", color="#F87171" if sys_in_target else TEXT_PRIMARY, weight=ft.FontWeight.BOLD),
-            content=ft.Text(f"Ще изтриете {target_count} файла!{' (СИСТЕМНИ ФАЙЛОВЕ ОТКРИТИ)' if sys_in_target else ''}", color=TEXT_PRIMARY),
+            content=ft.Column([
+                ft.Text(f"Ще изтриете {target_count} файла!{' (СИСТЕМНИ ФАЙЛОВЕ ОТКРИТИ)' if sys_in_target else ''}", color=TEXT_PRIMARY),
+                cb_prune
+            ], tight=True),
             actions=[
                 ft.TextButton("Отказ", on_click=close_dlg, style=ft.ButtonStyle(color=TEXT_SECONDARY)), 
                 ft.TextButton(f"Да, изтрий {target_count}", on_click=do_delete, style=ft.ButtonStyle(color=BTN_DELETE, bgcolor="#450a0a"))
@@ -337,7 +483,136 @@ def main(page: ft.Page):
         dlg.open = True
         page.update()
 
-    def create_file_row(file_name, full_path, size, f_date, is_sys):
+    def run_duplicates(job):
+        with state_lock:
+            table = file_store.table
+            candidates = [(i, table.path(i), table.sizes[i], table.mtimes[i]) for i in table.ids()]
+        groups = find_duplicates(candidates, hash_cache, on_progress=job.report, cancel=job.token)
+        if groups is None:
+            show_snack("Търсенето на дубликати е прекъснато.", BTN_CUT)
+            return
+
+        with state_lock:
+            # Ново сканиране или компактиране по време на хеширането сменя таблицата - id-тата вече са чужди
+            if file_store.table is not table:
+                show_snack("Списъкът се промени по време на търсенето - пуснете го отново.", BTN_CUT)
+                return
+            # Във всяка група остава най-старият файл (оригиналът), а останалите се маркират за триене
+            flags = file_store.table.flags
+            groups = [g._replace(keys=[i for i in g.keys if not flags[i] & FLAG_DELETED]) for g in groups]
+            groups = [g for g in groups if len(g.keys) > 1]
+            file_store.clear_selection()
+            for g in groups:
+                keep = min(g.keys, key=lambda i: file_store.table.mtimes[i])
+                file_store.select([i for i in g.keys if i != keep])
+        redraw_tree()
+        update_dynamic_buttons()
+        if not groups: show_snack("Не са намерени дубликати.", BTN_COPY)
+        else: show_duplicates_dialog(groups)
+
+    def show_duplicates_dialog(groups):
+        def close_dlg(e):
+            dlg.open = False
+            page.update()
+        def delete_selected(e):
+            dlg.open = False
+            confirm_bulk_delete_dialog()
+        table = file_store.table
+        def make_toggle(file_id):
+            def toggle(e):
+                if file_store.table is not table: return  # id-тата са от предишна таблица
+                if e.control.value: file_store.select([file_id])
+                else: file_store.unselect([file_id])
+                update_dynamic_buttons()
+                redraw_tree()
+            return toggle
+
+        wasted = sum(g.size * (len(g.keys) - 1) for g in groups)
+        controls = []
+        # Диалогът не е виртуализиран - показват се групите с най-много освободимо място
+        for g in groups[:DUP_DIALOG_GROUPS]:
+            controls.append(ft.Text(f"{len(g.keys)} × {format_size(g.size)} | освободими {format_size(g.size * (len(g.keys) - 1))}",
+                                    color=ACCENT_BLUE, weight=ft.FontWeight.BOLD, size=13))
+            for file_id in g.keys:
+                controls.append(ft.Checkbox(label=file_store.table.path(file_id), value=file_store.table.is_selected(file_id),
+                                            on_change=make_toggle(file_id), label_style=ft.TextStyle(size=12, color=TEXT_PRIMARY)))
+        if len(groups) > DUP_DIALOG_GROUPS:
+            controls.append(ft.Text(f"... и още {len(groups) - DUP_DIALOG_GROUPS} групи (маркирани са и те)", color=TEXT_SECONDARY, italic=True))
+
+        dlg = ft.AlertDialog(
+            modal=True,
+            bgcolor=BG_CONTAINER,
+            title=ft.Text(f"Дубликати: {len(groups)} групи | освободими {format_size(wasted)}", color=TEXT_PRIMARY, weight=ft.FontWeight.BOLD),
+            content=ft.Container(ft.ListView(controls, spacing=2), width=750, height=450),
+            actions=[
+                ft.TextButton("Затвори", on_click=close_dlg, style=ft.ButtonStyle(color=TEXT_SECONDARY)),
+                ft.TextButton("Изтрий маркираните", on_click=delete_selected, style=ft.ButtonStyle(color=BTN_DELETE, bgcolor="#450a0a"))
+            ],
+        )
+        page.dialog = dlg
+        dlg.open = True
+        page.update()
+
+    def show_usage_dialog():
+        def close_dlg(e):
+            dlg.open = False
+            page.update()
+        def bar_rows(rows, total):
+            # (етикет, брой, байтове) -> ред с лента, пропорционална на дела от общия размер
+            return [ft.Row([
+                ft.Text(label, color=TEXT_PRIMARY, size=12, width=260, no_wrap=True, overflow=ft.TextOverflow.ELLIPSIS, tooltip=label),
+                ft.ProgressBar(value=(size / total) if total else 0, width=180, color=ACCENT_BLUE, bgcolor=BG_HOVER),
+                ft.Text(f"{format_size(size)} | {count} файла", color=TEXT_SECONDARY, size=12),
+            ], spacing=10) for label, count, size in rows]
+        def section(title):
+            return ft.Text(title, color=ACCENT_BLUE, weight=ft.FontWeight.BOLD, size=13)
+
+        with state_lock:
+            disk_usage.refresh()
+            total = file_store.total_size
+            root_path = file_store.root.path
+            files = [(file_store.table.path(i), 1, size) for i, size in disk_usage.top_files(USAGE_DIALOG_ROWS)]
+            dirs = [(os.path.relpath(node.path, root_path), count, size) for node, count, size in disk_usage.top_dirs(USAGE_DIALOG_ROWS)]
+            exts = [(ext or "(без разширение)", count, size) for ext, count, size in disk_usage.extensions(USAGE_DIALOG_ROWS)]
+            ages = disk_usage.ages()
+
+        controls = [section("Най-големи файлове"), *bar_rows(files, total),
+                    section("Най-големи папки"), *bar_rows(dirs, total),
+                    section("По разширение"), *bar_rows(exts, total),
+                    section("По възраст (дата на промяна)"), *bar_rows(ages, total)]
+        dlg = ft.AlertDialog(
+            modal=True,
+            bgcolor=BG_CONTAINER,
+            title=ft.Text(f"Анализ на мястото: {format_size(total)} в {len(file_store)} файла", color=TEXT_PRIMARY, weight=ft.FontWeight.BOLD),
+            content=ft.Container(ft.ListView(controls, spacing=4), width=750, height=450),
+            actions=[ft.TextButton("Затвори", on_click=close_dlg, style=ft.ButtonStyle(color=TEXT_SECONDARY))],
+        )
+        page.dialog = dlg
+        dlg.open = True
+        page.update()
+
+    def run_delete(job, files_to_delete, prune):
+        stats = Timings("delete")
+        count, err_count, success_files = batch_delete(files_to_delete, on_progress=job.report, cancel=job.token, stats=stats)
+        with stats.span("prune"):
+            pruned = prune_empty_dirs({os.path.dirname(p) for p in success_files}, target_folder[0]) if prune else []
+        last_timings["op"] = stats.finish()
+        remove_files_from_state(success_files)
+        with state_lock:
+            # Изтритите от диска папки излизат и от дървото (най-дълбоките са първи)
+            for d in pruned:
+                file_store.remove_tree(tuple(os.path.relpath(d, file_store.root.path).split(os.sep)))
+        
+        msg = f"Успешно изтрити {count} файла."
+        if job.cancelled: msg = f"Изтриването е прекъснато. Изтрити {count} файла."
+        if pruned: msg += f" Премахнати празни папки: {len(pruned)}."
+        if err_count > 0: msg += f" (Грешки: {err_count})"
+        show_snack(msg, BTN_DELETE if err_count == 0 else BTN_CUT)
+        redraw_tree() 
+        page.update()
+
+    def create_file_row(file_id):
+        file_name, full_path, size, f_date, is_sys = file_store.table.entry(file_id)
         file_color = "#FCA5A5" if is_sys else TEXT_PRIMARY
         
         ext = os.path.splitext(file_name)[1].lower()
@@ -355,13 +630,16 @@ def main(page: ft.Page):
         row = ft.Row(spacing=10, alignment=ft.MainAxisAlignment.SPACE_BETWEEN)
         date_str = f_date.strftime("%d/%m/%Y")
         
-        is_selected = full_path in selected_files
+        is_selected = file_store.table.is_selected(file_id)
         
+        table = file_store.table
+
         def on_toggle_select(e):
-            if full_path in selected_files: selected_files.discard(full_path)
-            else: selected_files.add(full_path)
+            if file_store.table is not table: return  # редът е от таблица преди компактиране - прерисуването идва
+            if file_store.table.is_selected(file_id): file_store.unselect([file_id])
+            else: file_store.select([file_id])
             update_dynamic_buttons()
-            is_sel = full_path in selected_files
+            is_sel = file_store.table.is_selected(file_id)
             btn_select.icon = ft.icons.CHECK_CIRCLE if is_sel else ft.icons.CIRCLE_OUTLINED
             btn_select.icon_color = ACCENT_BLUE if is_sel else BORDER_COLOR
             row_container.bgcolor = BG_SELECTED if is_sel else ft.colors.TRANSPARENT
@@ -390,9 +668,10 @@ def main(page: ft.Page):
         active_icon_rows.append(icons_group) 
         
         def on_hover(e):
+            if file_store.table is not table: return
             is_hover = e.data == "true"
-            is_sel = full_path in selected_files
-            if len(selected_files) == 0:  
+            is_sel = file_store.table.is_selected(file_id)
+            if file_store.selected_count == 0:  
                 icons_group.visible = is_hover
             if is_sel:
                 row_container.bgcolor = BG_SELECTED 
@@ -406,141 +685,145 @@ def main(page: ft.Page):
         row_container = ft.Container(
             content=row, on_hover=on_hover, padding=ft.padding.only(left=5, right=5, top=2, bottom=2), 
             border_radius=6, bgcolor=BG_SELECTED if is_selected else ft.colors.TRANSPARENT,
-            animate=ft.animation.Animation(150, "easeOut")
+            animate=ft.animation.Animation(150, "easeOut"), expand=True
         )
 
         btn_open = ft.IconButton(ft.icons.OPEN_IN_NEW, icon_size=15, width=26, height=26, padding=0, tooltip="Отвори файла", icon_color=TEXT_PRIMARY, 
                                  on_click=lambda e: open_system_file(full_path))
         btn_c = ft.IconButton(ft.icons.COPY, icon_size=15, width=26, height=26, padding=0, tooltip="Копирай", icon_color=ACCENT_BLUE, 
-                              on_click=lambda e: (single_action.update({"type": "copy", "path": full_path, "row": row_container}), single_action_picker.get_directory_path()))
+                              on_click=lambda e: (single_action.update({"type": "copy", "path": full_path}), single_action_picker.get_directory_path()))
         btn_cut = ft.IconButton(ft.icons.CUT, icon_size=15, width=26, height=26, padding=0, tooltip="Изрежи", icon_color=BTN_CUT, 
-                                on_click=lambda e: prompt_single_cut(full_path, row_container, is_sys))
+                                on_click=lambda e: prompt_single_cut(full_path, is_sys))
         btn_del = ft.IconButton(ft.icons.DELETE, icon_size=15, width=26, height=26, padding=0, tooltip="Изтрий", icon_color=BTN_DELETE, 
-                                on_click=lambda e: prompt_single_delete(full_path, row_container, is_sys))
+                                on_click=lambda e: prompt_single_delete(full_path, is_sys))
         
         icons_group.controls = [btn_open, btn_c, btn_cut, btn_del]
         row.controls = [btn_select, lbl_name, lbl_size, lbl_date, icons_group]
         
         return row_container
 
+    def schedule_search():
+        # Debounce: всяка буква отлага търсенето, прилага се само последната стойност
+        if search_timer[0]: search_timer[0].cancel()
+        search_timer[0] = threading.Timer(SEARCH_DEBOUNCE_DELAY, apply_search)
+        search_timer[0].daemon = True
+        search_timer[0].start()
+
+    def apply_search():
+        search_query = tf_search.value.lower().strip() if tf_search.value else ""
+        if search_query == applied_query[0]: return
+        redraw_tree()
+        page.update()
+
     def redraw_tree():
-        if not global_root_node[0]: return
-        results_list.controls.clear()
+        # Дървото може да се допълва от нишката за сканиране докато се прерисува
+        with state_lock:
+            _redraw_tree()
+
+    def _redraw_tree():
+        if file_store.root is None: return
+        stats = Timings("redraw")
         active_icon_rows.clear() 
-        ui_count[0] = 0
-        limit_reached[0] = False
         
         # Взимаме стойността от търсачката (Live Search)
         search_query = tf_search.value.lower().strip() if tf_search.value else ""
+        applied_query[0] = search_query
         
-        def sort_files(files_list):
-            rev = not sort_asc[0]
-            if dd_sort.value == "Размер": files_list.sort(key=lambda x: (x[2], natural_sort_key(x[0])), reverse=rev)
-            elif dd_sort.value == "Дата": files_list.sort(key=lambda x: (x[3], natural_sort_key(x[0])), reverse=rev)
-            elif dd_sort.value == "Тип": files_list.sort(key=lambda x: (os.path.splitext(x[0])[1].lower(), natural_sort_key(x[0])), reverse=rev)
-            else: files_list.sort(key=lambda x: natural_sort_key(x[0]), reverse=rev)
-
-        def build_ui_tree(node, current_path=target_folder[0]):
-            elements = []
-            sorted_dirs = sorted(node.children.keys(), key=natural_sort_key, reverse=(not sort_asc[0]))
-            
-            for child_name in sorted_dirs:
-                if limit_reached[0]: break 
-                child_node = node.children[child_name]
-                child_path = os.path.join(current_path, child_name)
-                
-                child_ui_elements = build_ui_tree(child_node, child_path)
-                
-                # НОВО: Ако сме въвели търсене и папката няма съвпадащи файлове или подпапки, я крием!
-                if search_query and not child_ui_elements and search_query not in child_name.lower():
-                    continue
-                
-                if not child_ui_elements:
-                    child_ui_elements.append(ft.Text(" (Празна)", color=TEXT_SECONDARY, italic=True, size=11))
-                
-                def get_all_files(n):
-                    res = [f[1] for f in n.files]
-                    for c in n.children.values(): res.extend(get_all_files(c))
-                    return res
-                    
-                paths_in_folder = get_all_files(child_node)
-                file_count = len(paths_in_folder) # Взимаме бройката файлове
-                all_selected = all(p in selected_files for p in paths_in_folder) if file_count > 0 else False
-                
-                def make_folder_toggle(paths, is_sel):
-                    def toggle(e):
-                        if is_sel:
-                            for p in paths: selected_files.discard(p)
-                        else:
-                            for p in paths: selected_files.add(p)
-                        update_dynamic_buttons()
-                        redraw_tree() 
-                    return toggle
-                
-                # --- НОВО: Индикация за празни папки и брой файлове ---
-                if file_count > 0:
-                    folder_cb = ft.IconButton(
-                        icon=ft.icons.CHECK_CIRCLE if all_selected else ft.icons.CIRCLE_OUTLINED,
-                        icon_color=ACCENT_BLUE if all_selected else BORDER_COLOR,
-                        icon_size=18, width=28, height=28, padding=0,
-                        on_click=make_folder_toggle(paths_in_folder, all_selected),
-                        tooltip=f"Маркирай всички {file_count} файла"
-                    )
-                    display_name = f"{child_name}  ({file_count})"
-                else:
-                    # Показваме тъмносива, "заключена" иконка за празните папки
-                    folder_cb = ft.IconButton(
-                        icon=ft.icons.REMOVE_CIRCLE_OUTLINE, 
-                        icon_color="#252833", 
-                        icon_size=18, width=28, height=28, padding=0,
-                        disabled=True,
-                        tooltip="Празна папка"
-                    )
-                    display_name = f"{child_name}  (0)"
-                
-                is_expanded = True if search_query else (child_path in expanded_dirs)
-                
-                def make_toggle(cp):
-                    def toggle(expanded):
-                        if expanded: expanded_dirs.add(cp)
-                        else: expanded_dirs.discard(cp)
-                    return toggle
-
-                elements.append(CollapsibleDirectory(
-                    display_name, # Подаваме новото умно име
-                    child_ui_elements, 
-                    auto_expand=is_expanded, 
-                    folder_checkbox=folder_cb,
-                    on_toggle_expand=make_toggle(child_path) 
-                ))
-                    
-            sort_files(node.files)
-            for file_name, full_path, size, f_date, is_sys in node.files:
-                # НОВО: Филтриране на самите файлове спрямо търсачката
-                if search_query and search_query not in file_name.lower():
-                    continue
-
-                if ui_count[0] >= MAX_UI_FILES:
-                    if not limit_reached[0]:
-                        elements.append(ft.Text(f"⚠️ Още {len(matched_files) - MAX_UI_FILES} скрити файла.", color="#F59E0B", italic=True, size=12))
-                        limit_reached[0] = True
-                    break
-                ui_count[0] += 1
-                elements.append(create_file_row(file_name, full_path, size, f_date, is_sys))
-            return elements
-
-        if len(matched_files) == 0:
+        table = file_store.table
+
+        # Подредбите са кеширани по папка и колона - смяната на посоката само обръща изгледа
+        column = SORT_COLUMN_BY_LABEL.get(dd_sort.value, "name")
+        reverse = not sort_asc[0]
+
+        def sorted_dir_names(node):
+            return sort_cache.dir_order(node, reverse)
+
+        def sorted_file_ids(node, ids):
+            return sort_cache.file_order(node, column, reverse, ids)
+
+        if len(file_store) == 0:
             results_list.controls = [empty_state]
         else:
-            rendered_tree = build_ui_tree(global_root_node[0])
+            # Плоският списък е евтин (само разгънатите папки), а контроли се правят само за видимите редове
+            # При търсене съвпаденията идват от индекса, а не от обхождане на всички файлове
+            with stats.span("search"):
+                matches = group_matches(table, search_index.search(search_query)) if search_query else None
+            with stats.span("flatten"):
+                rows = flatten_tree(file_store.root, expanded_dirs, sorted_dir_names, sorted_file_ids, search_query, matches)
+            stats.count("rows", len(rows))
             # Ако при търсенето не е намерено нищо, показваме празен екран
-            if not rendered_tree and search_query:
+            if not rows and search_query:
                 results_list.controls = [ft.Container(ft.Text(f'Няма намерени файлове за "{search_query}"', color=TEXT_SECONDARY, italic=True), padding=20)]
             else:
-                results_list.controls = rendered_tree
+                with stats.span("render"):
+                    virtual_tree.set_rows(rows)
+                stats.count("controls", virtual_tree.window[1] - virtual_tree.window[0])
             
+        # Прерисуванията са чести - в app.log отиват само бавните
+        last_timings["redraw"] = stats.finish(PROFILE_LOG_THRESHOLD)
         update_summary_text()
 
+    def build_tree_row(row):
+        kind, depth, payload, path, is_expanded = row
+        if kind == ROW_FILE:
+            # Изтрит след последното прерисуване (напр. от друга нишка) - празен ред до следващото
+            if file_store.table.flags[payload] & FLAG_DELETED: return ft.Container()
+            return ft.Row(indent_guides(depth) + [create_file_row(payload)], spacing=0)
+        if kind == ROW_EMPTY:
+            return ft.Row(indent_guides(depth) + [ft.Text(" (Празна)", color=TEXT_SECONDARY, italic=True, size=11)], spacing=0)
+
+        child_node = payload
+        # Бройките идват от агрегатите на TreeNode - O(1) за всяка папка
+        file_count = child_node.file_count
+        all_selected = file_count > 0 and child_node.selected_count == file_count
+        
+        def make_folder_toggle(folder_node, is_sel):
+            def toggle(e):
+                file_ids = list(folder_node.iter_file_ids())
+                if is_sel: file_store.unselect(file_ids)
+                else: file_store.select(file_ids)
+                update_dynamic_buttons()
+                redraw_tree() 
+            return toggle
+        
+        # --- Индикация за празни папки и брой файлове ---
+        if file_count > 0:
+            folder_cb = ft.IconButton(
+                icon=ft.icons.CHECK_CIRCLE if all_selected else ft.icons.CIRCLE_OUTLINED,
+                icon_color=ACCENT_BLUE if all_selected else BORDER_COLOR,
+                icon_size=18, width=28, height=28, padding=0,
+                on_click=make_folder_toggle(child_node, all_selected),
+                tooltip=f"Маркирай всички {file_count} файла"
+            )
+            display_name = f"{child_node.name}  ({file_count})"
+        else:
+            # Показваме тъмносива, "заключена" иконка за празните папки
+            folder_cb = ft.IconButton(
+                icon=ft.icons.REMOVE_CIRCLE_OUTLINE, 
+                icon_color="#252833", 
+                icon_size=18, width=28, height=28, padding=0,
+                disabled=True,
+                tooltip="Празна папка"
+            )
+            display_name = f"{child_node.name}  (0)"
+        
+        def make_toggle(cp):
+            def toggle(expanded):
+                if expanded: expanded_dirs.add(cp)
+                else: expanded_dirs.discard(cp)
+                redraw_tree()
+                page.update()
+            return toggle
+
+        return CollapsibleDirectory(
+            display_name,
+            None, # плосък ред - съдържанието е в следващите редове на списъка
+            auto_expand=is_expanded, 
+            folder_checkbox=folder_cb,
+            on_toggle_expand=make_toggle(path),
+            depth=depth
+        )
+
     def do_scan(e):
         date_format = "%d/%m/%Y"
         try:
@@ -553,44 +836,107 @@ def main(page: ft.Page):
         start_date = datetime.combine(start_date_obj, time.min)
         end_date = datetime.combine(end_date_obj, time.max)
         raw_exts = [x.strip().lower() for x in tf_ext.value.split(',')] if tf_ext.value else []
-        valid_exts = [ext if ext.startswith('.') else f".{ext}" for ext in raw_exts if ext]
+        # "pdf" -> ".pdf"; шаблоните (report_*.pdf, docs/*.md) остават както са
+        valid_exts = [ext if ext.startswith('.') or any(c in ext for c in "*?[/") else f".{ext}" for ext in raw_exts if ext]
+        exclude = tuple(x.strip() for x in tf_exclude.value.replace("\n", ",").split(',') if x.strip()) if tf_exclude.value else ()
+
+        set_scanning(True)
 
-        matched_files.clear()
-        selected_files.clear() 
+        # Същата папка само с други филтри се отговаря изцяло от индекса, без достъп до диска
+        # Изключените папки са в индекса само като празни записи, така че при други изключвания се минава по диска
+        filters = (start_date, end_date, tuple(valid_exts), exclude)
+        refresh_index = not (last_scan["folder"] == target_folder[0] and last_scan["filters"] != filters
+                             and last_scan["filters"][3] == exclude)
+        last_scan.update(folder=target_folder[0], filters=filters)
+
+        # Сканирането е фонова задача, а дървото се допълва порция по порция
+        scan_job[0] = submit_job("Сканиране", run_scan, target_folder[0], start_date, end_date, valid_exts, exclude, refresh_index)
+
+    def set_scanning(active):
+        btn_scan.disabled = active
+        btn_scan.visible = not active
+        btn_cancel_scan.visible = active
+        btn_cancel_scan.disabled = False
+        btn_cancel_scan.text = "⛔ Спри сканирането"
+        progress_ring.visible = active
+        page.update()
+
+    def cancel_scan(e):
+        job = scan_job[0]
+        if job is None: return
+        btn_cancel_scan.disabled = True
+        btn_cancel_scan.text = "Спиране..."
+        page.update()
+        was_queued = job.status == QUEUED
+        job.cancel()
+        # Задача, отказана още в опашката, изобщо не стига до run_scan
+        if was_queued: set_scanning(False)
+
+    def run_scan(job, folder, start_date, end_date, valid_exts, exclude, refresh_index):
+        stop_watcher()
+        with state_lock:
+            file_store.reset(folder)
+        root_node = file_store.root
         expanded_dirs.clear() 
         tf_search.value = "" # Изчистваме търсачката при ново сканиране
-        
-        btn_scan.disabled = True
-        progress_ring.visible = True
-        lbl_summary.value = f"Сканиране на: {target_folder[0]}..."
+        results_list.controls = [empty_state]
+        lbl_summary.value = f"Сканиране на: {folder}..."
         page.update()
 
-        root_node, files, _, has_sys = scan_directory(target_folder[0], start_date, end_date, valid_exts)
-        
-        matched_files.extend(files)
-        has_system_files[0] = has_sys
-        global_root_node[0] = root_node
-        auto_expand_all[0] = len(matched_files) < 30
+        last_refresh = perf_counter()
+        # Пауза/отказ от панела или бутона се проверяват и между папките, и вътре в огромните папки
+        budget = ScanBudget(job.token, SCAN_TIME_BUDGET, SCAN_FILE_BUDGET)
+        stats = Timings("scan")
+        last_timings.pop("scan", None)
+        batches = iter_scan_directory(folder, start_date, end_date, valid_exts, max_workers=SCAN_MAX_WORKERS,
+                                      index=scan_index, refresh_index=refresh_index, budget=budget, exclude=exclude, stats=stats)
+        try:
+            for parts, files in batches:
+                with state_lock, stats.span("tree"):
+                    file_store.add_batch(parts, files)
+
+                # Throttling: прерисуваме най-много веднъж на SCAN_REFRESH_INTERVAL секунди
+                if perf_counter() - last_refresh >= SCAN_REFRESH_INTERVAL:
+                    redraw_tree()
+                    lbl_summary.value = f"Сканиране на: {folder}... ({len(file_store)} файла)"
+                    job.report(f"{len(file_store)} файла")
+                    last_refresh = perf_counter()
+        except Exception as ex:
+            last_scan.update(folder=None, filters=None)
+            show_snack(f"Грешка при сканиране: {ex}", BTN_DELETE)
+        finally:
+            batches.close()
+        if budget.reason is not None:
+            # Частичен резултат - следващото сканиране на папката трябва да мине по диска
+            last_scan.update(folder=None, filters=None)
+            reason = {SCAN_CANCELLED: "спряно", SCAN_TIME_LIMIT: "достигнат лимит на времето"}.get(budget.reason, "достигнат лимит на файловете")
+            show_snack(f"Сканирането е прекъснато ({reason}) - показани са {len(file_store)} намерени файла.", BTN_CUT)
+
+        # Анализът се смята веднага, за да е готов при отваряне
+        with state_lock, stats.span("analytics"):
+            disk_usage.refresh()
+        last_timings["scan"] = stats.finish()
+        auto_expand_all[0] = len(file_store) < 30
         
         if auto_expand_all[0]:
-            def pop_expanded(n, p):
-                for c_name, c_node in n.children.items():
-                    cp = os.path.join(p, c_name)
-                    expanded_dirs.add(cp)
-                    pop_expanded(c_node, cp)
-            pop_expanded(global_root_node[0], target_folder[0])
+            def pop_expanded(n):
+                for c_node in n.children.values():
+                    expanded_dirs.add(c_node.path)
+                    pop_expanded(c_node)
+            pop_expanded(root_node)
         
         redraw_tree() 
         
-        btn_scan.disabled = False
-        progress_ring.visible = False
-        page.update()
+        set_scanning(False)
+        start_watcher()
 
     # ==============================================================
     # 3. СВЪРЗВАНЕ НА БУТОНИТЕ
     # ==============================================================
     btn_select_folder.on_click = lambda _: scan_picker.get_directory_path()
     btn_scan.on_click = do_scan
+    btn_cancel_scan.on_click = cancel_scan
+    sw_watch.on_change = on_watch_toggle
     
     def toggle_sort_dir(e):
         sort_asc[0] = not sort_asc[0]
@@ -602,8 +948,10 @@ def main(page: ft.Page):
 
     btn_copy.on_click = lambda _: copy_picker.get_directory_path()
     btn_cut_bulk.on_click = lambda _: cut_bulk_picker.get_directory_path()
-    btn_export.on_click = lambda _: export_picker.save_file(allowed_extensions=["txt", "csv"], file_name="Search_Report.txt")
+    btn_export.on_click = lambda _: export_picker.save_file(allowed_extensions=["txt", "csv", "jsonl", "gz", "xz"], file_name="Search_Report.txt")
     btn_delete.on_click = lambda _: confirm_bulk_delete_dialog()
+    btn_dupes.on_click = lambda _: submit_job("Дубликати", run_duplicates)
+    btn_usage.on_click = lambda _: show_usage_dialog()
 
     quick_dates_row = ft.Row([
         ft.TextButton("Днес", on_click=lambda _: set_quick_date(0), style=ft.ButtonStyle(color=ACCENT_BLUE)),
@@ -622,11 +970,13 @@ def main(page: ft.Page):
             ft.Row([tf_start, tf_end], spacing=10),
             ft.Container(height=10),
             tf_ext,
+            ft.Container(height=10),
+            tf_exclude,
         ]
     )
 
     toolbar = ft.Container(
-        content=ft.Row([btn_copy, btn_cut_bulk, btn_export, btn_delete], alignment=ft.MainAxisAlignment.CENTER, spacing=15),
+        content=ft.Row([btn_copy, btn_cut_bulk, btn_export, btn_delete, btn_dupes, btn_usage], alignment=ft.MainAxisAlignment.CENTER, spacing=15),
         bgcolor=BG_SIDEBAR,
         padding=10,
         border_radius=12,
@@ -652,7 +1002,10 @@ def main(page: ft.Page):
             advanced_filters,
             ft.Divider(color=ft.colors.TRANSPARENT, height=15),
             btn_scan,
-            ft.Row([progress_ring], alignment=ft.MainAxisAlignment.CENTER)
+            btn_cancel_scan,
+            ft.Row([progress_ring], alignment=ft.MainAxisAlignment.CENTER),
+            sw_watch,
+            cb_profile
         ], scroll=ft.ScrollMode.AUTO)
     )
 
@@ -669,6 +1022,7 @@ def main(page: ft.Page):
                 btn_sort_dir
             ], alignment=ft.MainAxisAlignment.START),
             lbl_summary,
+            op_panel,
             results_container,
             toolbar
         ])
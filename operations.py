@@ -1,8 +1,13 @@
 import os
-import shutil
 import logging
-from datetime import datetime
-from utils import format_size, SYSTEM_PATHS, SYSTEM_EXTS, TreeNode
+from collections import Counter
+from contextlib import nullcontext
+from time import perf_counter
+from utils import walk_dirs, SCAN_CANCEL_CHECK, FileStore
+from scan_rules import ScanRules, rel_prefix
+from system_shield import SystemShield, ShieldWalk
+from export import write_report
+from transfer import plan_transfers, run_transfers, copy_file, move_file, delete_files, prune_empty_dirs
 
 logging.basicConfig(
     filename='app.log', 
@@ -11,54 +16,156 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
-def scan_directory(target_folder, start_date, end_date, valid_exts):
-    matched_files = []
-    has_system_files = False
-    total_size_bytes = 0
-    root_node = TreeNode("root")
+SCAN_CANCELLED, SCAN_TIME_LIMIT, SCAN_FILE_LIMIT = "cancelled", "time", "files"
 
+class ScanBudget:
+    """Отказ и лимити за едно сканиране. Подава се на обхождането като cancel (вика се само is_set()).
+
+    Часовникът тръгва при създаването. reason е None, докато сканирането не бъде спряно -
+    след това е SCAN_CANCELLED, SCAN_TIME_LIMIT или SCAN_FILE_LIMIT, а резултатът е частичен.
+    """
+
+    def __init__(self, cancel=None, time_budget=None, max_files=None):
+        self.cancel = cancel
+        self.deadline = perf_counter() + time_budget if time_budget is not None else None
+        self.max_files = max_files
+        self.files = 0
+        self.reason = None
+
+    def is_set(self):
+        if self.reason is None:
+            if self.cancel is not None and self.cancel.is_set(): self.reason = SCAN_CANCELLED
+            elif self.deadline is not None and perf_counter() >= self.deadline: self.reason = SCAN_TIME_LIMIT
+            elif self.max_files is not None and self.files >= self.max_files: self.reason = SCAN_FILE_LIMIT
+        return self.reason is not None
+
+def _scan_dir(dir_path, start_ts, end_ts, rules, prefix="", cancel=None, stats=None):
+    # Едно listing на папка: os.scandir + по един stat на запис (кеширан от DirEntry).
+    # Изключените папки изобщо не стават подпапки за обхождане, а филтрираните файлове - не се stat-ват.
+    # В огромна папка отказът се проверява на всеки SCAN_CANCEL_CHECK записа.
+    # Броячите за stats (Timings) се трупат локално и се подават веднъж за папката.
+    started = perf_counter()
+    files_in_range, sub_dirs = [], []
+    n = stat_calls = pruned = 0
+    try:
+        with os.scandir(dir_path) as it:
+            for n, entry in enumerate(it, 1):
+                if cancel is not None and n % SCAN_CANCEL_CHECK == 0 and cancel.is_set(): break
+                try:
+                    if entry.is_dir():
+                        # Като os.walk: symlink-ове към папки не се обхождат
+                        if entry.is_symlink(): continue
+                        if rules.skip_dir(prefix, entry.name):
+                            pruned += 1
+                            continue
+                        stat_calls += 1
+                        try: sub_mtime = entry.stat().st_mtime
+                        except OSError: sub_mtime = None
+                        sub_dirs.append((entry.name, entry.path, sub_mtime))
+                        continue
+                    name = entry.name
+                    if not rules.match_file(prefix, name): continue
+                    stat_calls += 1
+                    st = entry.stat()
+                    if start_ts <= st.st_mtime <= end_ts:
+                        files_in_range.append((name, entry.path, st.st_size, st.st_mtime))
+                except OSError: pass
+    except OSError: pass
+    if stats is not None:
+        stats.add_time("walk", perf_counter() - started)
+        stats.count_many(dirs=1, entries=n, stat=stat_calls, pruned=pruned)
+    return files_in_range, sub_dirs
+
+def _walk_dirs(target_folder, start_ts, end_ts, rules, rel_base="", max_workers=1, cancel=None, stats=None):
+    # Генерира (части спрямо корена, mtime на папката, файлове в периода) в top-down ред
+    root_len = len(target_folder)
+    list_dir = lambda dir_path, _: _scan_dir(dir_path, start_ts, end_ts, rules, rel_base + rel_prefix(root_len, dir_path), cancel, stats)
+    for parts, _, dir_mtime, files_in_range in walk_dirs(target_folder, list_dir, max_workers, cancel):
+        yield parts, dir_mtime, files_in_range
+
+def match_file(full_path, start_ts, end_ts, rules, rel_parts=None, shield=None):
+    # Проверява единичен файл със същите филтри като сканирането; връща (име, размер, mtime, системен) или None.
+    # rel_parts са частите на пътя спрямо корена на сканирането - нужни за шаблоните по път и изключените папки.
+    name = os.path.basename(full_path)
+    dir_parts = tuple(rel_parts[:-1]) if rel_parts else ()
+    if rules.skip_path(dir_parts) or not rules.match_file("".join(p + "/" for p in dir_parts), name): return None
+    try: st = os.stat(full_path)
+    except OSError: return None
+    if not (start_ts <= st.st_mtime <= end_ts): return None
+    return (name, st.st_size, st.st_mtime, (shield or SystemShield()).classify_path(full_path))
+
+def _filter_walk(walk, start_ts, end_ts, rules, rel_base=""):
+    # Прилага филтрите върху нефилтрирано обхождане (напр. от ScanIndex); изключените папки са отрязани още в него
+    for parts, dir_mtime, files in walk:
+        prefix = rel_base + "".join(p + "/" for p in parts)
+        yield parts, dir_mtime, [
+            f for f in files
+            if start_ts <= f[3] <= end_ts and rules.match_file(prefix, f[0])
+        ]
+
+def iter_scan_directory(target_folder, start_date, end_date, valid_exts, max_workers=1, index=None, refresh_index=True, budget=None,
+                        exclude=(), rel_base="", shield=None, stats=None):
+    # Стрийминг форма на сканирането: по една порция (части на пътя, файлове) за всяка папка,
+    # която има съвпадения или самата попада в периода. Файловете са (име, размер, mtime, системен).
+    # С index (ScanIndex) се listing-ват само променените папки, а при refresh_index=False
+    # отговорът идва изцяло от индекса, без достъп до диска. С budget (ScanBudget) порциите
+    # спират при отказ или изчерпан лимит - дотук подадените остават валиден частичен резултат.
+    # valid_exts (разширения или шаблони) и exclude са шаблони като в .gitignore (виж ScanRules);
+    # rel_base е пътят на target_folder спрямо корена на шаблоните, ако се сканира поддърво.
+    # Системните папки се решават веднъж на папка от shield (по подразбиране SYSTEM_PATHS/SYSTEM_EXTS).
+    # stats (profiling.Timings) получава времената на фазите и броячите: папки, stat, съвпадения.
     target_folder = os.path.normpath(os.path.abspath(target_folder))
+    # Границите и филтрите се подготвят веднъж - всеки файл се сравнява само като float и set/regex
+    start_ts, end_ts = start_date.timestamp(), end_date.timestamp()
+    rules = ScanRules(valid_exts or (), exclude)
+    shield = shield or SystemShield()
+    shield_walk = ShieldWalk(shield, target_folder)
 
-    for root, dirs, files in os.walk(target_folder):
-        dir_in_range = False
-        try:
-            dir_mtime = os.path.getmtime(root)
-            dir_date = datetime.fromtimestamp(dir_mtime)
-            if start_date <= dir_date <= end_date:
-                dir_in_range = True
-        except (PermissionError, FileNotFoundError): pass
-
-        valid_files_in_dir = []
-        for file in files:
-            if valid_exts and not any(file.lower().endswith(ext) for ext in valid_exts): continue
-            full_path = os.path.normpath(os.path.join(root, file))
-            try:
-                mtime = os.path.getmtime(full_path)
-                file_date = datetime.fromtimestamp(mtime)
-                if start_date <= file_date <= end_date:
-                    size = os.path.getsize(full_path)
-                    abs_path = os.path.abspath(full_path).lower()
-                    _, ext = os.path.splitext(file)
-                    is_sys = ext.lower() in SYSTEM_EXTS or any(abs_path.startswith(p) for p in SYSTEM_PATHS)
-                    if is_sys: has_system_files = True
-                    
-                    valid_files_in_dir.append((file, full_path, size, file_date, is_sys))
-                    matched_files.append((full_path, size, file_date, is_sys))
-                    total_size_bytes += size
-            except (PermissionError, FileNotFoundError): pass
-
-        if valid_files_in_dir or dir_in_range:
-            rel_path = os.path.relpath(root, target_folder)
-            current_node = root_node
-            if rel_path != '.':
-                parts = rel_path.split(os.sep)
-                for part in parts:
-                    if part not in current_node.children:
-                        current_node.children[part] = TreeNode(part)
-                    current_node = current_node.children[part]
-            current_node.files.extend(valid_files_in_dir)
-            
-    return root_node, matched_files, total_size_bytes, has_system_files
+    if index is None:
+        walk = _walk_dirs(target_folder, start_ts, end_ts, rules, rel_base, max_workers, budget, stats)
+    else:
+        root_len = len(target_folder)
+        # Относителните пътища са като при _walk_dirs - с rel_base отпред, иначе шаблоните по път биха се разминали
+        skip_dir = lambda dir_path, name: rules.skip_dir(rel_base + rel_prefix(root_len, dir_path), name)
+        raw_walk = (index.refresh(target_folder, max_workers, budget, skip_dir, stats) if refresh_index
+                    else index.walk(target_folder, skip_dir, stats))
+        walk = _filter_walk(raw_walk, start_ts, end_ts, rules, rel_base)
+
+    try:
+        for parts, dir_mtime, files_in_range in walk:
+            if budget is not None and budget.is_set(): break
+            started = perf_counter()
+            dir_in_range = dir_mtime is not None and start_ts <= dir_mtime <= end_ts
+            dir_is_sys = shield_walk.dir_is_system(parts)
+            is_system_file = shield.is_system_file
+            valid_files_in_dir = [
+                (name, size, mtime, is_system_file(dir_is_sys, name))
+                for name, full_path, size, mtime in files_in_range
+            ]
+            if budget is not None:
+                if budget.max_files is not None: valid_files_in_dir = valid_files_in_dir[:budget.max_files - budget.files]
+                budget.files += len(valid_files_in_dir)
+            if stats is not None:
+                stats.add_time("classify", perf_counter() - started)
+                stats.count("matched", len(valid_files_in_dir))
+            if valid_files_in_dir or dir_in_range:
+                yield parts, valid_files_in_dir
+    finally:
+        # Затваря обхождането веднага (пул, връзка към индекса), а не чак при събиране на боклука
+        walk.close()
+
+def scan_directory(target_folder, start_date, end_date, valid_exts, max_workers=1, index=None, refresh_index=True, budget=None,
+                   exclude=(), shield=None, stats=None):
+    # matched_files е FileTable - итерира и индексира като списък от (път, размер, дата, системен).
+    # При спиране от budget резултатът е частичен, а причината е в budget.reason.
+    store = FileStore()
+    store.reset(target_folder)
+    for parts, files in iter_scan_directory(target_folder, start_date, end_date, valid_exts, max_workers, index, refresh_index, budget, exclude,
+                                            shield=shield, stats=stats):
+        if stats is None: store.add_batch(parts, files)
+        else:
+            with stats.span("tree"): store.add_batch(parts, files)
+    return store.root, store.table, store.total_size, store.has_system_files
 
 def copy_single_file(src_path, dest_folder):
     try:
@@ -69,19 +176,27 @@ def copy_single_file(src_path, dest_folder):
         if src_path == final_dest:
             return False
             
-        shutil.copy2(src_path, final_dest)
+        method = copy_file(src_path, final_dest, os.path.getsize(src_path), lambda n: None)
+        logging.info(f"Копиран файл: {src_path} -> {final_dest} ({method})")
         return True
     except Exception:
         return False
 
 def cut_single_file(src_path, dest_folder):
-    if copy_single_file(src_path, dest_folder):
-        try:
-            os.remove(os.path.normpath(os.path.abspath(src_path)))
-            return True
-        except Exception:
+    try:
+        src_path = os.path.normpath(os.path.abspath(src_path))
+        dest_folder = os.path.normpath(os.path.abspath(dest_folder))
+        final_dest = os.path.join(dest_folder, os.path.basename(src_path))
+
+        if src_path == final_dest:
             return False
-    return False
+
+        # Първо rename - при друго устройство move_file сам пада към проверено копие + триене
+        method = move_file(src_path, final_dest, os.path.getsize(src_path), lambda n: None)
+        logging.info(f"Преместен файл: {src_path} -> {final_dest} ({method})")
+        return True
+    except Exception:
+        return False
 
 def delete_single_file(src_path):
     try:
@@ -94,69 +209,57 @@ def delete_single_file(src_path):
         return False
 
 # --- МАСОВИ ОПЕРАЦИИ ---
-def batch_copy(files_list, dest_folder, target_folder):
-    count, err_count = 0, 0
-    target_folder = os.path.normpath(os.path.abspath(target_folder))
-    dest_folder = os.path.normpath(os.path.abspath(dest_folder))
+def _timed(stats, phase):
+    return stats.span(phase) if stats is not None else nullcontext()
 
-    for f_path in files_list:
-        try:
-            abs_f_path = os.path.normpath(os.path.abspath(f_path))
-            rel_path = os.path.relpath(abs_f_path, target_folder)
-            final_dest = os.path.join(dest_folder, rel_path)
-            
-            if abs_f_path == os.path.abspath(final_dest): continue
-            
-            os.makedirs(os.path.dirname(final_dest), exist_ok=True)
-            shutil.copy2(abs_f_path, final_dest)
-            count += 1
-        except Exception:
-            err_count += 1
+def _count_transfers(stats, tasks, results, err_count):
+    if stats is None: return
+    stats.count_many(files=sum(1 for status in results if status), errors=err_count,
+                     bytes=sum(task.size for task, status in zip(tasks, results) if status))
+
+def batch_copy(files_list, dest_folder, target_folder, on_progress=None, cancel=None, stats=None):
+    # Паралелно копиране със запазена структура; on_progress получава TransferProgress, cancel е threading.Event
+    with _timed(stats, "plan"):
+        tasks, err_count = plan_transfers(files_list, dest_folder, target_folder)
+    with _timed(stats, "transfer"):
+        results = run_transfers(tasks, copy_file, on_progress, cancel)
+    count = sum(1 for status in results if status)
+    err_count += sum(1 for status in results if status is False)
+    # Кой механизъм е копирал колко файла (reflink, copy_file_range, sendfile, userspace)
+    methods = Counter(status for status in results if status)
+    logging.info(f"Копирани {count} файла в {dest_folder}: " + ", ".join(f"{m}={n}" for m, n in methods.items()))
+    _count_transfers(stats, tasks, results, err_count)
     return count, err_count
 
-def batch_cut(files_list, dest_folder, target_folder):
-    count, err_count, success_files = 0, 0, []
-    target_folder = os.path.normpath(os.path.abspath(target_folder))
-    dest_folder = os.path.normpath(os.path.abspath(dest_folder))
-    
-    for f_path in files_list:
-        try:
-            abs_f_path = os.path.normpath(os.path.abspath(f_path))
-            rel_path = os.path.relpath(abs_f_path, target_folder)
-            final_dest = os.path.join(dest_folder, rel_path)
-            
-            if abs_f_path == os.path.abspath(final_dest): continue
-            
-            os.makedirs(os.path.dirname(final_dest), exist_ok=True)
-            shutil.copy2(abs_f_path, final_dest)
-            os.remove(abs_f_path)
-            count += 1
-            success_files.append(f_path)
-        except Exception: err_count += 1
-    return count, err_count, success_files
-
-def batch_delete(files_list):
-    count, err_count, success_files = 0, 0, []
-    for f_path in files_list:
-        try:
-            abs_path = os.path.normpath(os.path.abspath(f_path))
-            os.remove(abs_path)
-            count += 1
-            success_files.append(f_path)
-        except Exception: err_count += 1
-    return count, err_count, success_files
-
-def generate_export_report(file_path, matched_files, selected_files, target_folder):
-    files_to_process = [f for f in matched_files if f[0] in selected_files] if selected_files else matched_files
-    is_subset = len(selected_files) > 0
-    target_str = "ИЗБРАНИ" if is_subset else "ВСИЧКИ"
-    
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write("=" * 60 + "\n")
-        f.write(f"ОТЧЕТ ОТ СКАНИРАНЕ ({target_str}): {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"Сканирана директория: {target_folder}\n")
-        f.write(f"Общо включени файлове: {len(files_to_process)}\n\n")
-        for f_path, f_size, f_date, is_sys in files_to_process:
-            sys_tag = "[СИСТЕМЕН] " if is_sys else ""
-            date_str = f_date.strftime("%d/%m/%Y %H:%M")
-            f.write(f"{sys_tag}{f_path} | Размер: {format_size(f_size)} | Дата: {date_str}\n")
\ No newline at end of file
+def batch_cut(files_list, dest_folder, target_folder, on_progress=None, cancel=None, stats=None):
+    # Файловете са групирани по устройство още в плана: на същото st_dev - атомарен rename,
+    # между устройства - поточно копие с проверка и чак тогава триене на източника
+    with _timed(stats, "plan"):
+        tasks, err_count = plan_transfers(files_list, dest_folder, target_folder)
+    same_device = {task.src for task in tasks if task.same_device}
+
+    def work(src, dst, size, on_bytes, cancel):
+        return move_file(src, dst, size, on_bytes, cancel, same_device=src in same_device)
+
+    with _timed(stats, "transfer"):
+        results = run_transfers(tasks, work, on_progress, cancel)
+    success_files = [task.path for task, status in zip(tasks, results) if status]
+    err_count += sum(1 for status in results if status is False)
+    methods = Counter(status for status in results if status)
+    logging.info(f"Преместени {len(success_files)} файла в {dest_folder}: " + ", ".join(f"{m}={n}" for m, n in methods.items()))
+    _count_transfers(stats, tasks, results, err_count)
+    return len(success_files), err_count, success_files
+
+def batch_delete(files_list, on_progress=None, cancel=None, stats=None):
+    # Паралелно триене с dir_fd (виж transfer.delete_files); празните папки се чистят отделно с prune_empty_dirs
+    with _timed(stats, "delete"):
+        results = delete_files(files_list, on_progress, cancel)
+    success_files = [f_path for f_path, status in zip(files_list, results) if status]
+    err_count = sum(1 for status in results if status is False)
+    if stats is not None: stats.count_many(files=len(success_files), errors=err_count)
+    return len(success_files), err_count, success_files
+
+def generate_export_report(file_path, matched_files, selected_files, target_folder, fmt=None, compression=None,
+                           lock=None, on_progress=None, cancel=None, stats=None):
+    # Форматът (txt/csv/jsonl) и компресията (.gz/.xz) се познават по разширението, ако не са подадени
+    return write_report(file_path, matched_files, selected_files, target_folder, fmt, compression, lock, on_progress, cancel, stats)
@@ -0,0 +1,89 @@
+import os
+import re
+import cProfile
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from time import perf_counter
+from utils import CACHE_DIR
+
+PROFILE_DIR = os.path.join(CACHE_DIR, "profiles")
+
+# Етикети за лентата и лога; непознатите ключове се показват както са
+LABELS = {
+    "scan": "сканиране", "analytics": "анализ", "copy": "копиране", "cut": "преместване", "export": "експорт",
+    "walk": "обхождане", "classify": "филтри", "tree": "дърво", "redraw": "прерисуване",
+    "search": "търсене", "flatten": "редове", "render": "рендер", "plan": "план", "transfer": "прехвърляне",
+    "delete": "триене", "prune": "празни папки", "format": "форматиране", "write": "запис",
+    "dirs": "папки", "stat": "stat", "entries": "записа", "pruned": "изключени папки", "matched": "съвпадения",
+    "reused": "от индекса", "rows": "реда", "controls": "контроли", "files": "файла", "bytes": "байта", "errors": "грешки",
+}
+
+class Timings:
+    """Времена по фази и броячи за една операция (сканиране, прерисуване, копиране, експорт...).
+
+    span() и count() могат да се викат от няколко нишки - времената на една фаза се сумират,
+    така че при паралелното обхождане "обхождане" е сумата от работните нишки, а не стенното време.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.started = perf_counter()
+        self.elapsed = None
+        self.spans = {}
+        self.counters = Counter()
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, phase):
+        start = perf_counter()
+        try: yield
+        finally: self.add_time(phase, perf_counter() - start)
+
+    def add_time(self, phase, seconds):
+        with self.lock:
+            self.spans[phase] = self.spans.get(phase, 0.0) + seconds
+
+    def count(self, counter, n=1):
+        with self.lock:
+            self.counters[counter] += n
+
+    def count_many(self, **counts):
+        with self.lock:
+            self.counters.update(counts)
+
+    def finish(self, log_threshold=0.0):
+        # Затваря общото време и го пише в app.log (ако е поне log_threshold секунди)
+        self.elapsed = perf_counter() - self.started
+        if self.elapsed >= log_threshold: logging.info(f"Профил: {self.format()}")
+        return self
+
+    def format(self):
+        elapsed = self.elapsed if self.elapsed is not None else perf_counter() - self.started
+        text = f"{LABELS.get(self.name, self.name)} {_seconds(elapsed)}"
+        if self.spans:
+            text += " (" + ", ".join(f"{LABELS.get(k, k)} {_seconds(v)}" for k, v in self.spans.items()) + ")"
+        if self.counters:
+            text += " · " + " · ".join(f"{v} {LABELS.get(k, k)}" for k, v in self.counters.items())
+        return text
+
+def _seconds(value):
+    return f"{value * 1000:.0f} ms" if value < 1 else f"{value:.2f} s"
+
+def profile_path(title):
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    slug = re.sub(r"\W+", "_", title).strip("_").lower() or "job"
+    return os.path.join(PROFILE_DIR, f"{slug}_{stamp}.prof")
+
+def run_profiled(path, fn, *args, **kwargs):
+    # Пуска fn под cProfile и записва .prof (за pstats/snakeviz). Хваща само текущата нишка -
+    # работата в пуловете на обхождането/копирането се вижда като чакане на резултатите им.
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(fn, *args, **kwargs)
+    finally:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        profiler.dump_stats(path)
+        logging.info(f"cProfile записан в {path}")
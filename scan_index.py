@@ -0,0 +1,207 @@
+import os
+import sqlite3
+from time import perf_counter
+from utils import CACHE_DIR, walk_dirs
+
+INDEX_PATH = os.path.join(CACHE_DIR, "scan_index.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    id INTEGER PRIMARY KEY,
+    parent_id INTEGER,
+    path TEXT NOT NULL UNIQUE,
+    mtime REAL
+);
+CREATE INDEX IF NOT EXISTS idx_dirs_parent ON dirs(parent_id);
+CREATE TABLE IF NOT EXISTS files (
+    dir_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_files_dir ON files(dir_id);
+"""
+
+def _list_dir(dir_path, stats=None):
+    # Пълно listing (без филтри) - в индекса влизат всички файлове, филтрите се прилагат при заявка
+    files, sub_dirs = [], []
+    n = stat_calls = 0
+    try:
+        with os.scandir(dir_path) as it:
+            for n, entry in enumerate(it, 1):
+                try:
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            stat_calls += 1
+                            try: sub_mtime = entry.stat().st_mtime
+                            except OSError: sub_mtime = None
+                            sub_dirs.append((entry.name, entry.path, sub_mtime))
+                        continue
+                    stat_calls += 1
+                    st = entry.stat()
+                    files.append((entry.name, st.st_size, st.st_mtime))
+                except OSError: pass
+    except OSError: pass
+    if stats is not None: stats.count_many(dirs=1, entries=n, stat=stat_calls)
+    return files, sub_dirs
+
+def _subtree_clause(target_folder):
+    # Папката и всичко под нея като диапазон по path (без LIKE, който бърка '_' и '%')
+    prefix = target_folder if target_folder.endswith(os.sep) else target_folder + os.sep
+    upper = prefix[:-1] + chr(ord(os.sep) + 1)
+    return "(path = ? OR (path >= ? AND path < ?))", (target_folder, prefix, upper)
+
+class ScanIndex:
+    """Персистентен SQLite индекс: mtime на всяка папка и метаданните на файловете в нея.
+
+    При повторно сканиране се listing-ват само папките, чийто mtime е различен от записания.
+    Промяна само по съдържанието на файл (без добавяне/премахване) не променя mtime на папката,
+    така че такъв файл остава с кешираните size/mtime до следващото listing на папката му.
+    """
+
+    def __init__(self, db_path=INDEX_PATH):
+        self.db_path = db_path
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def has(self, target_folder):
+        target_folder = os.path.normpath(os.path.abspath(target_folder))
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT 1 FROM dirs WHERE path = ?", (target_folder,)).fetchone() is not None
+        finally:
+            conn.close()
+
+    def refresh(self, target_folder, max_workers=1, cancel=None, skip_dir=None, stats=None):
+        # Генерира (части, mtime на папката, всички файлове) докато обновява индекса.
+        # Файловете са (име, пълен път, размер, mtime) - същата форма като при _walk_dirs.
+        # skip_dir(път на родителя, име) отрязва изключените папки преди listing; те се пазят без mtime.
+        # stats (profiling.Timings) получава времето за обхождане и броячите като при _scan_dir,
+        # плюс reused за папките, взети от индекса.
+        target_folder = os.path.normpath(os.path.abspath(target_folder))
+        conn = self._connect()
+        completed = False
+        self.listed_dirs, self.reused_dirs = 0, 0
+        try:
+            clause, params = _subtree_clause(target_folder)
+            known, known_children = {}, {}
+            for dir_id, parent_id, path, mtime in conn.execute(f"SELECT id, parent_id, path, mtime FROM dirs WHERE {clause} ORDER BY id", params):
+                known[path] = (dir_id, mtime, parent_id)
+                known_children.setdefault(parent_id, []).append(path)
+            parent_row = conn.execute("SELECT id FROM dirs WHERE path = ?", (os.path.dirname(target_folder),)).fetchone()
+            dir_ids = {os.path.dirname(target_folder): parent_row[0] if parent_row else None}
+
+            def list_dir(dir_path, dir_mtime):
+                # Работи в нишките на пула - само чете known, без достъп до базата
+                started = perf_counter()
+                row = known.get(dir_path)
+                if row is not None and dir_mtime is not None and row[1] == dir_mtime:
+                    # Непроменена папка: на диска е само stat на известните подпапки, файловете са в индекса
+                    files, sub_dirs = None, []
+                    sub_paths = known_children.get(row[0], [])
+                    for sub_path in sub_paths:
+                        try: sub_dirs.append((os.path.basename(sub_path), sub_path, os.stat(sub_path).st_mtime))
+                        except OSError: pass
+                    if stats is not None: stats.count_many(reused=1, stat=len(sub_paths))
+                else:
+                    files, sub_dirs = _list_dir(dir_path, stats)
+                skipped = []
+                if skip_dir is not None:
+                    kept = []
+                    for sub in sub_dirs: (skipped if skip_dir(dir_path, sub[0]) else kept).append(sub)
+                    sub_dirs = kept
+                if stats is not None:
+                    stats.add_time("walk", perf_counter() - started)
+                    if skipped: stats.count("pruned", len(skipped))
+                return (files, skipped), sub_dirs
+
+            seen = set()
+            for parts, dir_path, dir_mtime, (files, skipped) in walk_dirs(target_folder, list_dir, max_workers, cancel):
+                row = known.get(dir_path)
+                parent_id = dir_ids.get(os.path.dirname(dir_path))
+                if files is None:
+                    dir_id = row[0]
+                    self.reused_dirs += 1
+                    if row[2] != parent_id:
+                        conn.execute("UPDATE dirs SET parent_id = ? WHERE id = ?", (parent_id, dir_id))
+                    files = conn.execute("SELECT name, size, mtime FROM files WHERE dir_id = ? ORDER BY rowid", (dir_id,)).fetchall()
+                else:
+                    self.listed_dirs += 1
+                    if row is not None:
+                        dir_id = row[0]
+                        conn.execute("UPDATE dirs SET parent_id = ?, mtime = ? WHERE id = ?", (parent_id, dir_mtime, dir_id))
+                        conn.execute("DELETE FROM files WHERE dir_id = ?", (dir_id,))
+                    else:
+                        dir_id = conn.execute("INSERT INTO dirs (parent_id, path, mtime) VALUES (?, ?, ?)", (parent_id, dir_path, dir_mtime)).lastrowid
+                    conn.executemany("INSERT INTO files (dir_id, name, size, mtime) VALUES (?, ?, ?, ?)",
+                                     [(dir_id, name, size, mtime) for name, size, mtime in files])
+                dir_ids[dir_path] = dir_id
+                seen.add(dir_path)
+                for _, sub_path, _ in skipped:
+                    # Изключената папка остава в индекса без mtime: непроменен родител я намира сред
+                    # известните подпапки, а щом изключването отпадне, се listing-ва като променена
+                    sub = known.get(sub_path)
+                    if sub is None:
+                        conn.execute("INSERT INTO dirs (parent_id, path, mtime) VALUES (?, ?, NULL)", (dir_id, sub_path))
+                    elif sub[1] is not None or sub[2] != dir_id:
+                        conn.execute("UPDATE dirs SET parent_id = ?, mtime = NULL WHERE id = ?", (dir_id, sub[0]))
+                    seen.add(sub_path)
+
+                yield parts, dir_mtime, [(name, os.path.join(dir_path, name), size, mtime) for name, size, mtime in files]
+            # При отказ или изчерпан лимит walk_dirs просто спира - това не е пълно обхождане
+            completed = cancel is None or not cancel.is_set()
+        finally:
+            # Записва се само пълно обхождане. При прекъсване (затворен генератор, отказ) родителите
+            # вече са с новия mtime, а подпапките им още не са записани - следващото сканиране би ги
+            # приело за непроменени и би изгубило поддърветата, затова индексът остава както преди.
+            if completed:
+                stale = [(known[path][0],) for path in known.keys() - seen]
+                conn.executemany("DELETE FROM files WHERE dir_id = ?", stale)
+                conn.executemany("DELETE FROM dirs WHERE id = ?", stale)
+                conn.commit()
+            else:
+                conn.rollback()
+            conn.close()
+
+    def walk(self, target_folder, skip_dir=None, stats=None):
+        # Само от индекса, без нито един достъп до диска. Формата е като при refresh.
+        # В stats четенето от базата е "обхождане", а всяка подадена папка се брои в reused.
+        target_folder = os.path.normpath(os.path.abspath(target_folder))
+        started = perf_counter()
+        conn = self._connect()
+        try:
+            clause, params = _subtree_clause(target_folder)
+            dirs = conn.execute(f"SELECT id, parent_id, path, mtime FROM dirs WHERE {clause} ORDER BY id", params).fetchall()
+            children, files_by_dir, root = {}, {}, None
+            for dir_id, parent_id, path, mtime in dirs:
+                if path == target_folder: root = (dir_id, path, mtime)
+                else: children.setdefault(parent_id, []).append((dir_id, path, mtime))
+            if root is None: return
+
+            dir_ids = [d[0] for d in dirs]
+            for i in range(0, len(dir_ids), 500):
+                chunk = dir_ids[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT dir_id, name, size, mtime FROM files WHERE dir_id IN ({','.join('?' * len(chunk))}) ORDER BY rowid", chunk)
+                for dir_id, name, size, mtime in rows:
+                    files_by_dir.setdefault(dir_id, []).append((name, size, mtime))
+        finally:
+            conn.close()
+            if stats is not None: stats.add_time("walk", perf_counter() - started)
+
+        stack = [(root, ())]
+        while stack:
+            (dir_id, dir_path, dir_mtime), parts = stack.pop()
+            if stats is not None: stats.count("reused")
+            yield parts, dir_mtime, [(name, os.path.join(dir_path, name), size, mtime) for name, size, mtime in files_by_dir.get(dir_id, [])]
+            for child in reversed(children.get(dir_id, [])):
+                if skip_dir is not None and skip_dir(dir_path, os.path.basename(child[1])):
+                    if stats is not None: stats.count("pruned")
+                    continue
+                stack.append((child, parts + (os.path.basename(child[1]),)))
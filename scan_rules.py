@@ -0,0 +1,100 @@
+import os
+import re
+
+# Папки, които почти никога не са целта на търсене, а са огромни - изключват се по подразбиране в UI
+DEFAULT_EXCLUDES = ("node_modules/", ".git/", ".hg/", ".svn/", "venv/", ".venv/", "__pycache__/",
+                    ".cache/", ".tox/", ".mypy_cache/", ".pytest_cache/")
+_GLOB_CHARS = frozenset("*?[")
+
+def _glob_to_regex(pattern):
+    # Като в .gitignore: * и ? не минават през "/", ** минава през всички нива
+    out, i = [], 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+            continue
+        c = pattern[i]
+        if c == "*": out.append("[^/]*")
+        elif c == "?": out.append("[^/]")
+        elif c == "[" and pattern.find("]", i + 2) != -1:
+            j = pattern.find("]", i + 2)
+            body = pattern[i + 1:j]
+            if body.startswith("!"): body = "^" + body[1:]
+            out.append("[" + body.replace("\\", "\\\\") + "]")
+            i = j + 1
+            continue
+        else: out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+def _compile(patterns):
+    # Всички шаблони в един регулярен израз спрямо относителния път ("a/b/име").
+    # Шаблон с "/" е закотвен към корена, а без - съвпада с името на всяко ниво.
+    parts = []
+    for pattern in patterns:
+        anchored = "/" in pattern
+        body = _glob_to_regex(pattern.lstrip("/"))
+        parts.append(body if anchored else "(?:.*/)?" + body)
+    return re.compile("|".join(f"(?:{p})" for p in parts), re.IGNORECASE) if parts else None
+
+def _ext_of(pattern):
+    # "*.txt", ".txt" -> ".txt"; всичко друго (напр. "*.tar.gz", "report_*.pdf") отива в регулярния израз
+    if pattern.startswith("*."): pattern = pattern[1:]
+    if pattern.startswith(".") and pattern.count(".") == 1 and not _GLOB_CHARS & set(pattern) and "/" not in pattern:
+        return pattern.lower()
+    return None
+
+def _file_pattern(pattern):
+    # ".tar.gz" е разширение с няколко точки - съвпада като "*.tar.gz" (както досегашният endswith)
+    if pattern.startswith(".") and not _GLOB_CHARS & set(pattern) and "/" not in pattern: return "*" + pattern
+    return pattern
+
+class ScanRules:
+    """Филтри за включване/изключване, компилирани веднъж за цялото сканиране.
+
+    Шаблоните са като в .gitignore. Разширенията ("*.txt", ".txt") се проверяват с търсене в
+    set, а останалите шаблони - с един общ регулярен израз на вид. Шаблон, завършващ на "/",
+    важи само за папки. Изключена папка не се listing-ва изобщо, а include важи само за файлове.
+    """
+
+    def __init__(self, include=(), exclude=()):
+        include = [p.strip() for p in include if p and p.strip()]
+        exclude = [p.strip() for p in exclude if p and p.strip()]
+        self.has_include = bool(include)
+        self.include_exts = frozenset(e for e in map(_ext_of, include) if e)
+        self.include_re = _compile([_file_pattern(p) for p in include if not _ext_of(p)])
+        file_excludes = [p for p in exclude if not p.endswith("/")]
+        self.exclude_exts = frozenset(e for e in map(_ext_of, file_excludes) if e)
+        self.exclude_re = _compile([_file_pattern(p) for p in file_excludes if not _ext_of(p)])
+        self.dir_re = _compile([p.rstrip("/") for p in exclude if p.rstrip("/")])
+
+    def match_file(self, dir_prefix, name):
+        # dir_prefix е относителният път на папката с "/" накрая ("" за корена)
+        dot = name.rfind(".")
+        ext = name[dot:].lower() if dot >= 0 else ""
+        if ext in self.exclude_exts: return False
+        if self.exclude_re is not None and self.exclude_re.fullmatch(dir_prefix + name): return False
+        if not self.has_include or ext in self.include_exts: return True
+        return self.include_re is not None and self.include_re.fullmatch(dir_prefix + name) is not None
+
+    def skip_dir(self, dir_prefix, name):
+        return self.dir_re is not None and self.dir_re.fullmatch(dir_prefix + name) is not None
+
+    def skip_path(self, rel_parts):
+        # Дали някоя от папките по пътя е изключена - за единични пътища (напр. от наблюдението)
+        prefix = ""
+        for name in rel_parts:
+            if self.skip_dir(prefix, name): return True
+            prefix += name + "/"
+        return False
+
+def rel_prefix(root_len, dir_path):
+    # Относителният път на папка с "/" накрая за шаблоните; root_len е дължината на корена на сканирането
+    rel = dir_path[root_len:].lstrip(os.sep)
+    if not rel: return ""
+    return (rel.replace(os.sep, "/") if os.sep != "/" else rel) + "/"
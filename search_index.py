@@ -0,0 +1,64 @@
+from array import array
+from utils import FLAG_DELETED
+
+class NameIndex:
+    """Триграмен индекс над имената на файловете във FileTable за бързото търсене.
+
+    id-тата във FileTable само се добавят, така че индексът догонва таблицата при всяка заявка
+    (sync) без нужда от куки при сканиране или следене. Изтритите id-та се отсяват по флага им,
+    а ново сканиране (нова таблица в FileStore) изчиства индекса.
+    Заявка, която съдържа предишната (допълнено търсене), филтрира само предишния резултат.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.reset()
+
+    def reset(self):
+        self.table = self.store.table
+        self.lower = []
+        self.grams = {}
+        self.last = ("", [], 0)
+
+    def sync(self):
+        if self.table is not self.store.table: self.reset()
+        names = self.table.names
+        grams = self.grams
+        for file_id in range(len(self.lower), len(names)):
+            name = (names[file_id] or "").lower()
+            self.lower.append(name)
+            for gram in {name[i:i + 3] for i in range(len(name) - 2)}:
+                posting = grams.get(gram)
+                if posting is None: posting = grams[gram] = array('i')
+                posting.append(file_id)
+
+    def search(self, query):
+        # Връща живите id-та, чието име съдържа query (без значение от регистъра), във възходящ ред
+        query = query.lower()
+        if not query: return []
+        self.sync()
+        total = len(self.lower)
+        last_query, last_ids, last_total = self.last
+        if last_query and last_query in query:
+            # Новите id-та след предишната заявка също са кандидати
+            candidates = list(last_ids) + list(range(last_total, total))
+        elif len(query) >= 3:
+            # Най-късият списък за триграмите на заявката - проверката на подниза отсява останалото
+            postings = [self.grams.get(query[i:i + 3]) for i in range(len(query) - 2)]
+            if any(p is None for p in postings): candidates = []
+            else: candidates = min(postings, key=len)
+        else:
+            candidates = range(total)
+
+        lower, flags = self.lower, self.table.flags
+        ids = [i for i in candidates if query in lower[i] and not flags[i] & FLAG_DELETED]
+        self.last = (query, ids, total)
+        return ids
+
+def group_matches(table, ids):
+    # Разпределя намерените id-та по папки: {TreeNode: [id, ...]}
+    by_node = {}
+    nodes = table.nodes
+    for file_id in ids:
+        by_node.setdefault(nodes[file_id], []).append(file_id)
+    return by_node
@@ -0,0 +1,62 @@
+import os
+from utils import natural_sort_key
+
+class SortCache:
+    """Кеширани ключове и подредби за дървото.
+
+    Естественият ключ (natural_sort_key) се смята веднъж за всяко име - за файловете по id,
+    за папките по име. За всяка папка и колона се пази възходящата подредба заедно с
+    TreeNode.version, така че тя се преизчислява само когато съдържанието на папката се промени.
+    Обратната посока е само обърнат изглед над същия списък.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.reset()
+
+    def reset(self):
+        self.table = self.store.table
+        self.file_keys = []   # id -> естествен ключ (None докато не потрябва)
+        self.dir_keys = {}    # име на папка -> естествен ключ
+        self.orders = {}      # (TreeNode, колона) -> (version, подредени id-та или имена)
+
+    def _check_table(self):
+        # Ново сканиране подменя таблицата - старите id-та вече не значат нищо
+        if self.table is not self.store.table: self.reset()
+
+    def name_key(self, file_id):
+        keys = self.file_keys
+        if file_id >= len(keys): keys.extend([None] * (len(self.table.names) - len(keys)))
+        key = keys[file_id]
+        if key is None: key = keys[file_id] = tuple(natural_sort_key(self.table.names[file_id]))
+        return key
+
+    def dir_key(self, name):
+        key = self.dir_keys.get(name)
+        if key is None: key = self.dir_keys[name] = tuple(natural_sort_key(name))
+        return key
+
+    def file_sort_key(self, column):
+        table, name_key = self.table, self.name_key
+        if column == "size": return lambda i: (table.sizes[i], name_key(i))
+        if column == "date": return lambda i: (table.mtimes[i], name_key(i))
+        if column == "type": return lambda i: (os.path.splitext(table.names[i])[1].lower(), name_key(i))
+        return name_key
+
+    def dir_order(self, node, reverse=False):
+        self._check_table()
+        cached = self.orders.get((node, "dirs"))
+        if cached is None or cached[0] != node.version:
+            cached = self.orders[(node, "dirs")] = (node.version, sorted(node.children, key=self.dir_key))
+        return reversed(cached[1]) if reverse else cached[1]
+
+    def file_order(self, node, column="name", reverse=False, ids=None):
+        # ids е подмножество от файловете на папката (напр. съвпаденията при търсене) - то се
+        # подрежда директно с кешираните ключове, без да пипа подредбата на цялата папка
+        self._check_table()
+        if ids is not None:
+            return sorted(ids, key=self.file_sort_key(column), reverse=reverse)
+        cached = self.orders.get((node, column))
+        if cached is None or cached[0] != node.version:
+            cached = self.orders[(node, column)] = (node.version, sorted(node.files.values(), key=self.file_sort_key(column)))
+        return reversed(cached[1]) if reverse else cached[1]
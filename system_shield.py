@@ -0,0 +1,90 @@
+import os
+import re
+from utils import SYSTEM_PATHS, SYSTEM_EXTS
+
+# Готови набори от системни папки; "!път" е изключение (обикновена папка под системна)
+SHIELD_RULE_SETS = {
+    "posix": ["/bin", "/boot", "/dev", "/etc", "/lib", "/lib32", "/lib64", "/opt", "/proc", "/sbin", "/sys", "/usr", "/var"],
+    "macos": ["/System", "/Library", "/Applications", "/private/etc", "/private/var", "/usr", "/bin", "/sbin"],
+    "windows": ["c:\\windows", "c:\\program files", "c:\\program files (x86)", "c:\\programdata"],
+}
+_MARK = ""  # ключ в trie-то за правило, завършващо в този възел (компонент на път не може да е празен)
+
+def _components(path):
+    # И двата разделителя, без значение от платформата; сравнението е без регистър както досега
+    return [c.casefold() for c in re.split(r"[\\/]+", path) if c]
+
+class SystemShield:
+    """Решава кои папки са системни - веднъж на папка, а не с префиксно сравнение за всеки файл.
+
+    Правилата (пътища, "!път" за изключение) са в trie по компоненти на пътя. Коренът на
+    сканирането се резолвира (realpath) и се спуска по trie-то веднъж; всяка подпапка взима
+    състоянието на родителя си и прави една dict стъпка. Обхождането не следва symlink-ове към
+    папки, така че realpath на подпапка е realpath на родителя + името. Правилата също се
+    добавят и резолвирани (напр. /bin -> /usr/bin). По-дълбокото правило печели.
+    """
+
+    def __init__(self, paths=None, exts=None):
+        self.exts = frozenset(e.lower() for e in (SYSTEM_EXTS if exts is None else exts))
+        self.trie = {}
+        for rule in (SYSTEM_PATHS if paths is None else paths):
+            is_sys = not rule.startswith("!")
+            path = rule.lstrip("!")
+            self._add(path, is_sys)
+            if os.path.isabs(path):
+                real = os.path.realpath(path)
+                if real != path: self._add(real, is_sys)
+
+    @classmethod
+    def from_rule_sets(cls, *names, extra=(), exts=None):
+        return cls([rule for name in names for rule in SHIELD_RULE_SETS[name]] + list(extra), exts)
+
+    def _add(self, path, is_sys):
+        node = self.trie
+        for c in _components(path): node = node.setdefault(c, {})
+        node[_MARK] = is_sys
+
+    def root_state(self, dir_path):
+        # (системна ли е, възел в trie-то или None) за резолвирания път на папката
+        is_sys, node = False, self.trie
+        for c in _components(os.path.realpath(dir_path)):
+            node = node.get(c)
+            if node is None: break
+            is_sys = node.get(_MARK, is_sys)
+        return is_sys, node
+
+    def child_state(self, parent_state, name):
+        is_sys, node = parent_state
+        if node is None: return parent_state
+        node = node.get(name.casefold())
+        if node is None: return is_sys, None
+        return node.get(_MARK, is_sys), node
+
+    def is_system_file(self, dir_is_sys, name):
+        if dir_is_sys: return True
+        dot = name.rfind(".")
+        return dot > 0 and name[dot:].lower() in self.exts
+
+    def classify_path(self, full_path):
+        # За единичен файл (напр. от наблюдението) - резолвира папката му
+        return self.is_system_file(self.root_state(os.path.dirname(full_path))[0], os.path.basename(full_path))
+
+class ShieldWalk:
+    """Състоянията на папките по време на едно top-down обхождане, по части на пътя.
+
+    Пазят се само папките, които са системни или лежат по път от правилата - за всички
+    останали отговорът е "не" без запис.
+    """
+
+    def __init__(self, shield, root_path):
+        self.shield = shield
+        self.states = {(): shield.root_state(root_path)}
+
+    def dir_is_system(self, parts):
+        state = self.states.get(parts)
+        if state is None:
+            parent = self.states.get(parts[:-1]) if parts else None
+            if parent is None: return False
+            state = self.shield.child_state(parent, parts[-1])
+            if state[0] or state[1] is not None: self.states[parts] = state
+        return state[0]
@@ -1,13 +1,28 @@
 import os
+import csv
+import gzip
+import json
+import errno
+import hashlib
 import pytest
+import threading
 import shutil
 from datetime import datetime, timedelta
-from utils import format_size, natural_sort_key
+from utils import format_size, natural_sort_key, FileStore, flatten_tree, ROW_DIR, ROW_FILE, ROW_EMPTY
 from unittest.mock import patch
 from operations import (
     copy_single_file, cut_single_file, delete_single_file,
-    batch_copy, batch_cut, batch_delete, generate_export_report, scan_directory
+    batch_copy, batch_cut, batch_delete, generate_export_report, scan_directory,
+    iter_scan_directory, ScanBudget, SCAN_CANCELLED, SCAN_TIME_LIMIT, SCAN_FILE_LIMIT
 )
+from search_index import NameIndex, group_matches
+from sort_cache import SortCache
+from scan_rules import ScanRules
+from system_shield import SystemShield
+from jobs import JobScheduler, DONE, FAILED, CANCELLED, PAUSED
+from duplicates import find_duplicates, HashCache, DUP_BLOCK_SIZE
+from analytics import DiskUsage, DAY
+from transfer import copy_file, move_across_devices, prune_empty_dirs, COPY_METHODS
 
 def test_format_size_small():
     assert format_size(500) == "500.00 B"
@@ -48,6 +63,19 @@ def test_copy_single_file_same_path_protection(tmp_path):
     result = copy_single_file(str(test_file), str(tmp_path))
     assert result is False 
 
+def test_copy_into_symlinked_alias_keeps_source(tmp_path):
+    """Копиране в symlink към папката на източника не отрязва файла (като SameFileError при shutil)"""
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "a.txt").write_text("важно")
+    (tmp_path / "link").symlink_to(docs, target_is_directory=True)
+
+    assert copy_single_file(str(docs / "a.txt"), str(tmp_path / "link")) is False
+    assert batch_copy([str(docs / "a.txt")], str(tmp_path / "link"), str(docs)) == (0, 0)
+    with pytest.raises(shutil.SameFileError):
+        copy_file(str(docs / "a.txt"), str(tmp_path / "link" / "a.txt"), 5, lambda n: None)
+    assert (docs / "a.txt").read_text() == "важно"
+
 def test_cut_single_file_success(tmp_path):
     src_dir = tmp_path / "src"
     dest_dir = tmp_path / "dest"
@@ -146,7 +174,7 @@ def test_copy_failure_disk_full(tmp_path):
     dest_dir = tmp_path / "dest"
     dest_dir.mkdir()
 
-    with patch("shutil.copy2", side_effect=OSError("No space left on device")):
+    with patch("operations.copy_file", side_effect=OSError("No space left on device")):
         result = copy_single_file(str(src_file), str(dest_dir))
         assert result is False
 
@@ -246,4 +274,783 @@ def test_system_shield_paths(tmp_path):
     assert matched[0][3] is True # 4-тият елемент в tuple-а е is_sys, трябва да е True
     
     # Изчистваме тестовия път след нас
-    SYSTEM_PATHS.pop()
\ No newline at end of file
+    SYSTEM_PATHS.pop()
+def test_scan_directory_tree_and_ext_filter(tmp_path):
+    """Проверява дървото и филтъра по разширения при scandir обхождането"""
+    (tmp_path / "a" / "b").mkdir(parents=True)
+    (tmp_path / "top.txt").write_text("x")
+    (tmp_path / "a" / "skip.log").write_text("x")
+    (tmp_path / "a" / "b" / "deep.TXT").write_text("xyz")
+
+    start_date = datetime.now() - timedelta(days=1)
+    end_date = datetime.now() + timedelta(days=1)
+
+    root, matched, total_size, _ = scan_directory(str(tmp_path), start_date, end_date, [".txt"])
+
+    assert sorted(os.path.basename(m[0]) for m in matched) == ["deep.TXT", "top.txt"]
+    assert total_size == 4
+    assert isinstance(matched[0][2], datetime)
+    deep = root.children["a"].children["b"]
+    assert list(deep.files) == ["deep.TXT"]
+    assert matched.path(deep.files["deep.TXT"]) == str(tmp_path / "a" / "b" / "deep.TXT")
+
+def test_scan_directory_parallel_matches_sequential(tmp_path):
+    """Паралелното сканиране трябва да връща същото дърво и същия ред като последователното"""
+    for i in range(4):
+        for j in range(3):
+            sub = tmp_path / f"dir_{i}" / f"sub_{j}"
+            sub.mkdir(parents=True)
+            for k in range(5):
+                (sub / f"file_{k}.txt").write_text("x" * k)
+
+    start_date = datetime.now() - timedelta(days=1)
+    end_date = datetime.now() + timedelta(days=1)
+
+    seq_root, seq_files, seq_size, _ = scan_directory(str(tmp_path), start_date, end_date, [])
+    par_root, par_files, par_size, _ = scan_directory(str(tmp_path), start_date, end_date, [], max_workers=8)
+
+    assert [f[0] for f in par_files] == [f[0] for f in seq_files]
+    assert par_size == seq_size
+    assert len(par_files) == 60
+
+    def flatten(node, prefix=""):
+        res = [(prefix, list(node.files))]
+        for name, child in node.children.items():
+            res.extend(flatten(child, prefix + "/" + name))
+        return res
+    assert flatten(par_root) == flatten(seq_root)
+
+def test_walk_dirs_parallel_prefetch_is_bounded():
+    """Паралелното обхождане на широко дърво буферира най-много limit listing-а напред"""
+    from utils import walk_dirs, SCAN_PREFETCH_PER_WORKER
+    tree = {"/r": [f"/r/d{i}" for i in range(500)]}
+    listed, lock = [0], threading.Lock()
+    def list_dir(path, _):
+        with lock: listed[0] += 1
+        return path, [(os.path.basename(p), p, None) for p in tree.get(path, [])]
+    yielded, ahead = [], 0
+    for _, path, _, payload in walk_dirs("/r", list_dir, max_workers=4):
+        yielded.append(payload)
+        with lock: ahead = max(ahead, listed[0] - len(yielded))
+    assert yielded == ["/r"] + tree["/r"]
+    assert ahead <= 4 * SCAN_PREFETCH_PER_WORKER
+
+def test_iter_scan_directory_batches_per_folder(tmp_path):
+    """Стрийминг сканирането връща по една порция за всяка папка със съвпадения"""
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "root.txt").touch()
+    (tmp_path / "sub" / "a.txt").touch()
+    (tmp_path / "sub" / "b.txt").touch()
+
+    start_date = datetime.now() - timedelta(days=1)
+    end_date = datetime.now() + timedelta(days=1)
+
+    batches = list(iter_scan_directory(str(tmp_path), start_date, end_date, [".txt"]))
+
+    assert batches[0][0] == ()
+    assert [f[0] for f in batches[0][1]] == ["root.txt"]
+    assert batches[1][0] == ("sub",)
+    assert sorted(f[0] for f in batches[1][1]) == ["a.txt", "b.txt"]
+
+def test_scan_index_incremental_rescan(tmp_path):
+    """Индексът listing-ва наново само променените папки, а смяна на филтъра не пипа диска"""
+    from scan_index import ScanIndex
+    data = tmp_path / "data"
+    (data / "a").mkdir(parents=True)
+    (data / "b").mkdir()
+    (data / "a" / "one.txt").write_text("1")
+    (data / "b" / "two.log").write_text("22")
+    index = ScanIndex(str(tmp_path / "cache" / "index.db"))
+
+    start_date = datetime.now() - timedelta(days=1)
+    end_date = datetime.now() + timedelta(days=1)
+
+    _, matched, _, _ = scan_directory(str(data), start_date, end_date, [], index=index)
+    assert len(matched) == 2
+    assert index.listed_dirs == 3
+
+    (data / "b" / "three.txt").write_text("333")
+    _, matched, _, _ = scan_directory(str(data), start_date, end_date, [], index=index)
+    assert len(matched) == 3
+    assert index.listed_dirs == 1
+    assert index.reused_dirs == 2
+
+    # Само от индекса: изтритият на диска файл още е там, защото дискът не се чете
+    (data / "a" / "one.txt").unlink()
+    _, matched, total_size, _ = scan_directory(str(data), start_date, end_date, [".txt"], index=index, refresh_index=False)
+    assert sorted(os.path.basename(m[0]) for m in matched) == ["one.txt", "three.txt"]
+    assert total_size == 4
+
+    # Прекъснато обхождане (затворен генератор, както при отказ на задача) не оставя индекса полузаписан
+    (data / "c" / "deep").mkdir(parents=True)
+    (data / "c" / "deep" / "four.txt").write_text("4")
+    batches = iter_scan_directory(str(data), start_date, end_date, [], index=index)
+    next(batches)
+    batches.close()
+    _, matched, _, _ = scan_directory(str(data), start_date, end_date, [], index=index)
+    assert sorted(os.path.basename(m[0]) for m in matched) == ["four.txt", "three.txt", "two.log"]
+
+def test_watcher_patches_tree_in_place(tmp_path):
+    """Промените от файловата система се прилагат върху дървото без пълно сканиране"""
+    from watcher import TreeWatcher, apply_changes
+    (tmp_path / "docs").mkdir()
+    keep = tmp_path / "docs" / "keep.txt"
+    gone = tmp_path / "docs" / "gone.txt"
+    keep.write_text("k"); gone.write_text("g")
+
+    start_date = datetime.now() - timedelta(days=1)
+    end_date = datetime.now() + timedelta(days=1)
+    store = FileStore()
+    store.reset(str(tmp_path))
+    for parts, files in iter_scan_directory(str(tmp_path), start_date, end_date, [".txt"]):
+        store.add_batch(parts, files)
+
+    gone.unlink()
+    (tmp_path / "docs" / "new.txt").write_text("new!")
+    (tmp_path / "docs" / "ignored.log").write_text("x")
+    (tmp_path / "fresh" / "inner").mkdir(parents=True)
+    (tmp_path / "fresh" / "inner" / "deep.txt").write_text("d")
+
+    watcher = TreeWatcher(str(tmp_path), start_date, end_date, [".txt"], on_changes=None)
+    pending = {
+        str(gone): False,
+        str(tmp_path / "docs" / "new.txt"): False,
+        str(tmp_path / "docs" / "ignored.log"): False,
+        str(tmp_path / "fresh"): True,
+    }
+    upserts, removed = watcher.collect_changes(pending)
+    dropped = apply_changes(store, str(tmp_path), upserts, removed)
+    root = store.root
+
+    assert str(gone) in dropped
+    assert sorted(os.path.basename(m[0]) for m in store) == ["deep.txt", "keep.txt", "new.txt"]
+    assert store.total_size == len("k") + len("new!") + len("d")
+    assert sorted(root.children["docs"].files) == ["keep.txt", "new.txt"]
+    assert list(root.children["fresh"].children["inner"].files) == ["deep.txt"]
+
+def test_file_store_remove_and_bulk_remove():
+    """FileStore премахва файлове без линейно търсене и поддържа размера и системните файлове"""
+    store = FileStore()
+    store.reset("/r")
+    ts = datetime(2024, 1, 1).timestamp()
+    store.add_batch(("a",), [(f"f{i}.txt", 10, ts, i == 0) for i in range(5)])
+    store.add_batch(("b",), [("g.txt", 7, ts, False)])
+    r = os.path.normpath(os.path.abspath("/r"))
+
+    assert len(store) == 6
+    assert store.has_system_files
+    assert os.path.join(r, "a", "f3.txt") in store
+
+    assert store.remove(os.path.join(r, "a", "f0.txt")) is True
+    assert store.remove(os.path.join(r, "a", "f0.txt")) is False
+    assert not store.has_system_files
+    assert sorted(store.root.children["a"].files) == ["f1.txt", "f2.txt", "f3.txt", "f4.txt"]
+
+    removed = store.remove_many([os.path.join(r, "a", "f2.txt"), os.path.join(r, "b", "g.txt"), os.path.join(r, "missing.txt")])
+    assert removed == [os.path.join(r, "a", "f2.txt"), os.path.join(r, "b", "g.txt")]
+    assert store.root.children["b"].files == {}
+    assert store.total_size == 30
+    assert [f[0] for f in store] == [os.path.join(r, "a", n) for n in ("f1.txt", "f3.txt", "f4.txt")]
+    assert store.table.record(store.lookup(os.path.join(r, "a", "f1.txt")))[2] == datetime(2024, 1, 1)
+    # Път от друг диск (на Windows relpath вдига ValueError) просто не е в store-а
+    with patch("utils.os.path.relpath", side_effect=ValueError("path is on mount 'D:'")):
+        assert store.lookup("D:\\x.txt") is None and not store.remove("D:\\x.txt")
+
+def test_file_store_updates_in_place_and_compacts_tombstones():
+    """Промяна на същия файл не добавя ред, а изтритите редове се компактират при праг"""
+    from utils import TABLE_COMPACT_MIN
+    store = FileStore()
+    store.reset("/r")
+    ts = datetime(2024, 1, 1).timestamp()
+    node = store.add_batch(("a",), [("f.txt", 10, ts, False)])
+    file_id = store.lookup(os.path.join(store.root.path, "a", "f.txt"))
+    store.select([file_id])
+    for i in range(100):  # както поредица modify събития при следене
+        assert store.add(node, ("f.txt", 20 + i, ts + i, i % 2 == 0)) == file_id
+    assert len(store.table.names) == 1 and store.total_size == 119 and store.root.sys_count == 0
+    assert store.selected_count == 1
+
+    store.add_batch(("a",), [(f"t{i}.tmp", 1, ts, False) for i in range(TABLE_COMPACT_MIN)])
+    store.remove_many([os.path.join(node.path, f"t{i}.tmp") for i in range(TABLE_COMPACT_MIN)])
+    with pytest.raises(KeyError): store.table.record(file_id + 1)
+    old_table = store.table
+    assert store.maybe_compact() and store.table is not old_table
+    assert len(store.table.names) == len(store) == 1 and store.table.is_selected(node.files["f.txt"])
+    assert [f[0] for f in store] == [os.path.join(node.path, "f.txt")] and not store.maybe_compact()
+
+def test_tree_node_aggregates_follow_store_changes():
+    """Агрегатите на папките се обновяват при добавяне, маркиране и премахване"""
+    store = FileStore()
+    store.reset("/r")
+    ts = datetime(2024, 1, 1).timestamp()
+    store.add_batch(("a",), [("x.txt", 100, ts, False)])
+    store.add_batch(("a", "b"), [("y.dll", 50, ts, True), ("z.txt", 5, ts, False)])
+
+    a = store.root.children["a"]
+    b = a.children["b"]
+    assert (a.file_count, a.total_size, a.sys_count) == (3, 155, 1)
+    assert (b.file_count, b.total_size, b.sys_count) == (2, 55, 1)
+
+    store.select(b.files.values())
+    assert b.selected_count == b.file_count
+    assert a.selected_count == 2 and store.selected_count == 2
+
+    store.remove(os.path.join(b.path, "y.dll"))
+    assert (b.file_count, b.sys_count, b.selected_count) == (1, 0, 1)
+    assert not store.has_system_files
+
+    store.remove_tree(("a", "b"))
+    assert "b" not in a.children
+    assert (a.file_count, a.total_size, a.selected_count) == (1, 100, 0)
+    assert store.selected_ids() == []
+    assert store.total_size == 100
+
+def test_flatten_tree_only_expanded_and_search():
+    """Плоският списък съдържа само разгънатите папки, а търсенето скрива папки без съвпадения"""
+    store = FileStore()
+    store.reset("/r")
+    ts = datetime(2024, 1, 1).timestamp()
+    store.add_batch(("a",), [("x.txt", 1, ts, False)])
+    store.add_batch(("a", "b"), [("y.txt", 1, ts, False)])
+    store.add_batch(("c",), [])
+    order_dirs = lambda n: sorted(n.children)
+    order_files = lambda n, ids: sorted(n.files.values() if ids is None else ids)
+    a = store.root.children["a"]
+
+    rows = flatten_tree(store.root, set(), order_dirs, order_files)
+    assert [(k, d) for k, d, *_ in rows] == [(ROW_DIR, 0), (ROW_DIR, 0)]
+
+    rows = flatten_tree(store.root, {a.path, store.root.children["c"].path}, order_dirs, order_files)
+    assert [(k, d) for k, d, *_ in rows] == [(ROW_DIR, 0), (ROW_DIR, 1), (ROW_FILE, 1), (ROW_DIR, 0), (ROW_EMPTY, 1)]
+
+    matches = group_matches(store.table, NameIndex(store).search("Y.t"))
+    rows = flatten_tree(store.root, set(), order_dirs, order_files, "y.t", matches)
+    assert [(k, d) for k, d, *_ in rows] == [(ROW_DIR, 0), (ROW_DIR, 1), (ROW_FILE, 2)]
+    assert store.table.names[rows[-1][2]] == "y.txt"
+
+def test_name_index_matches_brute_force_and_follows_store():
+    """Триграмният индекс дава същото като линейното търсене и следи добавяне/изтриване"""
+    store = FileStore()
+    store.reset("/r")
+    ts = datetime(2024, 1, 1).timestamp()
+    names = [f"Report_{i}.txt" for i in range(50)] + ["photo.JPG", "a.py", "ab.md"]
+    store.add_batch(("d",), [(n, 1, ts, False) for n in names])
+    index = NameIndex(store)
+
+    def brute(q):
+        return [i for i in store.table.ids() if q.lower() in store.table.names[i].lower()]
+
+    for q in ["report_1", "jpg", "a", "ab", "zzz", "t_4"]:
+        assert index.search(q) == brute(q)
+
+    # Допълнено търсене след промени: новите файлове влизат, изтритите изпадат
+    assert index.search("report_1") == brute("report_1")
+    store.add_batch(("d",), [("report_1_new.txt", 1, ts, False)])
+    store.remove(os.path.join(store.root.path, "d", "Report_10.txt"))
+    assert index.search("report_1_") == brute("report_1_")
+    assert index.search("report_1") == brute("report_1")
+
+    # Ново сканиране подменя таблицата - индексът започва наново
+    store.reset("/r")
+    store.add_batch((), [("report.txt", 1, ts, False)])
+    assert index.search("report") == [0]
+
+def test_sort_cache_orders_and_invalidation():
+    """Кешираните подредби съвпадат с natural_sort_key и се обновяват при промяна в папката"""
+    store = FileStore()
+    store.reset("/r")
+    store.add_batch(("d",), [("file10.txt", 5, 3.0, False), ("file2.log", 50, 1.0, False), ("File1.txt", 20, 2.0, False)])
+    store.add_batch(("d", "dir10"), [])
+    store.add_batch(("d", "dir9"), [])
+    cache = SortCache(store)
+    d = store.root.children["d"]
+    names = lambda ids: [store.table.names[i] for i in ids]
+
+    assert names(cache.file_order(d, "name")) == ["File1.txt", "file2.log", "file10.txt"]
+    assert names(cache.file_order(d, "size")) == ["file10.txt", "File1.txt", "file2.log"]
+    assert names(cache.file_order(d, "date", reverse=True)) == ["file10.txt", "File1.txt", "file2.log"]
+    assert names(cache.file_order(d, "type")) == ["file2.log", "File1.txt", "file10.txt"]
+    assert list(cache.dir_order(d)) == ["dir9", "dir10"]
+    assert list(cache.dir_order(d, reverse=True)) == ["dir10", "dir9"]
+
+    # Същият списък се връща докато папката не се промени
+    assert cache.file_order(d, "name") is cache.file_order(d, "name")
+    store.add_batch(("d",), [("file3.txt", 1, 0.0, False)])
+    assert names(cache.file_order(d, "name")) == ["File1.txt", "file2.log", "file3.txt", "file10.txt"]
+    store.remove(os.path.join(d.path, "file2.log"))
+    assert names(cache.file_order(d, "name")) == ["File1.txt", "file3.txt", "file10.txt"]
+    assert names(cache.file_order(d, "size", ids=[d.files["file10.txt"], d.files["File1.txt"]])) == ["file10.txt", "File1.txt"]
+
+def test_batch_copy_progress_and_cancel(tmp_path):
+    """Паралелното копиране праща прогрес, а при отказ не започва нови файлове"""
+    base = tmp_path / "base"
+    (base / "sub").mkdir(parents=True)
+    files = []
+    for i in range(20):
+        f = base / "sub" / f"f{i}.bin"
+        f.write_bytes(b"x" * 1000)
+        files.append(str(f))
+
+    events = []
+    count, err = batch_copy(files, str(tmp_path / "dest"), str(base), on_progress=events.append)
+    assert (count, err) == (20, 0)
+    assert events[-1].files_done == 20 and events[-1].bytes_done == events[-1].bytes_total == 20000
+    assert (tmp_path / "dest" / "sub" / "f19.bin").read_bytes() == b"x" * 1000
+
+    cancel = threading.Event()
+    cancel.set()
+    count, err = batch_copy(files, str(tmp_path / "dest2"), str(base), cancel=cancel)
+    assert (count, err) == (0, 0)
+    assert not list((tmp_path / "dest2").rglob("*.bin"))
+
+def test_copy_file_falls_back_through_copy_methods(tmp_path):
+    """Бекендът пада към следващия механизъм, докато не стигне до поточно копиране в userspace"""
+    src = tmp_path / "big.bin"
+    src.write_bytes(bytes(range(100)))
+    method = copy_file(str(src), str(tmp_path / "fast.bin"), 100, lambda n: None)
+    assert method in COPY_METHODS
+    assert (tmp_path / "fast.bin").read_bytes() == bytes(range(100))
+
+    unsupported = OSError(errno.EXDEV, "cross-device")
+    with patch("transfer.fcntl", None), patch("transfer._unsupported", set()), \
+         patch("os.copy_file_range", side_effect=unsupported, create=True):
+        assert copy_file(str(src), str(tmp_path / "sf.bin"), 100, lambda n: None) == "sendfile"
+        assert (tmp_path / "sf.bin").read_bytes() == bytes(range(100))
+
+    reported = []
+    with patch("transfer.fcntl", None), patch("transfer._unsupported", set()), \
+         patch("os.copy_file_range", side_effect=unsupported, create=True), \
+         patch("os.sendfile", side_effect=unsupported, create=True):
+        assert copy_file(str(src), str(tmp_path / "copy.bin"), 100, reported.append, buffer_size=7) == "userspace"
+        assert (tmp_path / "copy.bin").read_bytes() == bytes(range(100))
+        assert sum(reported) == 100 and len(reported) == 15
+
+        cancel = threading.Event()
+        result = copy_file(str(src), str(tmp_path / "half.bin"), 100, lambda n: cancel.set(), cancel, buffer_size=7)
+        assert result is None
+        assert not (tmp_path / "half.bin").exists()
+
+    # macOS: os.sendfile има, но пише само в сокет - изобщо не се пробва
+    with patch("transfer.fcntl", None), patch("transfer._unsupported", set()), patch("transfer._SENDFILE_TO_FILE", False), \
+         patch("os.copy_file_range", side_effect=unsupported, create=True), \
+         patch("os.sendfile", side_effect=TypeError("offset"), create=True):
+        assert copy_file(str(src), str(tmp_path / "mac.bin"), 100, lambda n: None) == "userspace"
+        assert (tmp_path / "mac.bin").read_bytes() == bytes(range(100))
+
+def test_batch_cut_renames_within_device_and_verifies_across(tmp_path):
+    """На същото устройство файлът се преименува (същият inode), между устройства - копие с проверка"""
+    base = tmp_path / "base"
+    (base / "sub").mkdir(parents=True)
+    a = base / "sub" / "a.bin"; a.write_bytes(b"a" * 5000)
+    b = base / "sub" / "b.bin"; b.write_bytes(b"b" * 5000)
+    inode = a.stat().st_ino
+
+    count, err, moved = batch_cut([str(a)], str(tmp_path / "dest"), str(base))
+    assert (count, err, moved) == (1, 0, [str(a)])
+    assert (tmp_path / "dest" / "sub" / "a.bin").stat().st_ino == inode
+    assert not a.exists()
+
+    # Симулиран друг дял: os.replace връща EXDEV
+    with patch("os.replace", side_effect=OSError(errno.EXDEV, "cross-device")):
+        count, err, moved = batch_cut([str(b)], str(tmp_path / "dest"), str(base))
+    assert (count, err) == (1, 0)
+    assert (tmp_path / "dest" / "sub" / "b.bin").read_bytes() == b"b" * 5000
+    assert not b.exists()
+
+def test_move_across_devices_keeps_source_on_mismatch(tmp_path):
+    src = tmp_path / "src.bin"
+    src.write_bytes(b"payload" * 100)
+    dst = tmp_path / "dst.bin"
+    # Хешът на източника е "развален" - копието не минава проверката
+    with patch("transfer.hashlib.blake2b", side_effect=[hashlib.blake2b(b"corrupt"), hashlib.blake2b()]):
+        with pytest.raises(OSError):
+            move_across_devices(str(src), str(dst), lambda n: None, buffer_size=64)
+    assert src.exists() and not dst.exists()
+
+    assert move_across_devices(str(src), str(dst), lambda n: None, buffer_size=64) == "copy+verify"
+    assert dst.read_bytes() == b"payload" * 100 and not src.exists()
+
+def test_batch_delete_parallel_prune_and_cancel(tmp_path):
+    """Паралелното триене праща прогрес, празните папки се чистят до корена, а отказът спира всичко"""
+    files = []
+    for d in ("a/b", "a/c", "keep"):
+        (tmp_path / d).mkdir(parents=True)
+        for i in range(30):
+            f = tmp_path / d / f"f{i}.txt"
+            f.touch()
+            files.append(str(f))
+    (tmp_path / "keep" / "other.txt").touch()
+
+    events = []
+    count, err, deleted = batch_delete(files, on_progress=events.append)
+    assert (count, err) == (90, 0) and deleted == files
+    assert events[-1].files_done == 90
+
+    pruned = prune_empty_dirs({os.path.dirname(p) for p in deleted}, str(tmp_path))
+    assert sorted(pruned) == sorted([str(tmp_path / "a" / "b"), str(tmp_path / "a" / "c"), str(tmp_path / "a")])
+    assert (tmp_path / "keep").exists() and tmp_path.exists()
+
+    (tmp_path / "x.txt").touch()
+    cancel = threading.Event()
+    cancel.set()
+    assert batch_delete([str(tmp_path / "x.txt")], cancel=cancel) == (0, 0, [])
+    assert (tmp_path / "x.txt").exists()
+
+def test_job_scheduler_runs_in_order_with_pause_and_cancel():
+    """Задачите вървят една по една; пауза блокира token.is_set(), а отказът събужда задачата"""
+    updates = []
+    scheduler = JobScheduler(on_update=lambda job: updates.append((job.id, job.status)))
+    started = threading.Event()
+    order = []
+
+    def long_job(job):
+        started.set()
+        steps = 0
+        while not job.token.is_set():
+            steps += 1
+            job.report(steps)
+        order.append("long")
+        return steps
+
+    first = scheduler.submit("long", long_job)
+    second = scheduler.submit("short", lambda job, x: order.append("short") or x * 2, 21)
+    failing = scheduler.submit("boom", lambda job: 1 / 0)
+
+    assert started.wait(2)
+    first.pause()
+    assert first.status == PAUSED
+    first.cancel()
+    assert failing.wait(2)
+    assert (first.status, second.status, failing.status) == (CANCELLED, DONE, FAILED)
+    assert second.result == 42 and isinstance(failing.error, ZeroDivisionError)
+    assert order == ["long", "short"]
+    assert scheduler.active() == []
+    assert (first.id, PAUSED) in updates
+
+def test_export_streams_csv_jsonl_and_compressed_from_store(tmp_path):
+    """Експортът чете FileStore директно, филтрира по маркирани и поддържа csv/jsonl/.gz"""
+    store = FileStore()
+    store.reset(str(tmp_path))
+    ts = datetime(2024, 5, 1, 10, 30).timestamp()
+    store.add_batch(("d",), [("a,b.txt", 10, ts, False), ('q"uote.sys', 20, ts, True), ("c.txt", 30, ts, False)])
+
+    assert generate_export_report(str(tmp_path / "all.csv"), store, None, str(tmp_path)) == 3
+    with open(tmp_path / "all.csv", encoding="utf-8", newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["path", "size", "mtime", "system"]
+    assert rows[1] == [os.path.join(str(tmp_path), "d", "a,b.txt"), "10", "2024-05-01T10:30:00", "0"]
+
+    store.select([store.lookup(os.path.join(str(tmp_path), "d", 'q"uote.sys'))])
+    assert generate_export_report(str(tmp_path / "sel.jsonl.gz"), store, None, str(tmp_path)) == 1
+    with gzip.open(tmp_path / "sel.jsonl.gz", "rt", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert records == [{"path": os.path.join(str(tmp_path), "d", 'q"uote.sys'), "size": 20, "mtime": "2024-05-01T10:30:00", "system": True}]
+
+    cancel = threading.Event()
+    cancel.set()
+    assert generate_export_report(str(tmp_path / "x.txt"), store, None, str(tmp_path), cancel=cancel) is None
+    assert not (tmp_path / "x.txt").exists()
+
+def test_find_duplicates_pipeline_and_hash_cache(tmp_path):
+    """Размер -> частичен хеш -> пълен хеш; кешът по (път, размер, mtime) спестява повторното четене"""
+    big = b"H" * DUP_BLOCK_SIZE + b"middle" * 50000 + b"T" * DUP_BLOCK_SIZE
+    other_middle = b"H" * DUP_BLOCK_SIZE + b"MIDDLE" * 50000 + b"T" * DUP_BLOCK_SIZE
+    contents = {"a1": big, "a2": big, "b": other_middle, "s1": b"small", "s2": b"small", "u": b"unique!", "e1": b"", "e2": b""}
+    candidates = []
+    for key, data in contents.items():
+        p = tmp_path / key
+        p.write_bytes(data)
+        st = p.stat()
+        candidates.append((key, str(p), st.st_size, st.st_mtime))
+
+    cache = HashCache(str(tmp_path / "cache" / "hashes.db"))
+    groups = find_duplicates(candidates, cache)
+    assert [sorted(g.keys) for g in groups] == [["a1", "a2"], ["s1", "s2"]]
+    assert groups[0].size == len(big)
+
+    # Втори път (нов обект, същата база) - нищо не се чете от диска
+    with patch("duplicates.partial_hash", side_effect=AssertionError), patch("duplicates.full_hash", side_effect=AssertionError):
+        again = find_duplicates(candidates, HashCache(str(tmp_path / "cache" / "hashes.db")))
+    assert [sorted(g.keys) for g in again] == [["a1", "a2"], ["s1", "s2"]]
+
+    cancel = threading.Event()
+    cancel.set()
+    assert find_duplicates(candidates, cancel=cancel) is None
+
+    # Отказ по време на частичния хеш - останалите файлове не се четат
+    import duplicates
+    same = []
+    for i in range(50):
+        (tmp_path / f"p{i}").write_bytes(b"%05d" % i)
+        same.append((i, str(tmp_path / f"p{i}"), 5, 0.0))
+    cancel, read = threading.Event(), []
+    real_partial = duplicates.partial_hash
+    def spy(path, size, cancel_token):
+        if not cancel_token.is_set(): read.append(path)
+        cancel.set()
+        return real_partial(path, size, cancel_token)
+    with patch("duplicates.partial_hash", side_effect=spy):
+        assert find_duplicates(same, max_workers=1, cancel=cancel) is None
+    assert len(read) == 1
+
+def test_disk_usage_rollups_top_n_and_histograms():
+    """Размерите на папките са агрегатите на дървото, най-големите файлове/папки и хистограми; кешира се до промяна"""
+    now = 1_700_000_000
+    store = FileStore()
+    store.reset("/r")
+    store.add_batch((), [("root.txt", 5, now, False)])
+    store.add_batch(("a",), [("big.iso", 1000, now - 400 * DAY, False), ("x.txt", 10, now - 2 * DAY, False)])
+    store.add_batch(("a", "b"), [("y.TXT", 300, now - 3600, False)])
+    store.add_batch(("c",), [("z", 50, now - 40 * DAY, False)])
+    assert (store.root.file_count, store.total_size) == (5, 1365)
+
+    usage = DiskUsage(store)
+    assert usage.refresh(now=now) is True
+    assert usage.refresh(now=now) is False
+    assert usage.dir_size(store.root) == 1365
+    assert [(n.name, c, s) for n, c, s in usage.top_dirs(3)] == [("a", 3, 1310), ("b", 1, 300), ("c", 1, 50)]
+    assert [store.table.names[i] for i, _ in usage.top_files(2)] == ["big.iso", "y.TXT"]
+    assert usage.extensions(2) == [(".iso", 1, 1000), (".txt", 3, 315)]
+    assert [(c, s) for _, c, s in usage.ages()] == [(2, 305), (1, 10), (0, 0), (1, 50), (1, 1000)]
+
+    # Изтриване променя таблицата - следващият refresh преизчислява
+    store.remove("/r/a/big.iso")
+    assert usage.refresh(now=now) is True
+    assert usage.top_dirs(1)[0][2] == 310 == store.root.children["a"].total_size
+    assert usage.top_files(1)[0][1] == 300
+
+def test_scan_budget_cancel_and_limits_return_partial_tree(tmp_path):
+    """Отказ, лимит на времето и на файловете спират сканирането с валиден частичен резултат"""
+    for d in range(5):
+        (tmp_path / f"d{d}").mkdir()
+        for f in range(4): (tmp_path / f"d{d}" / f"f{f}.txt").write_text("abc")
+    start_date = datetime.now() - timedelta(days=1)
+    end_date = datetime.now() + timedelta(days=1)
+
+    budget = ScanBudget(max_files=6)
+    root, matched, total_size, _ = scan_directory(str(tmp_path), start_date, end_date, [], budget=budget)
+    assert budget.reason == SCAN_FILE_LIMIT
+    assert len(matched) == root.file_count == 6 and total_size == 18
+
+    for workers in (1, 8):
+        budget = ScanBudget(time_budget=0)
+        root, matched, _, _ = scan_directory(str(tmp_path), start_date, end_date, [], max_workers=workers, budget=budget)
+        assert budget.reason == SCAN_TIME_LIMIT and len(matched) == 0 and root.file_count == 0
+
+    # Отказ след първата папка с файлове - дървото съдържа само вече подадените папки
+    cancel = threading.Event()
+    budget = ScanBudget(cancel)
+    store = FileStore()
+    store.reset(str(tmp_path))
+    for parts, files in iter_scan_directory(str(tmp_path), start_date, end_date, [], max_workers=8, budget=budget):
+        store.add_batch(parts, files)
+        if files: cancel.set()
+    assert budget.reason == SCAN_CANCELLED
+    assert len(store) == store.root.file_count == 4
+
+    budget = ScanBudget(threading.Event(), time_budget=60, max_files=1000)
+    _, matched, _, _ = scan_directory(str(tmp_path), start_date, end_date, [], budget=budget)
+    assert budget.reason is None and len(matched) == 20
+
+    # Отказ по време на обновяване на индекса - непосетените папки не се трият от него
+    from scan_index import ScanIndex
+    index = ScanIndex(str(tmp_path.parent / (tmp_path.name + "_index.db")))
+    scan_directory(str(tmp_path), start_date, end_date, [], index=index)
+    for workers in (1, 8):
+        cancel = threading.Event()
+        budget = ScanBudget(cancel)
+        for parts, files in iter_scan_directory(str(tmp_path), start_date, end_date, [], max_workers=workers, index=index, budget=budget):
+            if files: cancel.set()
+        assert budget.reason == SCAN_CANCELLED
+        _, matched, _, _ = scan_directory(str(tmp_path), start_date, end_date, [], index=index, refresh_index=False)
+        assert len(matched) == 20
+
+def test_scan_rules_compile_and_prune_excluded_dirs(tmp_path):
+    """Шаблоните като в .gitignore; изключените папки не се listing-ват, и при индекса"""
+    from scan_index import ScanIndex
+    rules = ScanRules(["txt", ".MD", "report_*.pdf", "docs/**/*.csv"], ["*.tmp", "build/", "/top_only.txt"])
+    assert rules.include_exts == {".md"} and rules.exclude_exts == {".tmp"}
+    assert rules.match_file("", "README.md") and rules.match_file("x/", "report_2024.PDF")
+    assert rules.match_file("docs/a/b/", "t.csv") and not rules.match_file("other/", "t.csv")
+    assert not rules.match_file("", "top_only.txt") and not rules.match_file("", "notes.txt")  # "txt" без точка е шаблон за име
+    assert not rules.match_file("", "x.tmp") and not ScanRules(["*.txt"], ["*.tmp"]).match_file("", "a.tmp")
+    assert rules.skip_dir("a/", "build") and not rules.skip_dir("", "build.py")
+    assert ScanRules([".tar.gz"]).match_file("", "x.tar.GZ") and not ScanRules([".tar.gz"]).match_file("", "x.gz")
+    assert not ScanRules([], [".tar.gz"]).match_file("a/", "x.tar.gz")
+    assert rules.skip_path(("a", "build", "c")) and not rules.skip_path(("a", "c"))
+
+    for rel in ("keep/a.txt", "node_modules/pkg/index.txt", "src/.git/HEAD.txt", "src/b.txt", "src/b.tmp"):
+        (tmp_path / rel).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / rel).write_text("x")
+    start_date = datetime.now() - timedelta(days=1)
+    end_date = datetime.now() + timedelta(days=1)
+
+    listed = []
+    real_scandir = os.scandir
+    def spy(path):
+        listed.append(os.path.relpath(path, tmp_path))
+        return real_scandir(path)
+    with patch("operations.os.scandir", side_effect=spy):
+        _, matched, _, _ = scan_directory(str(tmp_path), start_date, end_date, [".txt"], exclude=["node_modules/", ".git/", "*.tmp"])
+    assert sorted(os.path.relpath(m[0], tmp_path) for m in matched) == [os.path.join("keep", "a.txt"), os.path.join("src", "b.txt")]
+    assert not any(p.startswith("node_modules") or ".git" in p for p in listed)
+
+    index = ScanIndex(str(tmp_path.parent / (tmp_path.name + "_index.db")))
+    _, matched, _, _ = scan_directory(str(tmp_path), start_date, end_date, [], index=index, exclude=["node_modules/"])
+    assert len(matched) == 4 and index.listed_dirs == 4  # корен, keep, src, src/.git
+    _, matched, _, _ = scan_directory(str(tmp_path), start_date, end_date, [], index=index, refresh_index=False, exclude=["src/"])
+    assert [os.path.basename(m[0]) for m in matched] == ["a.txt"]
+    # Без изключването папката се listing-ва, макар родителят ѝ да е непроменен
+    _, matched, _, _ = scan_directory(str(tmp_path), start_date, end_date, [], index=index, exclude=())
+    assert len(matched) == 5 and index.listed_dirs == 2  # node_modules, node_modules/pkg
+
+def test_rel_base_rules_match_with_and_without_index(tmp_path):
+    """Поддърво с rel_base: шаблоните по път дават същото при живо обхождане и през индекса"""
+    from scan_index import ScanIndex
+    for rel in ("proj/sub/keep.txt", "proj/sub/cache/x.txt", "proj/sub/deep/cache/y.txt", "proj/sub/deep/z.log"):
+        (tmp_path / rel).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / rel).write_text("x")
+    start_date = datetime.now() - timedelta(days=1)
+    end_date = datetime.now() + timedelta(days=1)
+    target = str(tmp_path / "proj" / "sub")
+    include, exclude = ["sub/**/*.txt"], ["/sub/cache/"]  # закотвени към корена на шаблоните (proj)
+
+    def names(**kw):
+        return sorted(name for _, files in iter_scan_directory(target, start_date, end_date, include, exclude=exclude,
+                                                                rel_base="sub/", **kw) for name, *_ in files)
+    index = ScanIndex(str(tmp_path / "index.db"))
+    expected = ["keep.txt", "y.txt"]
+    assert names() == expected
+    assert names(index=index) == expected
+    assert names(index=index, refresh_index=False) == expected
+
+def test_system_shield_trie_exceptions_and_symlinked_root(tmp_path):
+    """Решение веднъж на папка: компоненти на пътя (не префикс на низ), изключения и резолвиран корен"""
+    sysroot = tmp_path / "Sys"
+    (sysroot / "cache").mkdir(parents=True)
+    (tmp_path / "System2").mkdir()
+    for rel in ("Sys/conf.txt", "Sys/cache/tmp.txt", "System2/a.txt", "plain.dll"):
+        (tmp_path / rel).write_text("x")
+    (tmp_path / "link").symlink_to(sysroot, target_is_directory=True)
+
+    shield = SystemShield([str(tmp_path / "sys"), "!" + str(sysroot / "cache")], exts=[".dll"])
+    start_date = datetime.now() - timedelta(days=1)
+    end_date = datetime.now() + timedelta(days=1)
+    _, matched, _, _ = scan_directory(str(tmp_path), start_date, end_date, [], shield=shield)
+    flags = {os.path.relpath(m[0], tmp_path): m[3] for m in matched}
+    assert flags == {os.path.join("Sys", "conf.txt"): True, os.path.join("Sys", "cache", "tmp.txt"): False,
+                     os.path.join("System2", "a.txt"): False, "plain.dll": True}
+
+    # Сканиране през symlink към системната папка - коренът се резолвира
+    _, matched, _, has_sys = scan_directory(str(tmp_path / "link"), start_date, end_date, [], shield=shield)
+    assert has_sys and {os.path.basename(m[0]): m[3] for m in matched} == {"conf.txt": True, "tmp.txt": False}
+    assert shield.classify_path(str(tmp_path / "link" / "conf.txt")) is True
+
+    # Наборите правила се комбинират; без съвпадение по пътя решава само разширението
+    posix = SystemShield.from_rule_sets("posix", "macos", exts=[".so"])
+    assert posix.classify_path("/usr/lib/x.txt") and posix.classify_path("/System/Library/x.txt")
+    assert not posix.classify_path("/usrlocal/x.txt") and posix.classify_path("/home/u/libx.so")
+
+def test_generate_test_data_is_deterministic_sparse_and_shaped(tmp_path):
+    """Еднакъв seed дава еднакво дърво (и при паралелно създаване); файловете са sparse"""
+    from generate_test_data import generate, CHUNK_FILES
+
+    def listing(root):
+        return sorted((os.path.relpath(os.path.join(d, f), root), os.path.getsize(os.path.join(d, f)), os.path.getmtime(os.path.join(d, f)))
+                      for d, _, files in os.walk(root) for f in files)
+
+    a = generate(str(tmp_path / "a"), seed=3, depth=4, fanout=(1, 3), files=(0, 20), max_files=150, workers=8)
+    b = generate(str(tmp_path / "b"), seed=3, depth=4, fanout=(1, 3), files=(0, 20), max_files=150, workers=1)
+    assert a.files == b.files == 150 and a.bytes == b.bytes
+    # Датите със seed попадат във филтъра по подразбиране на приложението (от 01/01/2024 до днес)
+    mtimes = [f[2] for f in listing(tmp_path / "a")]
+    assert any(datetime(2024, 1, 1).timestamp() <= m <= datetime.now().timestamp() for m in mtimes)
+    c = generate(str(tmp_path / "c"), seed=3, files=(5, 5), roots=1, depth=1, days=10, end_ts=datetime(2025, 6, 30).timestamp())
+    assert c.files == 5 and all(datetime(2025, 6, 20) <= datetime.fromtimestamp(f[2]) <= datetime(2025, 6, 30) for f in listing(tmp_path / "c"))
+    assert listing(tmp_path / "a") == listing(tmp_path / "b")
+    big = max(listing(tmp_path / "a"), key=lambda f: f[1])
+    assert os.stat(tmp_path / "a" / big[0]).st_blocks * 512 < big[1]
+
+    flat = generate(str(tmp_path / "flat"), seed=1, shape="flat", files=(0, CHUNK_FILES + 5), sizes="zero")
+    assert flat.files == len(os.listdir(tmp_path / "flat" / "Flat_Folder")) == CHUNK_FILES + 5
+    deep = generate(str(tmp_path / "deep"), seed=1, shape="deep", depth=30, files=(1, 1))
+    assert deep.dirs == 30 and len(listing(tmp_path / "deep")[0][0].split(os.sep)) == 31
+    with pytest.raises(ValueError, match="--depth 5000"):
+        generate(str(tmp_path / "too_deep"), seed=1, shape="deep", depth=5000, files=(1, 1))
+
+def test_benchmark_suite_percentiles_and_baseline_regressions(tmp_path):
+    """Перцентилите интерполират, а сравнението с базата хваща само забавянията над прага"""
+    from benchmark_suite import percentile, compare, measure, main
+    assert percentile([3, 1, 2, 4], 50) == 2.5 and percentile([5], 99) == 5 and percentile([1, 2], 100) == 2
+
+    result = measure("noop", 10, 10, lambda _: sum(range(1000)), repeat=3)
+    assert result["peak_bytes"] is not None and result["min_s"] <= result["median_s"] <= result["max_s"]
+
+    baseline = {"results": [{"name": "scan", "size": 1000, "median_s": 0.10}, {"name": "sort", "size": 1000, "median_s": 0.10}]}
+    current = [{"name": "scan", "size": 1000, "median_s": 0.14}, {"name": "sort", "size": 1000, "median_s": 0.11},
+               {"name": "new", "size": 1000, "median_s": 1.0}]
+    assert [r[0] for r in compare(current, baseline, 0.25)] == ["scan@1000"]
+
+    out = tmp_path / "bench.json"
+    assert main(["--sizes", "60", "--repeat", "1", "--op-files", "20", "--no-memory", "--output", str(out)]) == 0
+    results = {r["name"]: r for r in json.loads(out.read_text(encoding="utf-8"))["results"]}
+    assert {"scan", "natural_sort", "tree_build", "export_csv", "batch_copy", "batch_cut", "batch_delete"} <= results.keys()
+    assert results["scan"]["items"] == results["scan_parallel"]["items"] == 60
+
+def test_timings_counters_for_scan_and_export_and_cprofile_dump(tmp_path):
+    """Фазите и броячите на сканирането/експорта се събират в Timings; cProfile записва .prof"""
+    import pstats
+    from profiling import Timings, run_profiled
+    data = tmp_path / "data"
+    (data / "a").mkdir(parents=True)
+    (data / "node_modules").mkdir()
+    for rel in ("a/one.txt", "a/two.log", "top.txt", "node_modules/x.txt"):
+        (data / rel).write_text("x")
+    start_date = datetime.now() - timedelta(days=1)
+    end_date = datetime.now() + timedelta(days=1)
+
+    stats = Timings("scan")
+    _, matched, _, _ = scan_directory(str(data), start_date, end_date, [".txt"], max_workers=4, exclude=["node_modules/"], stats=stats)
+    stats.finish()
+    assert len(matched) == 2
+    assert dict(stats.counters) == {"dirs": 2, "entries": 5, "stat": 3, "pruned": 1, "matched": 2}
+    assert {"walk", "classify", "tree"} <= stats.spans.keys()
+    assert "2 съвпадения" in stats.format() and stats.format().startswith("сканиране ")
+
+    # Както в приложението - през индекса: първо listing на всичко, после само от индекса
+    from scan_index import ScanIndex
+    index = ScanIndex(str(tmp_path / "index.db"))
+    for refresh, expected in ((True, {"dirs": 2, "entries": 5, "stat": 5, "pruned": 1, "matched": 2}),
+                              (True, {"reused": 2, "stat": 2, "pruned": 1, "matched": 2}),
+                              (False, {"reused": 2, "pruned": 1, "matched": 2})):
+        stats = Timings("scan")
+        scan_directory(str(data), start_date, end_date, [".txt"], index=index, refresh_index=refresh, exclude=["node_modules/"], stats=stats)
+        assert dict(stats.counters) == expected and "walk" in stats.spans
+
+    export_stats = Timings("export")
+    store = FileStore()
+    store.reset(str(data))
+    store.add_batch(("a",), [("one.txt", 1, 0.0, False)])
+    generate_export_report(str(tmp_path / "r.jsonl"), store, None, str(data), stats=export_stats)
+    assert export_stats.counters["rows"] == 1 and {"format", "write"} <= export_stats.spans.keys()
+
+    prof = tmp_path / "profiles" / "scan.prof"
+    assert run_profiled(str(prof), sum, [1, 2, 3]) == 6
+    assert pstats.Stats(str(prof)).total_calls > 0
+
+def test_virtual_list_drops_controls_of_previous_window():
+    """При всеки нов прозорец on_render чисти препратките - държат се само редовете на текущия"""
+    import flet as ft
+    from ui_components import VirtualList
+    live = []
+    lock = threading.Lock()
+    def build_row(row):
+        assert lock.locked()  # редовете се строят под lock-а на данните, и при скрол
+        live.append(row)
+        return ft.Text(str(row))
+    vlist = VirtualList(ft.ListView(), 20, build_row, overscan=10, on_render=live.clear, lock=lock)
+    vlist.set_rows(list(range(1000)))
+    for first in range(0, 900, 50):
+        vlist.first_visible = first
+        vlist.render()
+    assert live == list(range(*vlist.window)) and len(live) <= vlist.viewport_rows + 2 * vlist.overscan
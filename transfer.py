@@ -0,0 +1,350 @@
+import os
+import sys
+import errno
+import shutil
+import hashlib
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from utils import COPY_SMALL_WORKERS, COPY_LARGE_WORKERS, COPY_LARGE_FILE_SIZE, COPY_BUFFER_SIZE, COPY_KERNEL_CHUNK, DELETE_MAX_WORKERS, PROGRESS_INTERVAL
+
+try:
+    import fcntl
+except ImportError:  # Windows - няма ioctl, остават другите механизми
+    fcntl = None
+
+COPY_METHODS = ("reflink", "copy_file_range", "sendfile", "userspace")
+FICLONE = 0x40049409  # _IOW(0x94, 9, int) от linux/fs.h
+# Грешки, които значат "механизмът не се поддържа тук" (друга файлова система, стар kernel и т.н.)
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF, errno.ENOTSUP, errno.ENOTSOCK}
+# sendfile към обикновен файл има само в Linux - на macOS/BSD целта трябва да е сокет (ENOTSOCK, а offset=None е TypeError)
+_SENDFILE_TO_FILE = sys.platform.startswith("linux")
+# (механизъм, st_dev на източника, st_dev на целта), за които механизмът вече е отказал - не се опитва пак
+_unsupported = set()
+_UNLINK_DIR_FD = os.unlink in os.supports_dir_fd and hasattr(os, "O_DIRECTORY")
+
+# Събитие за прогрес при масова операция. throughput е в байтове/сек, eta в секунди (None докато е неизвестно).
+TransferProgress = namedtuple("TransferProgress", "files_done files_total bytes_done bytes_total errors elapsed throughput eta")
+# Задача от plan_transfers: абсолютни пътища, размер, пътят както е подаден и дали целта е на същото устройство (st_dev)
+TransferTask = namedtuple("TransferTask", "src dst size path same_device")
+
+class ProgressTracker:
+    """Брояч на прогреса, общ за всички работни нишки. Снимка се взима от извикващата нишка."""
+
+    def __init__(self, files_total, bytes_total):
+        self.cond = threading.Condition()
+        self.files_total = files_total
+        self.bytes_total = bytes_total
+        self.files_done = 0
+        self.bytes_done = 0
+        self.errors = 0
+        self.finished = 0
+        self.start = perf_counter()
+
+    def add_bytes(self, n):
+        with self.cond:
+            self.bytes_done += n
+
+    def finish(self, size, copied, status):
+        # status: True - успех, False - грешка, None - отказано преди края
+        with self.cond:
+            self.finished += 1
+            if status: self.files_done += 1
+            else:
+                # Недовършеният файл не участва нито в направеното, нито в оставащото
+                self.bytes_done -= copied
+                self.bytes_total -= size
+                if status is False: self.errors += 1
+            if self.finished == self.files_total: self.cond.notify_all()
+
+    def wait(self, timeout):
+        with self.cond:
+            if self.finished < self.files_total: self.cond.wait(timeout)
+            return self.finished == self.files_total
+
+    def snapshot(self):
+        with self.cond:
+            elapsed = perf_counter() - self.start
+            throughput = self.bytes_done / elapsed if elapsed > 0 else 0.0
+            if self.bytes_total:
+                eta = (self.bytes_total - self.bytes_done) / throughput if throughput > 0 else None
+            else:
+                # Операции без байтове (триене) - ETA по броя файлове
+                rate = self.finished / elapsed if elapsed > 0 else 0.0
+                eta = (self.files_total - self.finished) / rate if rate > 0 else None
+            return TransferProgress(self.files_done, self.files_total, self.bytes_done, self.bytes_total,
+                                    self.errors, elapsed, throughput, eta)
+
+def run_transfers(tasks, work, on_progress=None, cancel=None,
+                  small_workers=COPY_SMALL_WORKERS, large_workers=COPY_LARGE_WORKERS, large_size=COPY_LARGE_FILE_SIZE):
+    # tasks са TransferTask. work(източник, цел, размер, on_bytes, cancel) връща истина при успех, None при отказ.
+    # Малките и големите файлове са в отделни пулове, за да не чакат стотици малки зад няколко големи.
+    # on_progress се вика само от тази нишка, най-много веднъж на PROGRESS_INTERVAL секунди.
+    # Връща резултата на work за всяка задача в реда на tasks, False при грешка или None (отказано).
+    results = [None] * len(tasks)
+    if not tasks: return results
+    tracker = ProgressTracker(len(tasks), sum(task.size for task in tasks))
+
+    def run_one(i):
+        src, dst, size = tasks[i][:3]
+        copied = [0]
+        def on_bytes(n):
+            copied[0] += n
+            tracker.add_bytes(n)
+        status = None
+        if cancel is None or not cancel.is_set():
+            try:
+                status = work(src, dst, size, on_bytes, cancel)
+            except Exception as e:
+                logging.error(f"Грешка при обработка на {src}: {e}")
+                status = False
+        results[i] = status
+        tracker.finish(size, copied[0], status)
+
+    small_pool = ThreadPoolExecutor(max_workers=max(1, small_workers))
+    large_pool = ThreadPoolExecutor(max_workers=max(1, large_workers))
+    try:
+        # Големите тръгват първи - те определят общото време
+        order = sorted(range(len(tasks)), key=lambda i: tasks[i].size < large_size)
+        for i in order:
+            (large_pool if tasks[i].size >= large_size else small_pool).submit(run_one, i)
+    finally:
+        _wait_with_progress(tracker, (small_pool, large_pool), on_progress, cancel)
+    return results
+
+def _wait_with_progress(tracker, pools, on_progress, cancel):
+    # Чака всички задачи, като праща прогрес от тази нишка най-много веднъж на PROGRESS_INTERVAL секунди.
+    # При отказ незапочнатите задачи се махат от пуловете, а текущите спират на следващата си стъпка.
+    try:
+        while not tracker.wait(PROGRESS_INTERVAL):
+            if cancel is not None and cancel.is_set(): break
+            if on_progress: on_progress(tracker.snapshot())
+    finally:
+        cancelled = cancel is not None and cancel.is_set()
+        for pool in pools: pool.shutdown(wait=True, cancel_futures=cancelled)
+    if on_progress: on_progress(tracker.snapshot())
+
+def _same_file(src, dst):
+    # Същият файл през друг път (symlink към папката, bind mount, твърда връзка) - "wb" би изтрил източника
+    try: return os.path.samefile(src, dst)
+    except OSError: return False  # целта още не съществува
+
+def copy_file(src, dst, size, on_bytes, cancel=None, buffer_size=COPY_BUFFER_SIZE):
+    # Копира данните по най-евтиния наличен механизъм и после метаданните (като shutil.copy2).
+    # Връща името на използвания механизъм (от COPY_METHODS) или None при отказ по средата.
+    if _same_file(src, dst): raise shutil.SameFileError(f"{src} и {dst} са един и същ файл")
+    with open(src, "rb", buffering=0) as fsrc, open(dst, "wb", buffering=0) as fdst:
+        method = _copy_data(fsrc, fdst, on_bytes, cancel, buffer_size)
+    if method is None:
+        # Отказано по средата - не оставяме половин файл
+        _remove_quietly(dst)
+        return None
+    shutil.copystat(src, dst)
+    return method
+
+class _Unsupported(Exception):
+    pass
+
+def _copy_data(fsrc, fdst, on_bytes, cancel, buffer_size):
+    src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+    src_st = os.fstat(src_fd)
+    devs = (src_st.st_dev, os.fstat(dst_fd).st_dev)
+
+    # 1. Reflink (btrfs, XFS с reflink=1): само метаданни, блоковете се споделят до първия запис
+    if fcntl is not None and ("reflink",) + devs not in _unsupported:
+        try:
+            fcntl.ioctl(dst_fd, FICLONE, src_fd)
+            on_bytes(src_st.st_size)
+            return "reflink"
+        except OSError as e:
+            if e.errno not in _FALLBACK_ERRNOS: raise
+            _unsupported.add(("reflink",) + devs)
+
+    # 2-3. Копиране в ядрото, без данните да минават през Python
+    kernel_paths = (
+        ("copy_file_range", lambda: os.copy_file_range(src_fd, dst_fd, COPY_KERNEL_CHUNK)),
+        ("sendfile", lambda: os.sendfile(dst_fd, src_fd, None, COPY_KERNEL_CHUNK)),
+    )
+    for method, copy_chunk in kernel_paths:
+        if not hasattr(os, method) or (method,) + devs in _unsupported: continue
+        if method == "sendfile" and not _SENDFILE_TO_FILE: continue
+        try:
+            return method if _kernel_copy(copy_chunk, src_st.st_size, on_bytes, cancel) else None
+        except _Unsupported:
+            _unsupported.add((method,) + devs)
+
+    # 4. Поточно копиране в userspace с буфер buffer_size
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    while True:
+        if cancel is not None and cancel.is_set(): return None
+        n = fsrc.readinto(buf)
+        if not n: return "userspace"
+        _write_all(fdst, view[:n])
+        on_bytes(n)
+
+def _write_all(fdst, data):
+    # Небуферираният FileIO.write може да запише по-малко от подаденото
+    while data:
+        data = data[fdst.write(data):]
+
+def move_file(src, dst, size, on_bytes, cancel=None, same_device=True, buffer_size=COPY_BUFFER_SIZE):
+    # В рамките на едно устройство - атомарно os.replace (O(1), без копиране на данни).
+    # EXDEV (напр. bind mount на същата файлова система) или различно устройство - проверено копие + триене.
+    if same_device:
+        try:
+            os.replace(src, dst)
+            on_bytes(size)
+            return "rename"
+        except OSError as e:
+            if e.errno != errno.EXDEV: raise
+    return move_across_devices(src, dst, on_bytes, cancel, buffer_size)
+
+def move_across_devices(src, dst, on_bytes, cancel=None, buffer_size=COPY_BUFFER_SIZE):
+    # Поточно копие, което хешира източника докато пише, fsync на целта, после целта се прочита
+    # и хешът се сравнява. Източникът се трие само ако копието е идентично и е на диска.
+    if _same_file(src, dst): raise shutil.SameFileError(f"{src} и {dst} са един и същ файл")
+    src_hash = hashlib.blake2b()
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    with open(src, "rb", buffering=0) as fsrc, open(dst, "wb", buffering=0) as fdst:
+        while True:
+            if cancel is not None and cancel.is_set(): break
+            n = fsrc.readinto(buf)
+            if not n:
+                os.fsync(fdst.fileno())
+                break
+            src_hash.update(view[:n])
+            _write_all(fdst, view[:n])
+            on_bytes(n)
+    if cancel is not None and cancel.is_set():
+        _remove_quietly(dst)
+        return None
+
+    dst_hash = hashlib.blake2b()
+    with open(dst, "rb", buffering=0) as fcheck:
+        while True:
+            n = fcheck.readinto(buf)
+            if not n: break
+            dst_hash.update(view[:n])
+    if dst_hash.digest() != src_hash.digest():
+        _remove_quietly(dst)
+        raise OSError(f"Копието на {src} не съвпада с източника")
+    shutil.copystat(src, dst)
+    os.remove(src)
+    return "copy+verify"
+
+def _remove_quietly(path):
+    try: os.remove(path)
+    except OSError: pass
+
+def _kernel_copy(copy_chunk, size, on_bytes, cancel):
+    # Връща True при успех, None при отказ. _Unsupported само ако още нищо не е копирано -
+    # тогава отместванията на файловете са непокътнати и следващият механизъм започва отначало.
+    copied = 0
+    while True:
+        if cancel is not None and cancel.is_set(): return None
+        try:
+            n = copy_chunk()
+        except OSError as e:
+            if copied == 0 and e.errno in _FALLBACK_ERRNOS: raise _Unsupported()
+            raise
+        if n == 0:
+            # Някои файлови системи (procfs, част от FUSE) връщат 0 вместо грешка
+            if copied == 0 and size > 0: raise _Unsupported()
+            return True
+        copied += n
+        on_bytes(n)
+
+def plan_transfers(files_list, dest_folder, target_folder):
+    # Превръща пътищата в задачи (източник, цел, размер) със запазена структура спрямо target_folder.
+    # Папките на целите се създават веднъж тук. Файл, който би се копирал върху себе си, се пропуска.
+    # Връща (TransferTask-ове, брой грешки).
+    target_folder = os.path.normpath(os.path.abspath(target_folder))
+    dest_folder = os.path.normpath(os.path.abspath(dest_folder))
+    tasks, err_count = [], 0
+    dir_devs, failed_dirs = {}, set()  # папка на целта -> st_dev
+    for f_path in files_list:
+        try:
+            abs_f_path = os.path.normpath(os.path.abspath(f_path))
+            final_dest = os.path.join(dest_folder, os.path.relpath(abs_f_path, target_folder))
+            if abs_f_path == os.path.abspath(final_dest): continue
+            st = os.stat(abs_f_path)
+            try:
+                dst_st = os.stat(final_dest)
+                # Целта е същият файл през друг път (напр. symlink към папката) - пропуска се като горния случай
+                if (dst_st.st_dev, dst_st.st_ino) == (st.st_dev, st.st_ino): continue
+            except FileNotFoundError: pass
+            dest_dir = os.path.dirname(final_dest)
+            if dest_dir in failed_dirs: raise OSError(f"Неуспешно създаване на {dest_dir}")
+            if dest_dir not in dir_devs:
+                try:
+                    os.makedirs(dest_dir, exist_ok=True)
+                    dir_devs[dest_dir] = os.stat(dest_dir).st_dev
+                except OSError:
+                    failed_dirs.add(dest_dir)
+                    raise
+            tasks.append(TransferTask(abs_f_path, final_dest, st.st_size, f_path, st.st_dev == dir_devs[dest_dir]))
+        except Exception as e:
+            logging.error(f"Пропуснат файл {f_path}: {e}")
+            err_count += 1
+    return tasks, err_count
+
+def delete_files(paths, on_progress=None, cancel=None, max_workers=DELETE_MAX_WORKERS, chunk_size=1000):
+    # Трие паралелно, като задачата е порция файлове от една папка: папката се отваря веднъж, а
+    # файловете се трият с os.unlink(име, dir_fd=...) - без разрешаване на пълния път за всеки файл.
+    # Без dir_fd (Windows) се трие по пълен път. Връща статус за всеки път в реда на paths:
+    # True, False (грешка) или None (отказано).
+    results = [None] * len(paths)
+    if not paths: return results
+    by_dir = {}
+    for i, path in enumerate(paths):
+        head, name = os.path.split(path)
+        by_dir.setdefault(head, []).append((i, name))
+    tracker = ProgressTracker(len(paths), 0)
+
+    def delete_chunk(dir_path, entries):
+        dir_fd = None
+        if _UNLINK_DIR_FD:
+            try: dir_fd = os.open(dir_path or os.curdir, os.O_RDONLY | os.O_DIRECTORY)
+            except OSError: pass  # грешката (ако има) ще излезе при самото триене
+        try:
+            for i, name in entries:
+                if cancel is not None and cancel.is_set(): return
+                try:
+                    if dir_fd is not None: os.unlink(name, dir_fd=dir_fd)
+                    else: os.unlink(os.path.join(dir_path, name))
+                    results[i] = True
+                except OSError as e:
+                    logging.error(f"Грешка при изтриване на {paths[i]}: {e}")
+                    results[i] = False
+                tracker.finish(0, 0, results[i])
+        finally:
+            if dir_fd is not None: os.close(dir_fd)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        # Огромна плоска папка се дели на порции, за да не остане на една нишка
+        for dir_path, entries in by_dir.items():
+            for start in range(0, len(entries), chunk_size):
+                pool.submit(delete_chunk, dir_path, entries[start:start + chunk_size])
+    finally:
+        _wait_with_progress(tracker, (pool,), on_progress, cancel)
+    return results
+
+def prune_empty_dirs(dirs, stop_at):
+    # Премахва папките, останали празни, и нагоре по веригата им до stop_at (без нея).
+    # os.rmdir сам отказва непразна папка - проверката и премахването са една атомарна стъпка.
+    # Връща премахнатите папки (най-дълбоките първи).
+    stop_at = os.path.normpath(os.path.abspath(stop_at))
+    prefix = stop_at if stop_at.endswith(os.sep) else stop_at + os.sep
+    removed = []
+    for d in sorted({os.path.normpath(os.path.abspath(d)) for d in dirs}, key=lambda d: d.count(os.sep), reverse=True):
+        while d.startswith(prefix):
+            try: os.rmdir(d)
+            except OSError: break
+            removed.append(d)
+            d = os.path.dirname(d)
+    return removed
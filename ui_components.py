@@ -1,7 +1,69 @@
 import flet as ft
+from contextlib import nullcontext
+
+TREE_LINE_COLOR = "#252833"
+
+def indent_guides(depth):
+    # Вертикалните водещи линии за всяко ниво на вложеност в плоския изглед
+    return [
+        ft.Container(width=18, margin=ft.margin.only(left=14), border=ft.border.only(left=ft.border.BorderSide(1, TREE_LINE_COLOR)))
+        for _ in range(depth)
+    ]
+
+class VirtualList:
+    """Виртуализация над ListView: контроли се създават само за редовете около видимата област.
+
+    Над и под прозореца стоят празни контейнери с височината на пропуснатите редове,
+    така че скролбарът отговаря на целия списък. Всички редове са с еднаква височина.
+    on_render() се вика преди всеки нов прозорец - за да се изчистят препратките към старите редове.
+    lock пази данните, от които build_row чете - скролът строи редове от нишката на UI.
+    """
+
+    def __init__(self, list_view, row_height, build_row, overscan=40, on_render=None, lock=None):
+        self.list_view = list_view
+        self.row_height = row_height
+        self.build_row = build_row
+        self.overscan = overscan
+        self.on_render = on_render
+        self.lock = lock or nullcontext()
+        self.rows = []
+        self.first_visible = 0
+        self.viewport_rows = 30
+        self.window = (0, 0)
+        list_view.spacing = 0
+        list_view.on_scroll_interval = 50
+        list_view.on_scroll = self.on_scroll
+
+    def set_rows(self, rows):
+        self.rows = rows
+        self.first_visible = min(self.first_visible, max(0, len(rows) - 1))
+        self.render()
+
+    def render(self):
+        start = max(0, self.first_visible - self.overscan)
+        end = min(len(self.rows), self.first_visible + self.viewport_rows + self.overscan)
+        self.window = (start, end)
+        with self.lock:
+            if self.on_render: self.on_render()
+            self.list_view.controls = (
+                [ft.Container(height=start * self.row_height)]
+                + [ft.Container(content=self.build_row(row), height=self.row_height) for row in self.rows[start:end]]
+                + [ft.Container(height=(len(self.rows) - end) * self.row_height)]
+            )
+
+    def on_scroll(self, e):
+        self.viewport_rows = int(e.viewport_dimension // self.row_height) + 1
+        self.first_visible = int(max(0, e.pixels) // self.row_height)
+        start, end = self.window
+        margin = self.overscan // 2
+        # Прозорецът се мести чак когато видимата област наближи края му
+        if (start > 0 and self.first_visible - margin < start) or \
+           (end < len(self.rows) and self.first_visible + self.viewport_rows + margin > end):
+            self.render()
+            self.list_view.update()
 
 class CollapsibleDirectory(ft.Column):
-    def __init__(self, dir_name, content_controls, auto_expand=False, folder_checkbox=None, on_toggle_expand=None):
+    def __init__(self, dir_name, content_controls, auto_expand=False, folder_checkbox=None, on_toggle_expand=None, depth=0):
         super().__init__()
         self.spacing = 0 
         self.dir_name = dir_name
@@ -20,7 +82,8 @@ class CollapsibleDirectory(ft.Column):
         self.dir_label = ft.Text(f"📂 {self.dir_name}", weight=ft.FontWeight.BOLD, color="#F8FAFC")
         
         # --- МАГИЯТА ЗА ОРИЕНТАЦИЯ: Вертикалните водещи линии (Tree Lines) ---
-        self.files_container = ft.Container(
+        # content_controls=None е плосък ред за VirtualList - съдържанието е в следващите редове
+        self.files_container = None if content_controls is None else ft.Container(
             content=ft.Column(controls=content_controls, spacing=0),
             visible=self.is_expanded,
             # left=18 отдалечава файловете от линията
@@ -28,7 +91,7 @@ class CollapsibleDirectory(ft.Column):
             # left=14 бута самата линия да се падне точно под центъра на стрелката
             margin=ft.padding.only(left=14),  
             # Чертаем вертикалната линия отляво!
-            border=ft.border.only(left=ft.border.BorderSide(1, "#252833")) 
+            border=ft.border.only(left=ft.border.BorderSide(1, TREE_LINE_COLOR)) 
         )
 
         row_controls = [self.icon_btn]
@@ -45,10 +108,13 @@ class CollapsibleDirectory(ft.Column):
             animate=ft.animation.Animation(150, "easeOut")
         )
 
-        self.controls = [
-            folder_row,
-            self.files_container
-        ]
+        if self.files_container is None:
+            self.controls = [ft.Row(indent_guides(depth) + [ft.Container(content=folder_row, expand=True)], spacing=0)]
+        else:
+            self.controls = [
+                folder_row,
+                self.files_container
+            ]
 
     def on_folder_hover(self, e, container):
         # Същият мек цвят като при файловете
@@ -57,10 +123,11 @@ class CollapsibleDirectory(ft.Column):
 
     def toggle_expand(self, e):
         self.is_expanded = not self.is_expanded
-        self.files_container.visible = self.is_expanded
+        if self.files_container is not None:
+            self.files_container.visible = self.is_expanded
         self.icon_btn.icon = ft.icons.KEYBOARD_ARROW_DOWN if self.is_expanded else ft.icons.KEYBOARD_ARROW_RIGHT
+        self.update()
         
+        # В плосък режим callback-ът прерисува списъка, затова се вика след update()
         if self.on_toggle_expand:
-            self.on_toggle_expand(self.is_expanded)
-            
-        self.update()
\ No newline at end of file
+            self.on_toggle_expand(self.is_expanded)
\ No newline at end of file
@@ -1,15 +1,396 @@
 import os
 import re
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 
-MAX_UI_FILES = 1000
+TREE_ROW_HEIGHT = 36  # фиксирана височина на ред във виртуализирания изглед (px)
+SCAN_MAX_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+WATCH_COALESCE_DELAY = 0.5  # секунди за събиране на събития от файловата система в една порция
+SCAN_REFRESH_INTERVAL = 0.3  # секунди между прерисуванията на дървото по време на сканиране
+SCAN_TIME_BUDGET = None  # секунди за едно сканиране от UI; None = без лимит
+SCAN_FILE_BUDGET = None  # най-много съвпадения от едно сканиране от UI; None = без лимит
+SCAN_CANCEL_CHECK = 4096  # записи от една папка между проверките за отказ
+SCAN_PREFETCH_PER_WORKER = 4  # папки, listing-нати напред (още неподадени) на работна нишка при паралелното обхождане
+SEARCH_DEBOUNCE_DELAY = 0.15  # секунди без нов символ преди търсенето да се приложи
+PROFILE_LOG_THRESHOLD = 0.05  # прерисувания под толкова секунди не се пишат в app.log
+COPY_SMALL_WORKERS = min(16, (os.cpu_count() or 1) * 2)  # малките файлове са доминирани от латентност (open/stat/close)
+COPY_LARGE_WORKERS = 2  # големите са ограничени от диска - повече паралелни потоци само разбъркват четенето
+COPY_LARGE_FILE_SIZE = 8 * 1024 * 1024  # от този размер нагоре файлът е "голям"
+COPY_BUFFER_SIZE = 1024 * 1024  # буфер при копиране в userspace (последният резервен механизъм)
+COPY_KERNEL_CHUNK = 16 * 1024 * 1024  # порция за copy_file_range/sendfile - между порциите има прогрес и отказ
+DELETE_MAX_WORKERS = min(16, (os.cpu_count() or 1) * 2)  # триенето е чиста работа с метаданни
+PROGRESS_INTERVAL = 0.2  # секунди между събитията за прогрес при масови операции
+TABLE_COMPACT_MIN = 10_000  # изтрити редове във FileTable, под които не се компактира (и докато са по-малко от живите)
+CACHE_DIR = os.path.join(os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'smart_manager')
 SYSTEM_PATHS = ['/bin', '/boot', '/etc', '/lib', '/opt', '/sbin', '/sys', '/usr', '/var', 'c:\\windows', 'c:\\program files']
 SYSTEM_EXTS = ['.sys', '.dll', '.so', '.exe', '.sh', '.bin']
 
+# Битове във FileTable.flags
+FLAG_SYS = 1
+FLAG_DELETED = 2
+FLAG_SELECTED = 4
+
 class TreeNode:
-    def __init__(self, name):
+    __slots__ = ("name", "parent", "path", "files", "children", "version", "file_count", "total_size", "sys_count", "selected_count")
+
+    def __init__(self, name, parent=None, path=None):
         self.name = name
-        self.files = []      
+        self.parent = parent
+        # Пълен път се пази само за папките - файловете пазят само името си във FileTable
+        self.path = path if path is not None else (os.path.join(parent.path, name) if parent is not None else name)
+        self.files = {}      # име -> id във FileTable
         self.children = {}   
+        self.version = 0     # расте при всяка промяна в files/children - за кешираните подредби
+        # Агрегати за цялото поддърво - поддържат се инкрементално от bump()
+        self.file_count = 0
+        self.total_size = 0
+        self.sys_count = 0
+        self.selected_count = 0
+
+    def get_or_create(self, parts):
+        node = self
+        for part in parts:
+            if part not in node.children:
+                node.children[part] = TreeNode(part, node)
+                node.version += 1
+            node = node.children[part]
+        return node
+
+    def bump(self, files=0, size=0, sys=0, selected=0):
+        # Отразява промяна в тази папка във всички нейни предци - O(дълбочина)
+        node = self
+        while node is not None:
+            node.file_count += files
+            node.total_size += size
+            node.sys_count += sys
+            node.selected_count += selected
+            node = node.parent
+
+    def iter_file_ids(self):
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield from node.files.values()
+            stack.extend(node.children.values())
+
+class FileTable:
+    """Колонно хранилище на файловете, адресирани с цяло число (id).
+
+    Името е единственият низ за файл - пълният път се сглобява от пътя на папката (TreeNode).
+    Размерите и mtime са в array колони, а системен/изтрит/маркиран са битове в един bytearray.
+    Итерира и индексира като стария matched_files: (път, размер, дата, системен).
+    Изтритите id-та остават като празни редове, докато FileStore не компактира таблицата
+    (нова таблица с нови id-та); version расте при всяка промяна по редовете.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.nodes = []
+        self.sizes = array('q')
+        self.mtimes = array('d')
+        self.flags = bytearray()
+        self.live = 0
+        self.version = 0
+
+    def add(self, node, name, size, mtime, is_sys):
+        file_id = len(self.names)
+        self.names.append(name)
+        self.nodes.append(node)
+        self.sizes.append(size)
+        self.mtimes.append(mtime)
+        self.flags.append(FLAG_SYS if is_sys else 0)
+        node.files[name] = file_id
+        node.version += 1
+        self.live += 1
+        self.version += 1
+        return file_id
+
+    def update(self, file_id, size, mtime, is_sys):
+        # Същият файл с нови метаданни - id-то (и маркирането) се запазва, без нов ред
+        self.sizes[file_id] = size
+        self.mtimes[file_id] = mtime
+        self.flags[file_id] = (self.flags[file_id] & ~FLAG_SYS) | (FLAG_SYS if is_sys else 0)
+        self.nodes[file_id].version += 1
+        self.version += 1
+
+    def remove(self, file_id):
+        node = self.nodes[file_id]
+        del node.files[self.names[file_id]]
+        node.version += 1
+        self.flags[file_id] |= FLAG_DELETED
+        self.nodes[file_id] = None
+        self.names[file_id] = None
+        self.live -= 1
+        self.version += 1
+
+    @property
+    def tombstones(self): return len(self.names) - self.live
+
+    def compacted(self):
+        # Нова таблица само с живите редове, в същия ред; node.files се пренасочват към новите id-та
+        table = FileTable()
+        touched = set()
+        for old_id in self.ids():
+            node, name = self.nodes[old_id], self.names[old_id]
+            node.files[name] = len(table.names)
+            touched.add(node)
+            table.names.append(name)
+            table.nodes.append(node)
+            table.sizes.append(self.sizes[old_id])
+            table.mtimes.append(self.mtimes[old_id])
+            table.flags.append(self.flags[old_id])
+        for node in touched: node.version += 1
+        table.live = len(table.names)
+        return table
+
+    def ids(self):
+        return (i for i, f in enumerate(self.flags) if not f & FLAG_DELETED)
+
+    def path(self, file_id):
+        if self.flags[file_id] & FLAG_DELETED: raise KeyError(file_id)
+        return os.path.join(self.nodes[file_id].path, self.names[file_id])
+
+    def is_sys(self, file_id): return bool(self.flags[file_id] & FLAG_SYS)
+    def is_selected(self, file_id): return bool(self.flags[file_id] & FLAG_SELECTED)
+
+    def record(self, file_id):
+        # (път, размер, дата, системен) - формата на matched_files
+        return (self.path(file_id), self.sizes[file_id], datetime.fromtimestamp(self.mtimes[file_id]), self.is_sys(file_id))
+
+    def entry(self, file_id):
+        # (име, път, размер, дата, системен) - формата, която UI редовете очакват
+        return (self.names[file_id],) + self.record(file_id)
+
+    def __len__(self): return self.live
+    def __iter__(self): return (self.record(i) for i in list(self.ids()))
+    def __getitem__(self, file_id): return self.record(file_id)
+
+class FileStore:
+    """Централно хранилище за намерените файлове: дървото от папки + FileTable.
+
+    Път се намира през дървото (O(дълбочина)), а премахването е O(1) - записът само се маркира
+    като изтрит. Маркирането също минава оттук, за да се поддържа selected_count в агрегатите.
+    Повторно добавяне на същия файл обновява реда му на място; натрупаните изтрити редове се
+    махат с maybe_compact(), което подменя таблицата - както ново сканиране, старите id-та отпадат.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.table = FileTable()
+
+    def reset(self, target_folder):
+        self.root = TreeNode("root", path=os.path.normpath(os.path.abspath(target_folder)))
+        self.table = FileTable()
+
+    def __len__(self): return len(self.table)
+    def __iter__(self): return iter(self.table)
+    def __contains__(self, path): return self.lookup(path) is not None
+
+    @property
+    def total_size(self): return self.root.total_size if self.root else 0
+
+    @property
+    def has_system_files(self): return bool(self.root and self.root.sys_count > 0)
+
+    @property
+    def selected_count(self): return self.root.selected_count if self.root else 0
+
+    def lookup(self, path):
+        # id на файла по пълен път или None. relpath + спускане по дървото - O(дълбочина), не O(1)
+        if self.root is None: return None
+        try: parts = os.path.relpath(path, self.root.path).split(os.sep)
+        except ValueError: return None  # друг диск на Windows - не е под корена
+        node = self.root
+        for part in parts[:-1]:
+            node = node.children.get(part)
+            if node is None: return None
+        return node.files.get(parts[-1])
+
+    def add_batch(self, parts, files):
+        # Порция от iter_scan_directory: (части на папката, [(име, размер, mtime, системен)]).
+        # Агрегатите по веригата на предците се вдигат веднъж за порцията, а не за всеки файл.
+        node = self.root.get_or_create(parts)
+        count, total, sys_count = 0, 0, 0
+        for name, size, mtime, is_sys in files:
+            old_id = node.files.get(name)
+            if old_id is not None:
+                self.update_id(old_id, size, mtime, is_sys)
+                continue
+            self.table.add(node, name, size, mtime, is_sys)
+            count += 1
+            total += size
+            if is_sys: sys_count += 1
+        if count: node.bump(count, total, sys_count)
+        return node
+
+    def add(self, node, rec):
+        name, size, mtime, is_sys = rec
+        old_id = node.files.get(name)
+        if old_id is not None:
+            self.update_id(old_id, size, mtime, is_sys)
+            return old_id
+        file_id = self.table.add(node, name, size, mtime, is_sys)
+        node.bump(1, size, 1 if is_sys else 0)
+        return file_id
+
+    def update_id(self, file_id, size, mtime, is_sys):
+        table = self.table
+        was_sys = table.flags[file_id] & FLAG_SYS
+        table.nodes[file_id].bump(size=size - table.sizes[file_id], sys=(1 if is_sys else 0) - was_sys)
+        table.update(file_id, size, mtime, is_sys)
+
+    def maybe_compact(self):
+        # При дълго следене изтритите редове се трупат - компактира се, щом станат повече от живите
+        table = self.table
+        if table.tombstones < max(TABLE_COMPACT_MIN, table.live): return False
+        self.table = table.compacted()
+        return True
+
+    def remove_id(self, file_id):
+        table = self.table
+        flags = table.flags[file_id]
+        table.nodes[file_id].bump(-1, -table.sizes[file_id], -(flags & FLAG_SYS), -1 if flags & FLAG_SELECTED else 0)
+        table.remove(file_id)
+
+    def remove(self, path):
+        file_id = self.lookup(path)
+        if file_id is None: return False
+        self.remove_id(file_id)
+        return True
+
+    def remove_many(self, paths):
+        return [path for path in paths if self.remove(path)]
+
+    def remove_tree(self, parts):
+        # Премахва цяла папка заедно с файловете в нея; връща премахнатите пътища
+        parent = self.root
+        for part in parts[:-1]:
+            parent = parent.children.get(part)
+            if parent is None: return []
+        node = parent.children.pop(parts[-1], None) if parts else None
+        if node is None: return []
+        parent.version += 1
+        parent.bump(-node.file_count, -node.total_size, -node.sys_count, -node.selected_count)
+        node.parent = None
+        removed = []
+        for file_id in list(node.iter_file_ids()):
+            removed.append(self.table.path(file_id))
+            self.table.remove(file_id)
+        return removed
+
+    # --- МАРКИРАНЕ ---
+    def select(self, file_ids):
+        flags = self.table.flags
+        for file_id in file_ids:
+            if not flags[file_id] & (FLAG_SELECTED | FLAG_DELETED):
+                flags[file_id] |= FLAG_SELECTED
+                self.table.nodes[file_id].bump(selected=1)
+
+    def unselect(self, file_ids):
+        flags = self.table.flags
+        for file_id in file_ids:
+            if flags[file_id] & FLAG_SELECTED and not flags[file_id] & FLAG_DELETED:
+                flags[file_id] &= ~FLAG_SELECTED
+                self.table.nodes[file_id].bump(selected=-1)
+
+    def clear_selection(self):
+        self.unselect(self.selected_ids())
+
+    def selected_ids(self):
+        flags = self.table.flags
+        return [i for i in self.table.ids() if flags[i] & FLAG_SELECTED]
+
+    def target_ids(self):
+        # Маркираните файлове, а ако няма маркирани - всички
+        return self.selected_ids() if self.selected_count else list(self.table.ids())
+
+    def paths(self, file_ids):
+        return [self.table.path(i) for i in file_ids]
+
+# Видове редове в плоския (виртуализиран) изглед на дървото
+ROW_DIR, ROW_FILE, ROW_EMPTY = 0, 1, 2
+
+def flatten_tree(root, expanded_dirs, order_dirs, order_files, search_query="", matches=None):
+    # Превръща дървото в плосък списък от редове (вид, дълбочина, обект, път, разгъната).
+    # Обхождат се само разгънатите папки, така че цената е пропорционална на видимите редове.
+    # При търсене всички папки са разгънати, а папка без съвпадения (и без съвпадение в името) се скрива.
+    # matches е {TreeNode: [id, ...]} от индекса за търсене - файловете на другите папки не се пипат.
+    # order_files(node, ids) подрежда ids (или всички файлове на папката, ако ids е None).
+    def visit(node, depth):
+        rows = []
+        for child_name in order_dirs(node):
+            child = node.children[child_name]
+            expanded = bool(search_query) or child.path in expanded_dirs
+            child_rows = visit(child, depth + 1) if expanded else []
+            if search_query and not child_rows and search_query not in child_name.lower():
+                continue
+            rows.append((ROW_DIR, depth, child, child.path, expanded))
+            if expanded:
+                rows.extend(child_rows or [(ROW_EMPTY, depth + 1, None, child.path, False)])
+        if not search_query:
+            file_ids = order_files(node, None)
+        elif node in matches:
+            file_ids = order_files(node, matches[node])
+        else:
+            file_ids = ()
+        for file_id in file_ids:
+            rows.append((ROW_FILE, depth, file_id, None, False))
+        return rows
+    return visit(root, 0)
+
+def walk_dirs(target_folder, list_dir, max_workers=1, cancel=None):
+    # Обхожда дървото top-down (като os.walk). list_dir(път, mtime) връща (данни, подпапки),
+    # където подпапките са (име, път, mtime). Генерира (части спрямо корена, път, mtime, данни).
+    # При cancel.is_set() не се listing-ват нови папки и обхождането свършва.
+    try: root_mtime = os.stat(target_folder).st_mtime
+    except OSError: root_mtime = None
+
+    if max_workers <= 1:
+        stack = [(target_folder, (), root_mtime)]
+        while stack:
+            if cancel is not None and cancel.is_set(): return
+            dir_path, parts, dir_mtime = stack.pop()
+            payload, sub_dirs = list_dir(dir_path, dir_mtime)
+            yield parts, dir_path, dir_mtime, payload
+            for name, sub_path, sub_mtime in reversed(sub_dirs):
+                stack.append((sub_path, parts + (name,), sub_mtime))
+        return
+
+    # --- ПАРАЛЕЛЕН РЕЖИМ ---
+    # Пулът listing-ва папките от върха на стека надолу - точно в реда, в който ще се подадат -
+    # но най-много SCAN_PREFETCH_PER_WORKER на нишка наведнъж. Така буферираните listing-и не
+    # растат с дървото, а стекът пази само пътища (като os.walk).
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scan")
+    limit = max_workers * SCAN_PREFETCH_PER_WORKER
+
+    def task(dir_path, dir_mtime):
+        if cancel is not None and cancel.is_set(): return None  # отказано преди listing
+        return list_dir(dir_path, dir_mtime)
+
+    try:
+        stack = [[target_folder, (), root_mtime, None]]
+        in_flight = 0
+        while stack:
+            # Допълва прозореца: задачите са в горните записи, така че обхождането е O(limit)
+            i = len(stack) - 1
+            while in_flight < limit and i >= 0:
+                entry = stack[i]
+                if entry[3] is None:
+                    entry[3] = pool.submit(task, entry[0], entry[2])
+                    in_flight += 1
+                i -= 1
+            if cancel is not None and cancel.is_set(): return
+            dir_path, parts, dir_mtime, future = stack.pop()
+            result = future.result()
+            in_flight -= 1
+            if result is None: return
+            payload, sub_dirs = result
+            yield parts, dir_path, dir_mtime, payload
+            for name, sub_path, sub_mtime in reversed(sub_dirs):
+                stack.append([sub_path, parts + (name,), sub_mtime, None])
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
 
 def natural_sort_key(s):
     return [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', s)]
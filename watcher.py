@@ -0,0 +1,131 @@
+import os
+import logging
+import threading
+from operations import iter_scan_directory, match_file
+from scan_rules import ScanRules
+from system_shield import SystemShield
+from utils import WATCH_COALESCE_DELAY
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+    WATCHDOG_AVAILABLE = False
+
+def apply_changes(store, target_folder, upserts, removed):
+    # Прилага промените на място върху FileStore (дървото и записите).
+    # upserts: [(части на папката, (име, размер, mtime, системен) или None само за папката)];
+    # removed: абсолютни пътища на файлове или цели папки.
+    # Връща множеството от премахнати пътища (за да се махнат и от selected_files).
+    # Накрая таблицата може да се компактира (store.maybe_compact) - старите id-та тогава отпадат.
+    dropped = set()
+    for path in removed:
+        if store.remove(path): dropped.add(path)
+        else: dropped.update(store.remove_tree(tuple(os.path.relpath(path, target_folder).split(os.sep))))
+
+    for parts, rec in upserts:
+        node = store.root.get_or_create(parts)
+        if rec:
+            store.add(node, rec)
+            dropped.discard(os.path.join(node.path, rec[0]))
+    store.maybe_compact()
+    return dropped
+
+class TreeWatcher(FileSystemEventHandler):
+    """Следи сканираната папка (inotify през watchdog) и подава промените на порции.
+
+    Събитията само маркират пътища; след WATCH_COALESCE_DELAY секунди всеки маркиран път
+    се проверява наново на диска, така че поредица create/modify/delete за един файл
+    се свежда до една промяна.
+    """
+
+    def __init__(self, target_folder, start_date, end_date, valid_exts, on_changes, delay=WATCH_COALESCE_DELAY, exclude=()):
+        super().__init__()
+        self.target_folder = os.path.normpath(os.path.abspath(target_folder))
+        self.start_date, self.end_date = start_date, end_date
+        self.start_ts, self.end_ts = start_date.timestamp(), end_date.timestamp()
+        self.valid_exts = tuple(valid_exts) if valid_exts else ()
+        self.exclude = tuple(exclude)
+        self.rules = ScanRules(self.valid_exts, self.exclude)
+        self.shield = SystemShield()
+        self.on_changes = on_changes
+        self.delay = delay
+        self._pending = {}  # път -> True ако е нова папка, чието поддърво трябва да се сканира
+        self._lock = threading.Lock()
+        self._timer = None
+        self._observer = None
+
+    def start(self):
+        if not WATCHDOG_AVAILABLE:
+            logging.warning("watchdog не е инсталиран - следенето на промени е изключено.")
+            return False
+        self._observer = Observer()
+        self._observer.schedule(self, self.target_folder, recursive=True)
+        self._observer.daemon = True
+        self._observer.start()
+        return True
+
+    def stop(self):
+        if self._observer:
+            self._observer.stop()
+            self._observer.join(timeout=2)
+            self._observer = None
+        with self._lock:
+            if self._timer: self._timer.cancel()
+            self._timer = None
+            self._pending.clear()
+
+    def on_any_event(self, event):
+        if event.event_type in ("opened", "closed"): return
+        # Промяна по самата папка (нов/изтрит файл в нея) идва и като отделно събитие за файла
+        if event.is_directory and event.event_type == "modified": return
+
+        src_path = os.path.normpath(os.fsdecode(event.src_path))
+        with self._lock:
+            self._pending[src_path] = self._pending.get(src_path, False) or (event.is_directory and event.event_type == "created")
+            if event.event_type == "moved":
+                dest_path = os.path.normpath(os.fsdecode(event.dest_path))
+                self._pending[dest_path] = self._pending.get(dest_path, False) or event.is_directory
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._timer = None
+        if not pending: return
+        try:
+            upserts, removed = self.collect_changes(pending)
+            if upserts or removed: self.on_changes(upserts, removed)
+        except Exception as e:
+            logging.error(f"Грешка при обработка на промени в {self.target_folder}: {e}")
+
+    def collect_changes(self, pending):
+        upserts, removed = [], set()
+        prefix = self.target_folder + os.sep
+        for path, is_new_dir in sorted(pending.items()):
+            if not path.startswith(prefix): continue
+            parts = tuple(os.path.relpath(path, self.target_folder).split(os.sep))
+
+            if self.rules.skip_path(parts[:-1]): continue  # под изключена папка - не е в дървото
+            if not os.path.lexists(path):
+                removed.add(path)
+            elif os.path.isdir(path):
+                # Нова или преместена папка - сканираме само нейното поддърво (symlink-ове не се обхождат)
+                if is_new_dir and not os.path.islink(path) and not self.rules.skip_path(parts):
+                    removed.add(path)
+                    for sub_parts, files in iter_scan_directory(path, self.start_date, self.end_date, list(self.valid_exts),
+                                                                exclude=self.exclude, rel_base="".join(p + "/" for p in parts),
+                                                                shield=self.shield):
+                        upserts.append((parts + sub_parts, None))
+                        upserts.extend((parts + sub_parts, rec) for rec in files)
+            else:
+                rec = match_file(path, self.start_ts, self.end_ts, self.rules, parts, self.shield)
+                if rec: upserts.append((parts[:-1], rec))
+                else: removed.add(path)
+        return upserts, removed